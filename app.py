@@ -1,23 +1,113 @@
 # app.py
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, session, g
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
+import atexit
+import os
+import archive
+import backup
 import database
+import import_jobs
+import live_events
+import print_spooler
 import printer_handler
+import write_queue
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'  # Change this!
 
-# Create connection once
-db_con = database.create_connection()
-db_cur = database.create_cursor(db_con)
-database.init_database(db_cur)
-database.save_data(db_con)
+# Each request checks out its own connection from the pool
+db_pool = database.ConnectionPool()
+with db_pool.connection() as con:
+    database.init_database(database.create_cursor(con))
+    database.save_data(con)
+
+# Pass changes pushed to kiosks and admin tabs over /api/stream
+live_broker = live_events.EventBroker()
+
+# `python app.py` serves with debug=True, whose reloader keeps a parent
+# process that only watches the source files and serves from a child it
+# starts with WERKZEUG_RUN_MAIN=true. The background workers run in the
+# serving process alone; otherwise both would print the queued slips and
+# rotate the same backups.
+DEBUG = True
+IS_RELOADER_WATCHER = __name__ == '__main__' and DEBUG and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+db_writer = slip_spooler = backup_scheduler = None
+
+def stop_background_workers() -> None:
+    """Let the workers finish their current job; unprinted slips stay queued for the next start."""
+    if backup_scheduler is not None:
+        backup_scheduler.set()
+    if slip_spooler is not None:
+        slip_spooler.close()
+        # Free the USB handles for the next process (e.g. after a reload)
+        printer_handler.printer.close()
+    if db_writer is not None:
+        db_writer.close()
+
+if not IS_RELOADER_WATCHER:
+    # Kiosk pass writes are group-committed by a single writer thread
+    db_writer = write_queue.WriteQueue(db_pool)
+    
+    # Slips are printed in the background so a slow printer never holds up a scan
+    # (one worker per printer, routed by kiosk; see printer_handler.PRINTERS)
+    slip_spooler = print_spooler.PrintSpooler(db_pool, db_writer, {
+        'pass_slip': printer_handler.print_pass_slip,
+        'student_report': printer_handler.print_student_report,
+    }, workers=len(printer_handler.printer.connections))
+    
+    # Hourly online backups into backups/ (see backup.BACKUP_INTERVAL_SECONDS)
+    backup_scheduler = backup.start_scheduler(db_pool.db_path)
+    atexit.register(stop_background_workers)
 
 # Admin credentials
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "password123"
 
+# Admin API page sizes
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Passes listed on a printed student report, newest first
+REPORT_MAX_PASSES = 30
+
+@app.template_filter('timestamp')
+def timestamp_filter(epoch_seconds):
+    return database.format_timestamp(epoch_seconds)
+
+def get_db():
+    """Get this request's pooled connection, checking one out on first use."""
+    if 'db_con' not in g:
+        g.db_con = db_pool.acquire()
+    return g.db_con
+
+def get_snapshot():
+    """
+    Get the read-only snapshot for admin and reporting reads, so they never
+    touch the connections the kiosks write through. It may be up to
+    database.SNAPSHOT_MAX_AGE_SECONDS behind.
+    """
+    if 'snapshot_con' not in g:
+        g.snapshot_con = db_pool.snapshot.acquire()
+    return g.snapshot_con
+
+@app.teardown_appcontext
+def release_db(exception):
+    con = g.pop('db_con', None)
+    if con is not None:
+        db_pool.release(con)
+    snapshot_con = g.pop('snapshot_con', None)
+    if snapshot_con is not None:
+        db_pool.snapshot.release(snapshot_con)
+
+@app.after_request
+def refresh_snapshot_after_admin_write(response):
+    # Let the admin see their own change on the next read
+    if request.method == 'POST' and request.path.startswith('/admin'):
+        db_pool.snapshot.invalidate()
+    return response
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -37,31 +127,22 @@ def start_pass():
     if not student_id:
         return jsonify({'success': False, 'message': 'Please enter a Student ID'})
     
-    # Create new cursor for this request
-    cur = database.create_cursor(db_con)
-    student = database.get_student_by_id(cur, student_id)
-    
-    if not student:
-        return jsonify({'success': False, 'message': f'Student ID {student_id} not found in system'})
-    
-    pass_id, error = database.create_pass_now(cur, student_id)
+    # Validate, check capacity and insert in one operation on the writer thread
+    new_pass, error = db_writer.run(
+        database.start_pass_for_student, student_id, db_pool.active_passes, db_pool.settings,
+        students=db_pool.students, after_commit=lambda outcome: publish_started(outcome[0])
+    )
     
     if error:
         return jsonify({'success': False, 'message': error})
     
-    database.save_data(db_con)
-    
-    try:
-        printer_handler.print_pass_slip(
-            student_name=student['Name'],
-            student_id=student_id,
-            pass_id=pass_id,
-            duration_minutes=10
-        )
-    except Exception as e:
-        print(f"[WARN] Printer error: {e}")
+    print_job_id = print_slip(new_pass, request.form.get('kiosk'))
     
-    return jsonify({'success': True, 'message': f'{student["Name"]} signed out successfully!'})
+    return jsonify({
+        'success': True,
+        'message': f'{new_pass["Name"]} signed out successfully!',
+        'print_job_id': print_job_id
+    })
 
 @app.route('/return_by_student_id', methods=['POST'])
 def return_by_student_id():
@@ -70,56 +151,273 @@ def return_by_student_id():
     if not student_id:
         return jsonify({'success': False, 'message': 'Please enter a Student ID'})
     
-    # Create new cursor for this request
-    cur = database.create_cursor(db_con)
-    student = database.get_student_by_id(cur, student_id)
+    student = db_pool.students.get(student_id)
     
     if not student:
         return jsonify({'success': False, 'message': f'Student ID {student_id} not found'})
     
-    result = database.return_active_pass_for_student(cur, student_id)
+    result = db_writer.run(database.return_active_pass_for_student, student_id, db_pool.active_passes,
+                           after_commit=publish_returned)
     
     if result is None:
-        return jsonify({'success': False, 'message': f'{student["Name"]} has no active pass'})
+        return jsonify({'success': False, 'message': f'{student.name} has no active pass'})
     
-    database.save_data(db_con)
-    return jsonify({'success': True, 'message': f'{student["Name"]} signed in successfully!'})
+    return jsonify({'success': True, 'message': f'{student.name} signed in successfully!'})
 
-@app.route('/api/active_passes')
-def get_active_passes_api():
-    # Create new cursor for this request
-    cur = database.create_cursor(db_con)
-    active_passes = database.get_active_passes(cur)
-    
-    passes_with_time = []
-    now = datetime.now()
-    
-    for p in active_passes:
-        start_time = datetime.fromisoformat(p['pass_taken_at'])
-        elapsed_seconds = int((now - start_time).total_seconds())
-        duration_seconds = p['duration_minutes'] * 60
-        time_remaining = duration_seconds - elapsed_seconds
-        
-        passes_with_time.append({
-            'pass_id': p['pass_id'],
-            'student_id': p['student_id'],
-            'full_name': f"{p['first_name']} {p['last_name']}",
-            'time_remaining': time_remaining
-        })
+@app.route('/api/scan', methods=['POST'])
+def scan():
+    """
+    One kiosk scan: signs the student in if they are out, otherwise out.
+    The decision and the write are one operation on the writer thread, so
+    two kiosks scanning the same student cannot both act on a stale list.
+    """
+    student_id = request.form.get('student_id', '').strip()
+    
+    if not student_id:
+        return jsonify({'success': False, 'message': 'Please enter a Student ID'})
     
-    # Get capacity info
-    max_students = int(database.get_setting(cur, 'max_students_out', '10'))
-    capacity_enabled = database.get_setting(cur, 'enable_capacity_limit', '1') == '1'
+    print_job_id = None
+    action, result, error = db_writer.run(
+        database.toggle_pass_for_student, student_id, db_pool.active_passes, db_pool.settings,
+        students=db_pool.students, after_commit=publish_scan
+    )
     
+    if error:
+        return jsonify({'success': False, 'message': error})
+    
+    if action == 'started':
+        print_job_id = print_slip(result, request.form.get('kiosk'))
+        message = f'{result["Name"]} signed out successfully!'
+    else:
+        student = db_pool.students.get(student_id)
+        message = f'{student.name if student else student_id} signed in successfully!'
+    
+    cur = database.create_cursor(get_db())
     return jsonify({
-        'passes': passes_with_time,
-        'capacity': {
-            'current': len(active_passes),
-            'max': max_students,
-            'enabled': capacity_enabled
-        }
+        'success': True,
+        'action': action,
+        'message': message,
+        'pass_id': result['pass_id'],
+        'capacity': kiosk_capacity(database.get_active_pass_count(cur)),
+        'print_job_id': print_job_id
     })
 
+def print_slip(new_pass: dict, kiosk: str = None) -> int | None:
+    """Queue the pass slip for the kiosk's printers; returns the print job ID (None if it could not be queued)."""
+    try:
+        return slip_spooler.submit('pass_slip', {
+            'student_name': new_pass['Name'],
+            'student_id': new_pass['student_id'],
+            'pass_id': new_pass['pass_id'],
+            'duration_minutes': new_pass['duration_minutes'],
+            'taken_at': new_pass['pass_taken_at'],
+            'barcode_mode': db_pool.settings.get('barcode_mode'),
+            'kiosk': kiosk or None
+        })
+    except Exception as e:
+        print(f"[WARN] Could not queue pass slip: {e}")
+        return None
+
+@app.route('/api/print_jobs/<int:job_id>')
+def print_job_status(job_id):
+    job = slip_spooler.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Print job not found'}), 404
+    return jsonify({
+        'success': True,
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'last_error': job['last_error'],
+        'created_at': job['created_at'],
+        'printed_at': job['printed_at']
+    })
+
+@app.route('/admin/printer/reconnect', methods=['POST'])
+@login_required
+def reconnect_printer():
+    # Skip the rest of an "absent" cool-down, e.g. right after plugging the printer back in
+    printer_handler.printer.reset()
+    return jsonify({'success': True, 'message': 'Printer will reconnect on the next slip'})
+
+@app.route('/admin/print_jobs/<int:job_id>/reprint', methods=['POST'])
+@login_required
+def reprint_job(job_id):
+    new_job_id = slip_spooler.reprint(job_id)
+    if new_job_id is None:
+        return jsonify({'success': False, 'message': 'Print job not found'}), 404
+    return jsonify({'success': True, 'message': f'Reprint queued (job {new_job_id})', 'print_job_id': new_job_id})
+
+def kiosk_pass(p: dict) -> dict:
+    # Absolute times only, so the payload stays valid until the pass set
+    # changes; the kiosk counts down from due_at itself
+    return {
+        'pass_id': p['pass_id'],
+        'student_id': p['student_id'],
+        'full_name': p['full_name'],
+        'pass_taken_at': p['pass_taken_at'],
+        'due_at': p['due_at']
+    }
+
+def kiosk_capacity(current: int) -> dict:
+    # From the settings cache; update_setting invalidates it before the
+    # capacity_changed event, so the new version carries the new limit
+    return {
+        'current': current,
+        'max': db_pool.settings.get('max_students_out', 10),
+        'enabled': db_pool.settings.get('enable_capacity_limit', True)
+    }
+
+@app.route('/api/active_passes')
+def get_active_passes_api():
+    """
+    The kiosk's list of students out. The list carries a version (also
+    sent as a weak ETag) that changes only when it does: a matching
+    If-None-Match gets 304, and ?since=<version> returns only the passes
+    started or returned after that version. The server clock is sent in the
+    X-Server-Time header, so the body itself only changes with the version.
+    """
+    cur = database.create_cursor(get_db())
+    # Read the version first, so the data read after it is never older
+    version = database.get_active_passes_version(cur)
+    since = request.args.get('since', type=int)
+    
+    if since is not None:
+        if since == version:
+            response = jsonify({'version': version, 'delta': True, 'passes': [], 'removed': []})
+        else:
+            changes = database.get_active_pass_changes(cur, since)
+            response = None
+            if changes is not None:
+                changed, removed = changes
+                response = jsonify({
+                    'version': version,
+                    'delta': True,
+                    'passes': [kiosk_pass(p) for p in changed],
+                    'removed': removed,
+                    'capacity': kiosk_capacity(database.get_active_pass_count(cur))
+                })
+    elif request.if_none_match.contains_weak(str(version)):
+        response = app.response_class(status=304)
+    else:
+        response = None
+    
+    if response is None:
+        active_passes = database.get_active_passes(cur)
+        response = jsonify({
+            'version': version,
+            'delta': False,
+            'passes': [kiosk_pass(p) for p in active_passes],
+            'capacity': kiosk_capacity(len(active_passes))
+        })
+    if since is None:
+        response.set_etag(str(version), weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Server-Time'] = str(database.now_epoch())
+    return response
+
+# Live events are published from db_writer after_commit callbacks: they run
+# on the writer thread in commit order, so a client never receives a version
+# before an older one it might then skip on reconnect.
+
+def publish_pass_change(event: str, data: dict, version: int) -> None:
+    """Push a committed change to the live streams, tagged with the list version it produced."""
+    if not live_broker.has_subscribers:
+        return
+    with db_pool.connection() as con:
+        current = db_pool.active_passes.peek(database.create_cursor(con))
+    data['capacity'] = kiosk_capacity(current)
+    data['server_time'] = database.now_epoch()
+    live_broker.publish(event, data, version)
+
+def publish_started(new_pass: dict | None) -> None:
+    if new_pass:
+        publish_pass_change('pass_started', {'pass': kiosk_pass(dict(new_pass, full_name=new_pass['Name']))},
+                            new_pass['version'])
+
+def publish_returned(returned: dict | None) -> None:
+    if returned:
+        publish_pass_change('pass_returned', {'pass_id': returned['pass_id'], 'student_id': returned['student_id']},
+                            returned['version'])
+
+def publish_scan(outcome: tuple) -> None:
+    action, result, _ = outcome
+    if action == 'started':
+        publish_started(result)
+    elif action == 'returned':
+        publish_returned(result)
+
+def change_setting(cursor, setting_key: str, setting_value: str) -> tuple[bool, int]:
+    """Writer operation: updates a setting; returns whether it exists and the list version after the change."""
+    return database.update_setting(cursor, setting_key, setting_value), database.get_active_passes_version(cursor)
+
+def publish_setting_change(setting_key: str, updated: bool, version: int) -> None:
+    db_pool.settings.invalidate()
+    if updated and setting_key in ('max_students_out', 'enable_capacity_limit'):
+        publish_pass_change('capacity_changed', {}, version)
+
+def publish_snapshot() -> None:
+    """
+    Push the whole active pass list, after a change that is not a single
+    start or return (deleted students, a rebuild, a roster import). The list
+    is read on the writer, so it can run outside a request.
+    """
+    if not live_broker.has_subscribers:
+        return
+
+    def read_list(cursor):
+        return database.get_active_passes_version(cursor), database.get_active_passes(cursor)
+
+    def publish(state):
+        version, active_passes = state
+        live_broker.publish('snapshot', {
+            'passes': [kiosk_pass(p) for p in active_passes],
+            'capacity': kiosk_capacity(len(active_passes)),
+            'server_time': database.now_epoch()
+        }, version)
+
+    db_writer.run(read_list, after_commit=publish)
+
+@app.route('/api/stream')
+def stream_api():
+    """
+    Server-Sent Events: pass_started, pass_returned and capacity_changed.
+    A new client gets a snapshot event first; a reconnecting client gets the
+    changes since its Last-Event-ID replayed (or a snapshot if that is too old).
+    """
+    subscription = live_broker.subscribe()
+    if subscription is None:
+        return jsonify({'success': False, 'message': 'Too many live connections'}), 503
+    
+    try:
+        cur = database.create_cursor(get_db())
+        # Subscribed before reading, so nothing committed from here on is missed
+        version = database.get_active_passes_version(cur)
+        now = database.now_epoch()
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        changes = database.get_active_pass_changes(cur, last_event_id) if last_event_id is not None else None
+        capacity = kiosk_capacity(database.get_active_pass_count(cur))
+        
+        if changes is None:
+            passes = [kiosk_pass(p) for p in database.get_active_passes(cur)]
+            initial = [live_events.format_event(
+                'snapshot', {'passes': passes, 'capacity': capacity, 'server_time': now}, version)]
+        else:
+            changed, removed = changes
+            initial = [live_events.format_event('pass_started', {'pass': kiosk_pass(p), 'server_time': now})
+                       for p in changed]
+            initial += [live_events.format_event('pass_returned', {'pass_id': pass_id}) for pass_id in removed]
+            initial.append(live_events.format_event(
+                'capacity_changed', {'capacity': capacity, 'server_time': now}, version))
+    except BaseException:
+        subscription.close()
+        raise
+    
+    response = Response(live_events.stream(subscription, initial, version), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -142,13 +440,89 @@ def logout():
 @app.route('/admin')
 @login_required
 def admin():
-    # Create new cursor for this request
-    cur = database.create_cursor(db_con)
-    students = database.get_all_students(cur)
-    passes = database.get_recent_passes_with_details(cur, limit=100)
+    # Students and passes are loaded page by page from the JSON API
+    cur = database.create_cursor(get_snapshot())
     settings = database.get_all_settings(cur)
     
-    return render_template('admin.html', students=students, passes=passes, settings=settings)
+    return render_template('admin.html', settings=settings)
+
+def get_page_args(cursor_size: int) -> tuple[int, tuple | None]:
+    """Read ?limit= and ?cursor= for a paginated API. Raises ValueError on bad input."""
+    limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    page_cursor = request.args.get('cursor', '').strip()
+    after = database.decode_page_cursor(page_cursor, cursor_size) if page_cursor else None
+    return limit, after
+
+def parse_date_arg(name: str, next_day: bool = False) -> int | None:
+    """Read a YYYY-MM-DD query argument as local-midnight epoch seconds."""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    day = datetime.strptime(value, '%Y-%m-%d')
+    if next_day:
+        day += timedelta(days=1)
+    return int(day.timestamp())
+
+@app.route('/admin/api/passes')
+@login_required
+def admin_passes_api():
+    try:
+        limit, after = get_page_args(2)
+        taken_from = parse_date_arg('from')
+        taken_before = parse_date_arg('to', next_day=True)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid query: {e}'}), 400
+    
+    status = request.args.get('status', 'all')
+    if status not in ('all', 'active', 'completed'):
+        return jsonify({'success': False, 'message': 'Invalid status filter'}), 400
+    
+    filters = {
+        'student_id': request.args.get('student_id', '').strip() or None,
+        'taken_from': taken_from,
+        'taken_before': taken_before,
+        'search': request.args.get('q', '').strip() or None,
+    }
+    if request.args.get('archived') == '1':
+        # Older terms live in archive files; attach them read-only for this request
+        with archive.history_connection(db_pool.db_path) as history:
+            passes, next_key = database.search_passes(
+                history, limit, after, status, source=archive.PASS_SOURCE_HISTORY, **filters
+            )
+    else:
+        cur = database.create_cursor(get_snapshot())
+        passes, next_key = database.search_passes(cur, limit, after, status, **filters)
+    
+    for p in passes:
+        p['time_out_display'] = database.format_timestamp(p['pass_taken_at'])
+        p['time_in_display'] = database.format_timestamp(p['return_time']) if p['returned'] else '-'
+    
+    return jsonify({
+        'success': True,
+        'passes': passes,
+        'next_cursor': database.encode_page_cursor(next_key) if next_key else None,
+        'snapshot_age': round(db_pool.snapshot.age(), 1)
+    })
+
+@app.route('/admin/api/students')
+@login_required
+def admin_students_api():
+    try:
+        limit, after = get_page_args(3)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid query: {e}'}), 400
+    
+    cur = database.create_cursor(get_snapshot())
+    students, next_key = database.search_students(
+        cur, limit, after, search=request.args.get('q', '').strip() or None
+    )
+    
+    return jsonify({
+        'success': True,
+        'students': students,
+        'next_cursor': database.encode_page_cursor(next_key) if next_key else None,
+        'snapshot_age': round(db_pool.snapshot.age(), 1)
+    })
 
 @app.route('/admin/add_student', methods=['POST'])
 @login_required
@@ -160,12 +534,10 @@ def add_student():
     if not all([student_id, first_name, last_name]):
         return jsonify({'success': False, 'message': 'All fields are required'})
     
-    # Create new cursor for this request
-    cur = database.create_cursor(db_con)
-    
     try:
-        database.insert_student(cur, student_id, first_name, last_name)
-        database.save_data(db_con)
+        with db_pool.transaction(get_db()) as cur:
+            database.insert_student(cur, student_id, first_name, last_name)
+        db_pool.students.invalidate()
         return jsonify({'success': True, 'message': f'Added {first_name} {last_name}'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
@@ -178,15 +550,43 @@ def delete_student():
     if not student_id:
         return jsonify({'success': False, 'message': 'Student ID required'})
     
-    # Create new cursor for this request
-    cur = database.create_cursor(db_con)
+    with db_pool.transaction(get_db()) as cur:
+        deleted = database.delete_student_by_id(cur, student_id)
+        # Any open passes of the student went with them
+        db_pool.active_passes.invalidate()
+    db_pool.students.invalidate()
     
-    if database.delete_student_by_id(cur, student_id):
-        database.save_data(db_con)
+    if deleted:
+        publish_snapshot()
         return jsonify({'success': True, 'message': 'Student deleted'})
     else:
         return jsonify({'success': False, 'message': 'Student not found'})
 
+@app.route('/admin/print_student_report', methods=['POST'])
+@login_required
+def print_student_report():
+    student_id = request.form.get('student_id', '').strip()
+    
+    cur = database.create_cursor(get_snapshot())
+    student = database.get_student_by_id(cur, student_id)
+    if not student:
+        return jsonify({'success': False, 'message': 'Student not found'})
+    
+    passes, _ = database.search_passes(cur, limit=REPORT_MAX_PASSES, student_id=student_id)
+    job_id = slip_spooler.submit('student_report', {
+        'student_name': student['Name'],
+        'student_id': student_id,
+        'total_passes': student['Number Of Passes'],
+        'total_time_out': student['Total Time Out'],
+        'overtime_passes': database.get_student_overtime_count(cur, student_id),
+        'passes': [
+            {key: p[key] for key in ('pass_taken_at', 'duration_minutes', 'returned')}
+            for p in passes
+        ],
+        'printed_at': database.now_epoch()
+    })
+    return jsonify({'success': True, 'message': f"Report for {student['Name']} queued for printing", 'print_job_id': job_id})
+
 @app.route('/admin/return_pass', methods=['POST'])
 @login_required
 def admin_return_pass():
@@ -195,12 +595,10 @@ def admin_return_pass():
     if not pass_id:
         return jsonify({'success': False, 'message': 'Pass ID required'})
     
-    # Create new cursor for this request
-    cur = database.create_cursor(db_con)
-    result = database.return_pass_by_id(cur, int(pass_id))
+    result = db_writer.run(database.return_pass_by_id, int(pass_id), db_pool.active_passes,
+                           after_commit=publish_returned)
     
     if result:
-        database.save_data(db_con)
         return jsonify({'success': True, 'message': 'Pass returned'})
     else:
         return jsonify({'success': False, 'message': 'Pass not found or already returned'})
@@ -214,15 +612,124 @@ def update_setting():
     if not setting_key or not setting_value:
         return jsonify({'success': False, 'message': 'Invalid input'})
     
-    # Create new cursor for this request
-    cur = database.create_cursor(db_con)
+    try:
+        database.parse_setting(setting_key, setting_value)
+    except ValueError:
+        return jsonify({'success': False, 'message': f'Invalid value for {setting_key}'})
+    
+    # On the writer, so a capacity_changed event stays in order with the scans
+    updated, _ = db_writer.run(change_setting, setting_key, setting_value,
+                               after_commit=lambda outcome: publish_setting_change(setting_key, *outcome))
     
-    if database.update_setting(cur, setting_key, setting_value):
-        database.save_data(db_con)
+    if updated:
         return jsonify({'success': True, 'message': 'Setting updated'})
     else:
         return jsonify({'success': False, 'message': 'Setting not found'})
 
+@app.route('/admin/db_stats')
+@login_required
+def db_stats():
+    stats = db_pool.get_stats()
+    stats['write_queue'] = db_writer.get_stats()
+    stats['snapshot'] = db_pool.snapshot.get_stats()
+    stats['live_events'] = live_broker.get_stats()
+    stats['print_spooler'] = slip_spooler.get_stats()
+    stats['printers'] = printer_handler.printer.get_stats()
+    return jsonify(stats)
+
+def stats_day_range(days: int) -> tuple[str, str]:
+    """(first_day, today) as YYYY-MM-DD for the last `days` days, including today."""
+    today = datetime.now().date()
+    return (today - timedelta(days=days - 1)).isoformat(), today.isoformat()
+
+@app.route('/admin/api/stats')
+@login_required
+def stats_api():
+    week_start, today = stats_day_range(7)
+    cur = database.create_cursor(get_snapshot())
+    return jsonify({'success': True, 'stats': database.get_stats_summary(cur, today, week_start),
+                    'snapshot_age': round(db_pool.snapshot.age(), 1)})
+
+@app.route('/admin/api/stats/daily')
+@login_required
+def daily_stats_api():
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    first_day, today = stats_day_range(days)
+    cur = database.create_cursor(get_snapshot())
+    return jsonify({'success': True, 'days': database.get_daily_stats(cur, first_day, today),
+                    'snapshot_age': round(db_pool.snapshot.age(), 1)})
+
+@app.route('/admin/api/stats/hourly')
+@login_required
+def hourly_stats_api():
+    cur = database.create_cursor(get_snapshot())
+    return jsonify({'success': True, 'hours': database.get_hourly_stats(cur),
+                    'snapshot_age': round(db_pool.snapshot.age(), 1)})
+
+@app.route('/admin/api/stats/student/<student_id>')
+@login_required
+def student_stats_api(student_id):
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    first_day, today = stats_day_range(days)
+    cur = database.create_cursor(get_snapshot())
+    return jsonify({'success': True, 'stats': database.get_student_stats(cur, student_id, first_day, today),
+                    'snapshot_age': round(db_pool.snapshot.age(), 1)})
+
+@app.route('/admin/rebuild_stats', methods=['POST'])
+@login_required
+def rebuild_stats():
+    with db_pool.transaction(get_db()) as cur:
+        counted = database.rebuild_pass_stats(cur)
+    return jsonify({'success': True, 'message': f'Usage stats rebuilt from {counted} returned passes'})
+
+@app.route('/admin/archive', methods=['POST'])
+@login_required
+def archive_term():
+    term = request.form.get('term', '').strip()
+    before = request.form.get('before', '').strip()
+    try:
+        before_epoch = int(datetime.strptime(before, '%Y-%m-%d').timestamp())
+        # Copying a term's passes, deleting them and vacuuming can outlast a request
+        job = archive.start_archive(db_pool, term, before_epoch)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid archive request: {e}'}), 400
+    
+    return jsonify({'success': True, 'message': 'Archive started', 'job_id': job.job_id})
+
+@app.route('/admin/archive_status/<job_id>')
+@login_required
+def archive_status(job_id):
+    job = archive.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Archive job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/admin/backup', methods=['POST'])
+@login_required
+def backup_now():
+    try:
+        result = backup.backup_database(db_pool.db_path)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Backup failed: {e}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'message': f"Backup saved ({result['bytes']} bytes in {result['seconds']}s)",
+        'sha256': result['sha256']
+    })
+
+@app.route('/admin/check_active_passes', methods=['POST'])
+@login_required
+def check_active_passes():
+    with db_pool.transaction(get_db()) as cur:
+        rebuilt = database.ensure_active_passes_consistent(cur)
+    db_pool.active_passes.invalidate()
+    if rebuilt:
+        publish_snapshot()
+    
+    message = 'Active passes rebuilt from pass history' if rebuilt else 'Active passes are consistent'
+    return jsonify({'success': True, 'message': message, 'rebuilt': rebuilt})
+
 @app.route('/admin/import_csv', methods=['POST'])
 @login_required
 def import_csv():
@@ -237,36 +744,22 @@ def import_csv():
         return jsonify({'success': False, 'message': 'File must be CSV'})
     
     try:
-        import csv
-        content = file.read().decode('utf-8')
-        csv_reader = csv.DictReader(content.splitlines())
-        
-        students_data = []
-        for row in csv_reader:
-            student_id = row.get('student_id', '').strip()
-            first_name = row.get('first_name', '').strip()
-            last_name = row.get('last_name', '').strip()
-            
-            if student_id and first_name and last_name:
-                students_data.append((student_id, first_name, last_name))
-        
-        if not students_data:
-            return jsonify({'success': False, 'message': 'No valid data found in CSV'})
-        
-        # Create new cursor for this request
-        cur = database.create_cursor(db_con)
         update_existing = request.form.get('update_existing') == 'true'
-        summary = database.add_or_update_students_from_csv_data(cur, students_data, update_existing)
-        database.save_data(db_con)
-        
-        message = f"Added: {summary['added']}, Updated: {summary['updated']}, Skipped: {summary['skipped']}"
-        if summary['errors']:
-            message += f", Errors: {len(summary['errors'])}"
-        
-        return jsonify({'success': True, 'message': message, 'summary': summary})
+        # Renamed students may have passes open on the kiosks
+        job = import_jobs.start_import(db_pool, file.stream, file.filename, update_existing,
+                                       on_finish=lambda job: publish_snapshot() if job.updated else None)
+        return jsonify({'success': True, 'message': 'Import started', 'job_id': job.job_id})
     
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error processing file: {str(e)}'})
 
+@app.route('/admin/import_status/<job_id>')
+@login_required
+def import_status(job_id):
+    job = import_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Import job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=DEBUG)
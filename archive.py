@@ -0,0 +1,297 @@
+# archive.py
+"""
+Term archival of pass history.
+Returned passes from before a term boundary are moved out of
+school_passes.db into archives/passes_<term>.db, which carries its own
+copy of the usage rollups and a snapshot of the student names. The live
+database keeps only the current term, so the kiosk tables stay small;
+history_connection() attaches the archives read-only when the admin needs
+older passes. The admin page runs archival as a background job
+(start_archive) and polls its status.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import database
+
+# --- Archive Configuration ---
+ARCHIVE_DIR = "archives"        # next to the live database file
+MAX_ATTACHED_ARCHIVES = 9       # SQLite attaches at most 10 databases by default
+MAX_FINISHED_JOBS = 10          # finished archive jobs remembered for the status endpoint
+# -----------------------------
+
+# Names are kept in the archive so history stays readable after a roster reset
+ARCHIVE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS archive.archive_info (
+    info_key TEXT PRIMARY KEY,
+    info_value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS archive.students (
+    student_id TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS archive.passes (
+    pass_id INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    pass_taken_at INTEGER NOT NULL,
+    return_time INTEGER,
+    duration_minutes INTEGER NOT NULL,
+    due_at INTEGER NOT NULL,
+    returned INTEGER DEFAULT 1
+);
+
+CREATE INDEX IF NOT EXISTS archive.idx_archive_passes_taken_at ON passes(pass_taken_at);
+CREATE INDEX IF NOT EXISTS archive.idx_archive_passes_student ON passes(student_id, pass_taken_at);
+
+CREATE TABLE IF NOT EXISTS archive.pass_stats_student_day (
+    student_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    passes INTEGER NOT NULL DEFAULT 0,
+    seconds_out INTEGER NOT NULL DEFAULT 0,
+    overtime_passes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS archive.pass_stats_day (
+    day TEXT PRIMARY KEY,
+    passes INTEGER NOT NULL DEFAULT 0,
+    seconds_out INTEGER NOT NULL DEFAULT 0,
+    overtime_passes INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS archive.pass_stats_hour (
+    weekday INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    passes INTEGER NOT NULL DEFAULT 0,
+    seconds_out INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (weekday, hour)
+) WITHOUT ROWID;
+"""
+
+# search_passes source for a history_connection: live and archived passes
+PASS_SOURCE_HISTORY = "pass_history p"
+
+def archive_dir_for(db_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), ARCHIVE_DIR)
+
+def archive_path(db_path: str, term: str) -> str:
+    """The archive file for a term; the name is reduced to letters, digits, - and _."""
+    safe_term = re.sub(r'[^A-Za-z0-9_-]+', '_', term.strip()).strip('_')
+    if not safe_term:
+        raise ValueError("Term name must contain letters or digits")
+    return os.path.join(archive_dir_for(db_path), f"passes_{safe_term}.db")
+
+def archived_before(path: str) -> float:
+    """The term boundary recorded in an archive (epoch seconds), or the file's modification time if it has none."""
+    try:
+        con = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+        try:
+            row = con.execute("SELECT info_value FROM archive_info WHERE info_key = 'archived_before'").fetchone()
+        finally:
+            con.close()
+        if row:
+            return int(row[0])
+    except (sqlite3.Error, ValueError):
+        pass
+    return os.path.getmtime(path)
+
+def list_archives(db_path: str = database.DB_PATH) -> list[str]:
+    """Archive files next to the database, oldest term first (term names need not sort by date)."""
+    directory = archive_dir_for(db_path)
+    if not os.path.isdir(directory):
+        return []
+    paths = [
+        os.path.join(directory, filename) for filename in os.listdir(directory)
+        if filename.startswith("passes_") and filename.endswith(".db")
+    ]
+    return sorted(paths, key=archived_before)
+
+def rebuild_archive_stats(cursor: sqlite3.Cursor) -> None:
+    """Recomputes the attached archive's rollups from its own passes."""
+    day = database.STATS_DAY_SQL.format('pass_taken_at')
+    weekday, hour = database.STATS_WEEKDAY_SQL.format('pass_taken_at'), database.STATS_HOUR_SQL.format('pass_taken_at')
+    cursor.execute("DELETE FROM archive.pass_stats_student_day")
+    cursor.execute("DELETE FROM archive.pass_stats_day")
+    cursor.execute("DELETE FROM archive.pass_stats_hour")
+    cursor.execute(
+        "INSERT INTO archive.pass_stats_student_day (student_id, day, passes, seconds_out, overtime_passes) "
+        f"SELECT student_id, {day}, COUNT(*), SUM(return_time - pass_taken_at), SUM(return_time > due_at) "
+        "FROM archive.passes GROUP BY 1, 2"
+    )
+    cursor.execute(
+        "INSERT INTO archive.pass_stats_day (day, passes, seconds_out, overtime_passes) "
+        "SELECT day, SUM(passes), SUM(seconds_out), SUM(overtime_passes) "
+        "FROM archive.pass_stats_student_day GROUP BY day"
+    )
+    cursor.execute(
+        "INSERT INTO archive.pass_stats_hour (weekday, hour, passes, seconds_out) "
+        f"SELECT {weekday}, {hour}, COUNT(*), SUM(return_time - pass_taken_at) "
+        "FROM archive.passes GROUP BY 1, 2"
+    )
+
+def archive_term(pool: database.ConnectionPool, term: str, before: int) -> dict:
+    """
+    Moves returned passes taken before the epoch `before` into the term's archive.
+    Copying and deleting are separate transactions (SQLite does not commit
+    attached WAL databases atomically), and the delete only removes passes
+    already in the archive, so an interrupted run can simply be repeated.
+    Returns a summary with the archive path and the number of passes moved.
+    """
+    path = archive_path(pool.db_path, term)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with pool.connection() as con:
+        con.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            con.executescript(ARCHIVE_SCHEMA_SQL)
+
+            with pool.transaction(con) as cur:
+                copied = cur.execute(
+                    "INSERT OR IGNORE INTO archive.passes "
+                    "(pass_id, student_id, pass_taken_at, return_time, duration_minutes, due_at, returned) "
+                    "SELECT pass_id, student_id, pass_taken_at, return_time, duration_minutes, due_at, returned "
+                    "FROM main.passes WHERE returned = 1 AND pass_taken_at < ?",
+                    (before,)
+                ).rowcount
+                cur.execute(
+                    "INSERT OR REPLACE INTO archive.students (student_id, first_name, last_name) "
+                    "SELECT student_id, first_name, last_name FROM main.students "
+                    "WHERE student_id IN (SELECT student_id FROM main.passes WHERE returned = 1 AND pass_taken_at < ?)",
+                    (before,)
+                )
+                rebuild_archive_stats(cur)
+                cur.executemany(
+                    "INSERT OR REPLACE INTO archive.archive_info (info_key, info_value) VALUES (?, ?)",
+                    [('term', term), ('archived_before', str(before)), ('archived_at', str(database.now_epoch()))]
+                )
+
+            moved_condition = "pass_taken_at < ? AND pass_id IN (SELECT pass_id FROM archive.passes)"
+            with pool.transaction(con) as cur:
+                database.subtract_pass_stats(cur, moved_condition, (before,))
+                moved = cur.execute(
+                    f"DELETE FROM main.passes WHERE returned = 1 AND {moved_condition}",
+                    (before,)
+                ).rowcount
+        finally:
+            con.execute("DETACH DATABASE archive")
+
+        if moved:
+            database.incremental_vacuum(con)
+
+    print(f"Archived {moved} passes for term '{term}' to {path} ({copied} newly copied).")
+    return {'term': term, 'archive_path': path, 'copied': copied, 'moved': moved}
+
+class ArchiveJob:
+    """Progress and result of one term archival."""
+
+    def __init__(self, term: str, before: int):
+        self.job_id = uuid.uuid4().hex
+        self.term = term
+        self.before = before
+        self.status = 'queued'
+        self.message = ''
+        self.result = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+
+    def finish(self, status: str, message: str, result: dict = None) -> None:
+        with self._lock:
+            self.status = status
+            self.message = message
+            self.result = result or {}
+            self.finished_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            return {
+                'job_id': self.job_id,
+                'term': self.term,
+                'status': self.status,
+                'message': self.message,
+                'moved': self.result.get('moved', 0),
+                'copied': self.result.get('copied', 0),
+                'elapsed_seconds': round(elapsed, 3),
+            }
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def get_job(job_id: str) -> ArchiveJob | None:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def start_archive(pool: database.ConnectionPool, term: str, before: int) -> ArchiveJob:
+    """
+    Runs archive_term on a background thread and returns the job immediately;
+    poll job.to_dict() for the result. Only one archival runs at a time.
+    Raises ValueError for an unusable term name or while another archival is running.
+    """
+    # A term name that can't become a file name is refused before the job starts
+    archive_path(pool.db_path, term)
+    job = ArchiveJob(term, before)
+    with _jobs_lock:
+        if any(not other.finished for other in _jobs.values()):
+            raise ValueError("another archive is still running")
+        finished = sorted(_jobs.values(), key=lambda j: j.created_at)
+        for old_job in finished[:max(len(finished) - MAX_FINISHED_JOBS + 1, 0)]:
+            del _jobs[old_job.job_id]
+        _jobs[job.job_id] = job
+    worker = threading.Thread(target=_run_archive, args=(job, pool),
+                              name=f"term-archive-{job.job_id[:8]}", daemon=True)
+    worker.start()
+    return job
+
+def _run_archive(job: ArchiveJob, pool: database.ConnectionPool) -> None:
+    job.start()
+    try:
+        result = archive_term(pool, job.term, job.before)
+    except Exception as e:
+        job.finish('failed', f"Archive failed: {e}")
+        return
+    job.finish('completed', f"Archived {result['moved']} passes for term {job.term}", result)
+
+@contextmanager
+def history_connection(db_path: str = database.DB_PATH):
+    """
+    A read-only connection with every archive attached and a pass_history
+    view over live and archived passes (use PASS_SOURCE_HISTORY with
+    database.search_passes). Only the newest MAX_ATTACHED_ARCHIVES are
+    included.
+    """
+    con = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True, check_same_thread=False)
+    con.row_factory = sqlite3.Row
+    try:
+        con.execute(f"PRAGMA busy_timeout = {database.BUSY_TIMEOUT_MS}")
+        columns = ("p.pass_id, p.student_id, p.pass_taken_at, p.return_time, p.duration_minutes, "
+                   "p.due_at, p.returned, s.first_name, s.last_name")
+        selects = [f"SELECT {columns} FROM main.passes p JOIN main.students s ON p.student_id = s.student_id"]
+        for index, path in enumerate(list_archives(db_path)[-MAX_ATTACHED_ARCHIVES:]):
+            schema = f"archive{index}"
+            con.execute(f"ATTACH DATABASE ? AS {schema}", (f"file:{path}?mode=ro",))
+            selects.append(
+                f"SELECT {columns} FROM {schema}.passes p JOIN {schema}.students s ON p.student_id = s.student_id"
+            )
+        con.execute(f"CREATE TEMP VIEW pass_history AS {' UNION ALL '.join(selects)}")
+        yield con
+    finally:
+        con.close()
@@ -0,0 +1,205 @@
+# backup.py
+"""
+Online backups of the hall pass database.
+Backups use the SQLite backup API in small page steps with a pause between
+steps, so the copy is consistent without holding a lock long enough to
+delay kiosk scans. Each backup is written to backups/ next to the database
+with a .sha256 sidecar, and only the newest BACKUP_KEEP are kept.
+The integrity check is left to verify_backup, so taking a backup costs the
+kiosk as little as possible. Restore verifies first and saves the current
+database as a backup before overwriting it.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import database
+
+# --- Backup Configuration ---
+BACKUP_DIR = "backups"          # next to the live database file
+BACKUP_PAGES_PER_STEP = 64      # pages copied per step (4 KB each by default)
+BACKUP_STEP_PAUSE = 0.02        # seconds between steps; keeps the copy's share of CPU and disk low
+BACKUP_KEEP = 14                # newest backups kept by rotation
+BACKUP_INTERVAL_SECONDS = 3600  # automatic backups while the app runs; 0 disables
+# ----------------------------
+
+def backup_dir_for(db_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), BACKUP_DIR)
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def list_backups(db_path: str = database.DB_PATH) -> list[str]:
+    """Backup files for the database, oldest first."""
+    directory = backup_dir_for(db_path)
+    if not os.path.isdir(directory):
+        return []
+    prefix = os.path.splitext(os.path.basename(db_path))[0] + "_"
+    return [
+        os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+        if filename.startswith(prefix) and filename.endswith(".db")
+    ]
+
+def backup_time(path: str) -> datetime:
+    """
+    When a backup was taken, from its file name (<db>_YYYYmmdd_HHMMSS_ffffff.db).
+    Backups from before the microseconds were added end at the seconds.
+    """
+    stamp = os.path.splitext(os.path.basename(path))[0].rsplit("_", 3)
+    try:
+        return datetime.strptime("_".join(stamp[-3:]), '%Y%m%d_%H%M%S_%f')
+    except ValueError:
+        return datetime.strptime("_".join(stamp[-2:]), '%Y%m%d_%H%M%S')
+
+def backup_database(db_path: str = database.DB_PATH, pages: int = BACKUP_PAGES_PER_STEP,
+                    pause: float = BACKUP_STEP_PAUSE, keep: int = BACKUP_KEEP, on_step=None) -> dict:
+    """
+    Takes one online backup and rotates old ones (keep <= 0 keeps all).
+    Returns a summary with the backup path, checksum, size and duration.
+    on_step, if given, is called with the time.perf_counter() start and end of each copy step.
+    """
+    directory = backup_dir_for(db_path)
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    path = None
+    while path is None or os.path.exists(path):
+        # Microseconds keep back-to-back backups apart; never overwrite one
+        path = os.path.join(directory, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db")
+    partial = path + ".partial"
+
+    restarts = 0
+    last_remaining = None
+    step_started = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining, step_started
+        if on_step is not None:
+            on_step(step_started, time.perf_counter())
+        # A commit by another connection restarts the copy from the first page
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+        last_remaining = remaining
+        if remaining and pause:
+            time.sleep(pause)
+        step_started = time.perf_counter()
+
+    started = time.perf_counter()
+    source = database.create_connection(db_path)
+    target = sqlite3.connect(partial)
+    try:
+        source.execute(f"PRAGMA busy_timeout = {database.BUSY_TIMEOUT_MS}")
+        # Holding a read transaction pins one WAL snapshot for every step, so
+        # kiosk commits in between neither block the copy nor restart it
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        step_started = time.perf_counter()
+        source.backup(target, pages=pages, progress=progress)
+        source.rollback()
+        # The pinned snapshot held back checkpoints; catch up here rather
+        # than inside the next kiosk commit
+        source.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        # The copy keeps its own rollback journal so it is a single self-contained file
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+
+    checksum = file_checksum(partial)
+    os.replace(partial, path)
+    with open(path + ".sha256", 'w') as f:
+        f.write(f"{checksum}  {os.path.basename(path)}\n")
+    removed = rotate_backups(db_path, keep)
+
+    summary = {
+        'path': path,
+        'sha256': checksum,
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - started, 3),
+        'restarts': restarts,
+        'removed': removed,
+    }
+    print(f"Backup written to {path} ({summary['bytes']} bytes in {summary['seconds']}s).")
+    return summary
+
+def rotate_backups(db_path: str, keep: int = BACKUP_KEEP) -> int:
+    """Deletes all but the newest `keep` backups. Returns how many were removed."""
+    old_backups = list_backups(db_path)[:-keep] if keep > 0 else []
+    for path in old_backups:
+        for stale in (path, path + ".sha256"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+    return len(old_backups)
+
+def verify_backup(path: str) -> tuple[bool, str]:
+    """Checks a backup against its .sha256 sidecar and runs an integrity check."""
+    if not os.path.exists(path):
+        return False, f"{path} does not exist"
+    try:
+        with open(path + ".sha256", 'r') as f:
+            expected = f.read().split()[0]
+    except (FileNotFoundError, IndexError):
+        return False, "Checksum file is missing"
+    if file_checksum(path) != expected:
+        return False, "Checksum does not match"
+
+    con = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    try:
+        result = con.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        con.close()
+    if result != 'ok':
+        return False, f"Integrity check failed: {result}"
+    return True, "OK"
+
+def find_backup(db_path: str = database.DB_PATH, at: datetime = None) -> str | None:
+    """The newest backup taken at or before `at` (the newest overall if None)."""
+    candidates = [path for path in list_backups(db_path) if at is None or backup_time(path) <= at]
+    return candidates[-1] if candidates else None
+
+def restore_backup(path: str, db_path: str = database.DB_PATH) -> dict:
+    """
+    Replaces the live database with a verified backup.
+    The current database is backed up first, so a restore can be undone.
+    Stop the Flask app before restoring.
+    """
+    ok, message = verify_backup(path)
+    if not ok:
+        raise ValueError(f"Refusing to restore {path}: {message}")
+
+    safety = backup_database(db_path, pages=-1, pause=0, keep=0)
+    source = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    target = database.create_connection(db_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    print(f"Restored {db_path} from {path}; previous contents saved to {safety['path']}.")
+    return {'restored_from': path, 'previous_backup': safety['path']}
+
+def start_scheduler(db_path: str = database.DB_PATH, interval: float = BACKUP_INTERVAL_SECONDS) -> threading.Event | None:
+    """
+    Runs backup_database every `interval` seconds on a daemon thread.
+    Returns an event that stops the thread when set (None if disabled).
+    """
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                backup_database(db_path)
+            except Exception as e:
+                print(f"[WARN] Scheduled backup failed: {e}")
+
+    threading.Thread(target=run, name="db-backup", daemon=True).start()
+    return stop
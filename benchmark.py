@@ -0,0 +1,474 @@
+# benchmark.py
+"""
+Performance benchmarks for the hall pass system.
+Every benchmark runs against a throwaway database, never school_passes.db.
+"""
+import bisect
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from barcode import Code128
+from barcode.writer import ImageWriter
+from escpos.printer import Dummy
+import backup
+import database
+import print_spooler
+import printer_backends
+import printer_handler
+import slip_templates
+import write_queue
+
+def make_bench_db() -> tuple:
+    """Create a migrated database in a temporary directory."""
+    temp_dir = tempfile.mkdtemp(prefix="track_pass_bench_")
+    db_path = os.path.join(temp_dir, "bench_passes.db")
+    con = database.create_connection(db_path)
+    database.configure_connection(con)
+    database.init_database(database.create_cursor(con))
+    database.save_data(con)
+    return con, db_path, temp_dir
+
+def close_bench_db(con, temp_dir: str) -> None:
+    con.close()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+def make_roster(num_students: int, name_suffix: str = "") -> list[tuple[str, str, str]]:
+    return [(f"{100000 + i}", f"First{i}{name_suffix}", f"Last{i}{name_suffix}") for i in range(num_students)]
+
+def time_call(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def benchmark_roster_import(num_students: int = 4000):
+    """Compare the per-row CSV import path with the set-based bulk import."""
+    print("=" * 60)
+    print(f"ROSTER IMPORT BENCHMARK ({num_students} students)")
+    print("=" * 60)
+
+    import_paths = [
+        ("per-row", database.add_or_update_students_from_csv_data),
+        ("bulk", database.bulk_import_students),
+    ]
+    scenarios = [
+        ("fresh import", None, False),
+        ("re-import, skip existing", make_roster(num_students), False),
+        ("re-import, update existing", make_roster(num_students), True),
+    ]
+
+    roster = make_roster(num_students, name_suffix="x")
+    print(f"{'Scenario':<28}{'per-row (s)':>14}{'bulk (s)':>12}{'speedup':>10}")
+    print("-" * 64)
+    for scenario, preload, update_existing in scenarios:
+        timings = {}
+        for label, import_func in import_paths:
+            con, db_path, temp_dir = make_bench_db()
+            try:
+                cur = database.create_cursor(con)
+                if preload:
+                    database.bulk_import_students(cur, preload)
+                    database.save_data(con)
+
+                def run():
+                    import_func(cur, roster, update_existing)
+                    database.save_data(con)
+
+                timings[label] = time_call(run)
+            finally:
+                close_bench_db(con, temp_dir)
+        speedup = timings["per-row"] / timings["bulk"] if timings["bulk"] else 0
+        print(f"{scenario:<28}{timings['per-row']:>14.3f}{timings['bulk']:>12.3f}{speedup:>9.1f}x")
+
+def run_scan_burst(pool: database.ConnectionPool, scan, student_ids: list[str], workers: int) -> float:
+    """Run scan(student_id) for every ID from `workers` threads at once. Returns elapsed seconds."""
+    chunks = [student_ids[i::workers] for i in range(workers)]
+    start = threading.Barrier(workers + 1)
+
+    def worker(chunk):
+        start.wait()
+        for student_id in chunk:
+            scan(student_id)
+
+    threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for t in threads:
+        t.start()
+    started = time.perf_counter()
+    start.wait()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started
+
+def benchmark_kiosk_burst(num_scans: int = 2000, workers: int = 16):
+    """Compare one transaction per scan with the group-committing write queue."""
+    print("=" * 60)
+    print(f"KIOSK BURST BENCHMARK ({num_scans} sign-outs from {workers} threads)")
+    print("=" * 60)
+    print(f"{'synchronous':<14}{'per-scan (scans/s)':>20}{'queued (scans/s)':>18}{'avg batch':>11}")
+    print("-" * 63)
+
+    for synchronous in ("NORMAL", "FULL"):
+        rates = {}
+        avg_batch = 0.0
+        for mode in ("per-scan", "queued"):
+            con, db_path, temp_dir = make_bench_db()
+            pool = database.ConnectionPool(db_path)
+            writer = None
+            try:
+                cur = database.create_cursor(con)
+                database.bulk_import_students(cur, make_roster(num_scans))
+                database.update_setting(cur, 'enable_capacity_limit', '0')
+                database.save_data(con)
+                student_ids = [student_id for student_id, _, _ in make_roster(num_scans)]
+
+                if mode == "queued":
+                    writer = write_queue.WriteQueue(pool, synchronous=synchronous)
+
+                    def scan(student_id):
+                        writer.run(database.start_pass_for_student, student_id, pool.active_passes)
+                else:
+                    local = threading.local()
+
+                    def scan(student_id):
+                        if not hasattr(local, 'con'):
+                            local.con = pool.acquire()
+                            local.con.execute(f"PRAGMA synchronous = {synchronous}")
+                        with pool.transaction(local.con) as worker_cur:
+                            database.start_pass_for_student(worker_cur, student_id, pool.active_passes)
+
+                elapsed = run_scan_burst(pool, scan, student_ids, workers)
+                rates[mode] = num_scans / elapsed
+                if writer:
+                    avg_batch = writer.get_stats()['avg_batch_size']
+            finally:
+                if writer:
+                    writer.close()
+                pool.close_all()
+                close_bench_db(con, temp_dir)
+        print(f"{synchronous:<14}{rates['per-scan']:>20.0f}{rates['queued']:>18.0f}{avg_batch:>11.1f}")
+
+def seed_history(cur, num_students: int, passes_per_student: int) -> None:
+    """Returned pass history so the database has a realistic number of pages."""
+    database.bulk_import_students(cur, make_roster(num_students))
+    base = database.now_epoch() - passes_per_student * 86400
+    cur.executemany(
+        "INSERT INTO passes (student_id, pass_taken_at, return_time, duration_minutes, due_at, returned) "
+        "VALUES (?, ?, ?, 10, ?, 1)",
+        [(f"{100000 + i}", base + day * 86400 + i, base + day * 86400 + i + 300, base + day * 86400 + i + 600)
+         for i in range(num_students) for day in range(passes_per_student)]
+    )
+    database.rebuild_pass_stats(cur)
+
+def benchmark_backup_latency(num_scans: int = 1500, num_students: int = 400, passes_per_student: int = 150):
+    """
+    Kiosk scan latency with no backup, a stepped online backup, and a one-step copy running.
+    "in step" counts the scans that overlapped a backup copy step, and their
+    p99; the other scans ran while the backup paused between steps.
+    """
+    print("=" * 60)
+    print(f"BACKUP IMPACT ON SCAN LATENCY ({num_scans} scans, {num_students * passes_per_student} passes)")
+    print("=" * 60)
+    print(f"{'While running':<26}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}{'backups':>9}"
+          f"{'in step':>9}{'p99 in step':>13}")
+    print("-" * 87)
+
+    scenarios = [
+        ("nothing", None),
+        ("stepped backup", (backup.BACKUP_PAGES_PER_STEP, backup.BACKUP_STEP_PAUSE)),
+        ("one-step copy", (-1, 0)),
+    ]
+    for label, backup_args in scenarios:
+        con, db_path, temp_dir = make_bench_db()
+        pool = database.ConnectionPool(db_path)
+        try:
+            cur = database.create_cursor(con)
+            seed_history(cur, num_students, passes_per_student)
+            database.update_setting(cur, 'enable_capacity_limit', '0')
+            database.save_data(con)
+
+            done = threading.Event()
+            backups_taken = 0
+            steps = []
+
+            def run_backups():
+                nonlocal backups_taken
+                while not done.is_set():
+                    backup.backup_database(db_path, *backup_args, keep=2,
+                                           on_step=lambda started, ended: steps.append((started, ended)))
+                    backups_taken += 1
+
+            worker = threading.Thread(target=run_backups) if backup_args else None
+            if worker:
+                worker.start()
+                time.sleep(0.05)
+
+            scans = []
+            with pool.connection() as kiosk:
+                for i in range(num_scans):
+                    student_id = f"{100000 + i % num_students}"
+                    started = time.perf_counter()
+                    with pool.transaction(kiosk) as kiosk_cur:
+                        if not database.return_active_pass_for_student(kiosk_cur, student_id, pool.active_passes):
+                            database.start_pass_for_student(kiosk_cur, student_id, pool.active_passes)
+                    scans.append((started, time.perf_counter()))
+            done.set()
+            if worker:
+                worker.join()
+        finally:
+            pool.close_all()
+            close_bench_db(con, temp_dir)
+
+        # Steps run one after another, so their end times are in order too
+        step_ends = [ended for _, ended in steps]
+        samples, in_step = [], []
+        for started, ended in scans:
+            samples.append((ended - started) * 1000)
+            index = bisect.bisect_left(step_ends, started)
+            if index < len(steps) and steps[index][0] <= ended:
+                in_step.append(samples[-1])
+        print(f"{label:<26}{percentile(samples, 50):>10.2f}{percentile(samples, 99):>10.2f}"
+              f"{max(samples):>10.2f}{backups_taken:>9}{len(in_step):>9}{percentile(in_step, 99):>13.2f}")
+
+def benchmark_barcode_modes(num_slips: int = 200):
+    """Per-slip barcode cost: PNG file on disk (old), in-memory image, and the printer's native CODE128."""
+    print("=" * 60)
+    print(f"BARCODE RENDERING ({num_slips} slips, captured with a Dummy printer)")
+    print("=" * 60)
+    print(f"{'Mode':<26}{'ms/slip':>10}{'bytes/slip':>12}")
+    print("-" * 48)
+
+    temp_dir = tempfile.mkdtemp(prefix="track_pass_bench_")
+
+    def png_file(dev, pass_id):
+        # What print_pass_slip used to do: save a PNG, then load it back to rasterize
+        path = Code128(str(pass_id), writer=ImageWriter()).save(os.path.join(temp_dir, f"pass_{pass_id}"))
+        dev.image(path)
+
+    modes = [
+        ("PNG file (old)", png_file),
+        ("in-memory image", lambda dev, pass_id: printer_handler.write_raw(dev, slip_templates.barcode_bytes(pass_id, "image"))),
+        ("native CODE128", lambda dev, pass_id: printer_handler.write_raw(dev, slip_templates.barcode_bytes(pass_id, "native"))),
+    ]
+    try:
+        for label, print_barcode in modes:
+            elapsed = 0.0
+            sent = 0
+            for pass_id in range(100000, 100000 + num_slips):
+                dev = Dummy(profile=slip_templates.PRINTER_PROFILE)
+                started = time.perf_counter()
+                print_barcode(dev, pass_id)
+                elapsed += time.perf_counter() - started
+                sent += len(dev.output)
+            print(f"{label:<26}{elapsed * 1000 / num_slips:>10.2f}{sent // num_slips:>12}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def print_legacy_slip(pass_id: int) -> None:
+    """The slip as print_pass_slip used to send it: one write per set()/text() call."""
+    with printer_handler.printer.candidates()[0].device() as dev:
+        write_legacy_slip(dev, pass_id)
+
+def write_legacy_slip(dev, pass_id: int) -> None:
+    dev.set(align='center', bold=True, double_width=True, double_height=True)
+    dev.text("HALL PASS\n")
+    dev.set(align='left')
+    dev.text("-" * 32 + "\n")
+    dev.text("Student: Bench Student\n")
+    dev.text(f"ID: {pass_id}\n")
+    dev.text(f"Pass ID: {pass_id}\n")
+    dev.text(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+    dev.text("Duration: 10 minutes\n")
+    dev.text("-" * 32 + "\n\n")
+    dev.set(align='center')
+    dev.image(slip_templates.render_barcode_image(pass_id))
+    dev.text("Scan this code upon return\n")
+    dev.text("\n")
+    dev.cut()
+
+def benchmark_slip_throughput(num_slips: int = 50, num_scans: int = 100):
+    """Slips per second and bytes per slip on stand-in printers, and what printing adds to a scan."""
+    print("=" * 60)
+    print(f"SLIP THROUGHPUT ({num_slips} slips per row)")
+    print("=" * 60)
+    print(f"{'Printer':<11}{'Layout':<20}{'slips/s':>9}{'bytes/slip':>12}{'writes/slip':>13}")
+    print("-" * 65)
+
+    original_printer = printer_handler.printer
+    layouts = [
+        ("per-call (old)", print_legacy_slip),
+        ("template, image", lambda pass_id: printer_handler.print_pass_slip(
+            "Bench Student", str(pass_id), pass_id, 10, barcode_mode="image")),
+        ("template, native", lambda pass_id: printer_handler.print_pass_slip(
+            "Bench Student", str(pass_id), pass_id, 10, barcode_mode="native")),
+    ]
+    try:
+        for backend in ("capture", "simulated"):
+            for label, print_slip in layouts:
+                devices = []
+
+                def opener():
+                    devices.append(printer_backends.open_backend(backend))
+                    return devices[-1]
+
+                printer_handler.printer = printer_handler.PrinterPool({backend: printer_handler.PrinterConnection(opener)})
+                # The handler prints a line per slip
+                with contextlib.redirect_stdout(io.StringIO()):
+                    started = time.perf_counter()
+                    for pass_id in range(100000, 100000 + num_slips):
+                        print_slip(pass_id)
+                    elapsed = time.perf_counter() - started
+                stats = devices[0].get_stats()
+                print(f"{backend:<11}{label:<20}{num_slips / elapsed:>9.1f}"
+                      f"{stats['bytes'] // num_slips:>12}{stats['writes'] / num_slips:>13.1f}")
+    finally:
+        printer_handler.printer = original_printer
+
+    print()
+    print(f"SCAN LATENCY WITH PRINTING ({num_scans} sign-outs, simulated printer)")
+    print("-" * 65)
+    print(f"{'Printing':<26}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}")
+    # "inline, per-call (old)" is the slip the kiosk printed before the
+    # templates, during the request; "inline, template" keeps the request
+    # waiting but sends the slip in one write
+    scan_modes = ("none", "inline, per-call (old)", "inline, template", "spooled")
+    printer_handler.printer = printer_handler.PrinterPool({
+        'simulated': printer_handler.PrinterConnection(lambda: printer_backends.open_backend("simulated"))
+    })
+    try:
+        for label in scan_modes:
+            con, db_path, temp_dir = make_bench_db()
+            pool = database.ConnectionPool(db_path)
+            writer = write_queue.WriteQueue(pool)
+            spooler = None
+            try:
+                cur = database.create_cursor(con)
+                database.bulk_import_students(cur, make_roster(num_scans))
+                database.update_setting(cur, 'enable_capacity_limit', '0')
+                database.save_data(con)
+
+                samples = []
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if label == "spooled":
+                        spooler = print_spooler.PrintSpooler(pool, writer, {'pass_slip': printer_handler.print_pass_slip})
+                    for student_id, _, _ in make_roster(num_scans):
+                        started = time.perf_counter()
+                        new_pass, _ = writer.run(database.start_pass_for_student, student_id, pool.active_passes)
+                        slip = {'student_name': new_pass['Name'], 'student_id': student_id,
+                                'pass_id': new_pass['pass_id'], 'duration_minutes': new_pass['duration_minutes']}
+                        if label == "inline, per-call (old)":
+                            print_legacy_slip(new_pass['pass_id'])
+                        elif label == "inline, template":
+                            printer_handler.print_pass_slip(**slip)
+                        elif spooler:
+                            spooler.submit('pass_slip', slip)
+                        samples.append((time.perf_counter() - started) * 1000)
+                    if spooler:
+                        # Unprinted slips stay queued in the throwaway database
+                        spooler.close()
+            finally:
+                if spooler:
+                    spooler.close()
+                writer.close()
+                pool.close_all()
+                close_bench_db(con, temp_dir)
+            print(f"{label:<26}{percentile(samples, 50):>10.2f}{percentile(samples, 99):>10.2f}{max(samples):>10.2f}")
+    finally:
+        printer_handler.printer = original_printer
+
+def benchmark_printer_pool(num_jobs: int = 20):
+    """Spooler throughput with one or more simulated printers, including one that is jammed."""
+    print("=" * 60)
+    print(f"PRINTER POOL ({num_jobs} slips through the spooler, simulated printers)")
+    print("=" * 60)
+    print(f"{'Printers':<24}{'slips/s':>9}  per printer: printed / error rate")
+    print("-" * 65)
+
+    def jammed():
+        return printer_backends.SimulatedPrinter(failure_rate=1.0)
+
+    scenarios = [
+        ("1 printer", {'a': printer_backends.SimulatedPrinter}),
+        ("2 printers", {'a': printer_backends.SimulatedPrinter, 'b': printer_backends.SimulatedPrinter}),
+        ("2 printers, 1 jammed", {'a': jammed, 'b': printer_backends.SimulatedPrinter}),
+    ]
+    original_printer = printer_handler.printer
+    try:
+        for label, openers in scenarios:
+            printer_handler.printer = printer_handler.PrinterPool({
+                name: printer_handler.PrinterConnection(opener, name=name) for name, opener in openers.items()
+            })
+            con, db_path, temp_dir = make_bench_db()
+            pool = database.ConnectionPool(db_path)
+            writer = write_queue.WriteQueue(pool)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    spooler = print_spooler.PrintSpooler(pool, writer, {'pass_slip': printer_handler.print_pass_slip},
+                                                         workers=len(openers), poll_seconds=0.05)
+                    try:
+                        started = time.perf_counter()
+                        for pass_id in range(1, num_jobs + 1):
+                            spooler.submit('pass_slip', {'student_name': "Bench Student", 'student_id': str(pass_id),
+                                                         'pass_id': pass_id, 'duration_minutes': 10})
+                        while spooler.get_stats()['printed'] < num_jobs:
+                            time.sleep(0.01)
+                        elapsed = time.perf_counter() - started
+                    finally:
+                        spooler.close()
+            finally:
+                writer.close()
+                pool.close_all()
+                close_bench_db(con, temp_dir)
+            per_printer = ", ".join(
+                f"{name} {stats['printed']} / {stats['error_rate']:.0%}"
+                for name, stats in printer_handler.printer.get_stats().items()
+            )
+            print(f"{label:<24}{num_jobs / elapsed:>9.2f}  {per_printer}")
+    finally:
+        printer_handler.printer = original_printer
+
+def main():
+    """Main benchmark menu"""
+    print("HALL PASS BENCHMARK SUITE")
+    print("=" * 50)
+
+    benchmarks = [
+        ("Roster import (per-row vs bulk)", benchmark_roster_import),
+        ("Kiosk scan burst (per-scan commit vs write queue)", benchmark_kiosk_burst),
+        ("Backup impact on scan latency (p99)", benchmark_backup_latency),
+        ("Barcode rendering (PNG file vs in-memory vs native)", benchmark_barcode_modes),
+        ("Slip throughput and scan latency with printing", benchmark_slip_throughput),
+        ("Printer pool throughput and failover", benchmark_printer_pool),
+    ]
+
+    while True:
+        print("\nSelect benchmark:")
+        for i, (description, _) in enumerate(benchmarks, 1):
+            print(f"{i}. {description}")
+        print(f"{len(benchmarks) + 1}. Run all benchmarks")
+        print("0. Exit")
+
+        choice = input(f"\nEnter choice (0-{len(benchmarks) + 1}): ").strip()
+
+        if choice == "0":
+            print("Exiting benchmark suite.")
+            break
+        elif choice.isdigit() and 1 <= int(choice) <= len(benchmarks):
+            benchmarks[int(choice) - 1][1]()
+        elif choice == str(len(benchmarks) + 1):
+            for _, benchmark in benchmarks:
+                benchmark()
+        else:
+            print("Invalid choice. Please try again.")
+
+if __name__ == "__main__":
+    main()
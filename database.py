@@ -1,38 +1,128 @@
 # database.py
+import base64
+import json
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
-def init_database(cursor: sqlite3.Cursor, file_source: str = "./create_empty.sql") -> None:
-    with open(file_source, 'r') as f:
-        create_sql = f.read()
-    try:
-        cursor.executescript(create_sql)
-        print("Database initialized.")
-        
-        # Initialize default settings if they don't exist
-        init_default_settings(cursor)
-        
-    except Exception:
-        print("Database already exists.")
-        # Still try to add settings table if it doesn't exist
+# --- Connection Configuration ---
+DB_PATH = "school_passes.db"
+BUSY_TIMEOUT_MS = 100             # SQLite's own wait before raising SQLITE_BUSY
+BUSY_RETRY_INITIAL_DELAY = 0.005  # seconds; doubled on every retry
+BUSY_RETRY_MAX_DELAY = 0.2
+BUSY_RETRY_MAX_WAIT = 5.0         # give up on the write lock after this long
+SYNCHRONOUS_MODE = "NORMAL"       # safe with WAL; FULL also fsyncs every commit
+CACHE_SIZE_KB = 16384
+MMAP_SIZE_BYTES = 64 * 1024 * 1024
+ACTIVE_COUNT_RECONCILE_SECONDS = 60  # recount open passes at least this often
+SETTINGS_CHECK_SECONDS = 2.0         # how often the settings cache looks for outside edits
+ROSTER_CHECK_SECONDS = 2.0           # how often the student directory looks for outside edits
+SNAPSHOT_MAX_AGE_SECONDS = 5.0       # admin reads may be this far behind the kiosk writes
+VACUUM_BATCH_PAGES = 1000            # free pages released per step after a large delete
+# --------------------------------
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+def now_epoch() -> int:
+    """Current time as integer epoch seconds, the format pass times are stored in."""
+    return int(time.time())
+
+def format_timestamp(epoch_seconds: int | None, fmt: str = '%Y-%m-%d %H:%M:%S') -> str:
+    """Format an epoch timestamp in local time for display."""
+    if epoch_seconds is None:
+        return ''
+    return datetime.fromtimestamp(epoch_seconds).strftime(fmt)
+
+def get_schema_version(cursor: sqlite3.Cursor) -> int:
+    """Get the schema version recorded in the database header."""
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+def list_migrations(migrations_dir: str = MIGRATIONS_DIR) -> list[tuple[int, str]]:
+    """
+    Returns the numbered migration files in order.
+    Files are named like 001_create_tables.sql; the number is the schema version.
+    """
+    migrations = []
+    for filename in os.listdir(migrations_dir):
+        prefix = filename.split('_', 1)[0]
+        if filename.endswith('.sql') and prefix.isdigit():
+            migrations.append((int(prefix), os.path.join(migrations_dir, filename)))
+    return sorted(migrations)
+
+def run_migrations(cursor: sqlite3.Cursor, migrations_dir: str = MIGRATIONS_DIR) -> int:
+    """
+    Applies every migration newer than the current schema version.
+    Each migration runs in its own transaction together with the version bump,
+    so a failed migration leaves the database at the previous version.
+    Returns the resulting schema version.
+    """
+    current_version = get_schema_version(cursor)
+    if current_version == 0 and not cursor.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]:
+        # A new, empty database: switching to incremental vacuum costs nothing yet
+        # (existing databases are converted with manage.py enable-incremental-vacuum)
+        cursor.executescript("PRAGMA auto_vacuum = INCREMENTAL; VACUUM;")
+
+    for version, path in list_migrations(migrations_dir):
+        if version <= current_version:
+            continue
+
+        with open(path, 'r') as f:
+            migration_sql = f.read()
+
         try:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS settings (
-                    setting_key TEXT PRIMARY KEY,
-                    setting_value TEXT NOT NULL,
-                    description TEXT
-                )
-            """)
-            init_default_settings(cursor)
-        except Exception as e:
-            print(f"Error initializing settings: {e}")
+            cursor.executescript(
+                f"BEGIN;\n{migration_sql};\nPRAGMA user_version = {version};\nCOMMIT;"
+            )
+        except Exception:
+            if cursor.connection.in_transaction:
+                cursor.connection.rollback()
+            raise
+
+        print(f"Applied migration {os.path.basename(path)}")
+        current_version = version
+
+    return current_version
+
+def init_database(cursor: sqlite3.Cursor, migrations_dir: str = MIGRATIONS_DIR) -> None:
+    version = run_migrations(cursor, migrations_dir)
+    init_default_settings(cursor)
+    ensure_active_passes_consistent(cursor)
+    print(f"Database initialized (schema version {version}).")
+
+# Settings that are parsed to something other than str when cached
+SETTING_TYPES = {
+    'max_students_out': int,
+    'default_pass_duration': int,
+    'enable_capacity_limit': bool,
+}
+
+# Settings limited to a fixed set of values
+SETTING_CHOICES = {
+    'barcode_mode': ('image', 'native'),
+}
+
+def parse_setting(setting_key: str, setting_value: str):
+    """Convert a stored setting string to its typed value."""
+    choices = SETTING_CHOICES.get(setting_key)
+    if choices is not None and setting_value not in choices:
+        raise ValueError(f"{setting_key} must be one of: {', '.join(choices)}")
+    setting_type = SETTING_TYPES.get(setting_key, str)
+    if setting_type is bool:
+        return setting_value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if setting_type is int:
+        return int(setting_value)
+    return setting_value
 
 def init_default_settings(cursor: sqlite3.Cursor) -> None:
     """Initialize default system settings."""
     default_settings = [
         ('max_students_out', '10', 'Maximum number of students allowed out at once'),
         ('default_pass_duration', '10', 'Default pass duration in minutes'),
-        ('enable_capacity_limit', '1', 'Whether to enforce the maximum capacity limit (1=enabled, 0=disabled)')
+        ('enable_capacity_limit', '1', 'Whether to enforce the maximum capacity limit (1=enabled, 0=disabled)'),
+        ('barcode_mode', 'image', 'How slips print the pass barcode (image=works on any printer, native=the printer draws CODE128 itself, much faster)')
     ]
     
     for key, value, description in default_settings:
@@ -64,6 +154,15 @@ def update_setting(cursor: sqlite3.Cursor, setting_key: str, setting_value: str)
         print(f"Error updating setting {setting_key}: {e}")
         return False
 
+def get_settings(cursor: sqlite3.Cursor, setting_keys: list[str]) -> dict:
+    """Get several setting values in one query. Missing keys are left out."""
+    placeholders = ", ".join("?" for _ in setting_keys)
+    rows = cursor.execute(
+        f"SELECT setting_key, setting_value FROM settings WHERE setting_key IN ({placeholders})",
+        setting_keys
+    ).fetchall()
+    return {row['setting_key']: row['setting_value'] for row in rows}
+
 def get_all_settings(cursor: sqlite3.Cursor) -> dict:
     """Get all settings as a dictionary."""
     rows = cursor.execute(
@@ -78,39 +177,454 @@ def get_all_settings(cursor: sqlite3.Cursor) -> dict:
 def get_active_pass_count(cursor: sqlite3.Cursor) -> int:
     """Get the current number of active passes."""
     result = cursor.execute(
-        "SELECT COUNT(*) as count FROM passes WHERE returned = 0"
+        "SELECT COUNT(*) as count FROM active_passes"
     ).fetchone()
     
     return result['count'] if result else 0
 
-def can_create_new_pass(cursor: sqlite3.Cursor) -> tuple[bool, str]:
+class SettingsCache:
     """
-    Check if a new pass can be created based on capacity limits.
-    Returns (can_create, reason_if_not)
+    Typed, in-memory copy of the settings table for the hot paths.
+    Values are parsed once per load. Writes made through this process call
+    invalidate(); edits made by another process (or another connection) are
+    picked up by checking PRAGMA data_version at most every check_seconds.
     """
-    # Check if capacity limit is enabled
-    limit_enabled = get_setting(cursor, 'enable_capacity_limit', '1') == '1'
-    
-    if not limit_enabled:
-        return True, ""
-    
-    # Get current active count and max limit
-    active_count = get_active_pass_count(cursor)
-    max_allowed = int(get_setting(cursor, 'max_students_out', '10'))
-    
-    if active_count >= max_allowed:
-        return False, f"Maximum capacity reached ({active_count}/{max_allowed} students currently out)"
-    
-    return True, ""
 
-def create_connection() -> sqlite3.Connection:
-    con = sqlite3.connect("school_passes.db", check_same_thread=False)
+    def __init__(self, db_path: str = DB_PATH, check_seconds: float = SETTINGS_CHECK_SECONDS):
+        self.db_path = db_path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._con = None
+        self._values = None
+        self._data_version = None
+        self._checked_at = 0.0
+
+    def _load(self) -> None:
+        # Caller holds self._lock
+        if self._con is None:
+            self._con = create_connection(self.db_path)
+        rows = self._con.execute("SELECT setting_key, setting_value FROM settings").fetchall()
+        values = {}
+        for row in rows:
+            try:
+                values[row['setting_key']] = parse_setting(row['setting_key'], row['setting_value'])
+            except ValueError:
+                print(f"Warning: Setting '{row['setting_key']}' has an invalid value '{row['setting_value']}'.")
+        self._values = values
+        self._data_version = self._con.execute("PRAGMA data_version").fetchone()[0]
+        self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self) -> None:
+        # Caller holds self._lock
+        if self._values is None:
+            self._load()
+            return
+        if time.monotonic() - self._checked_at < self.check_seconds:
+            return
+        # data_version changes whenever another connection commits; reload then
+        if self._con.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+            self._load()
+        else:
+            self._checked_at = time.monotonic()
+
+    def get(self, setting_key: str, default_value=None):
+        """Get a typed setting value."""
+        with self._lock:
+            self._ensure_fresh()
+            return self._values.get(setting_key, default_value)
+
+    def get_all(self) -> dict:
+        """Get every typed setting value."""
+        with self._lock:
+            self._ensure_fresh()
+            return dict(self._values)
+
+    def invalidate(self) -> None:
+        """Drop the cached values; call after committing a settings change."""
+        with self._lock:
+            self._values = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            self._values = None
+
+class StudentRecord:
+    """One roster entry in the student directory."""
+    __slots__ = ('student_id', 'first_name', 'last_name', 'name')
+
+    def __init__(self, student_id: str, first_name: str, last_name: str):
+        self.student_id = student_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.name = f"{first_name} {last_name}"
+
+class StudentDirectory:
+    """
+    In-memory copy of the roster for scans, keyed by student_id.
+    Writes made through this process call invalidate(). Other writers are
+    caught by checking PRAGMA data_version at most every check_seconds and,
+    if anything was committed, the roster_version counter, so pass writes
+    do not cause a reload.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, check_seconds: float = ROSTER_CHECK_SECONDS):
+        self.db_path = db_path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._con = None
+        self._students = None
+        self._version = None
+        self._data_version = None
+        self._checked_at = 0.0
+
+    def _load(self) -> None:
+        # Caller holds self._lock; one read transaction keeps version and rows consistent
+        if self._con is None:
+            self._con = create_connection(self.db_path)
+        with self._con:
+            self._con.execute("BEGIN")
+            version = get_roster_version(self._con.cursor())
+            rows = self._con.execute("SELECT student_id, first_name, last_name FROM students").fetchall()
+        self._students = {row[0]: StudentRecord(row[0], row[1], row[2]) for row in rows}
+        self._version = version
+        self._data_version = self._con.execute("PRAGMA data_version").fetchone()[0]
+        self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self) -> None:
+        # Caller holds self._lock
+        if self._students is None:
+            self._load()
+            return
+        if time.monotonic() - self._checked_at < self.check_seconds:
+            return
+        data_version = self._con.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version and get_roster_version(self._con.cursor()) != self._version:
+            self._load()
+            return
+        self._data_version = data_version
+        self._checked_at = time.monotonic()
+
+    def get(self, student_id: str) -> StudentRecord | None:
+        """Look up a student without touching the database (usually)."""
+        with self._lock:
+            self._ensure_fresh()
+            return self._students.get(student_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_fresh()
+            return len(self._students)
+
+    @property
+    def version(self) -> int | None:
+        """roster_version the directory was loaded at."""
+        with self._lock:
+            return self._version
+
+    def invalidate(self) -> None:
+        """Drop the directory; call after committing a roster change."""
+        with self._lock:
+            self._students = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            self._students = None
+
+def get_roster_version(cursor: sqlite3.Cursor) -> int:
+    """The roster_version counter, bumped by triggers on every students change."""
+    row = cursor.execute("SELECT version FROM roster_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+class ActivePassCounter:
+    """
+    In-memory count of open passes, so the capacity check on every scan does
+    not need a COUNT(*). The passes table stays the source of truth: the count
+    is reconciled from it inside a write transaction (where it is exact) when
+    first used, after invalidate(), and every ACTIVE_COUNT_RECONCILE_SECONDS.
+    """
+
+    def __init__(self, reconcile_seconds: float = ACTIVE_COUNT_RECONCILE_SECONDS):
+        self.reconcile_seconds = reconcile_seconds
+        self._lock = threading.Lock()
+        self._count = None
+        self._reconciled_at = 0.0
+
+    def _current(self, cursor: sqlite3.Cursor) -> int:
+        # Caller holds self._lock and the database write lock
+        if self._count is None or time.monotonic() - self._reconciled_at >= self.reconcile_seconds:
+            self._count = get_active_pass_count(cursor)
+            self._reconciled_at = time.monotonic()
+        return self._count
+
+    def peek(self, cursor: sqlite3.Cursor) -> int:
+        """Current count for display. Never reconciles, since it may run outside a write."""
+        with self._lock:
+            if self._count is not None:
+                return self._count
+        return get_active_pass_count(cursor)
+
+    def try_reserve(self, cursor: sqlite3.Cursor, max_allowed: int | None) -> tuple[bool, int]:
+        """
+        Count one more open pass if that stays within max_allowed (None = no limit).
+        Must be called inside a write transaction. Returns (reserved, count_before).
+        """
+        with self._lock:
+            current = self._current(cursor)
+            if max_allowed is not None and current >= max_allowed:
+                return False, current
+            self._count = current + 1
+            return True, current
+
+    def release(self) -> None:
+        """Count one pass as returned."""
+        with self._lock:
+            if self._count:
+                self._count -= 1
+
+    def invalidate(self) -> None:
+        """Forget the count; the next write recounts it from the passes table."""
+        with self._lock:
+            self._count = None
+
+def create_connection(db_path: str = DB_PATH) -> sqlite3.Connection:
+    con = sqlite3.connect(db_path, check_same_thread=False)
     con.row_factory = sqlite3.Row
     return con
 
+def configure_connection(connection: sqlite3.Connection) -> None:
+    """Apply the WAL journal and cache tuning to a connection."""
+    connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute(f"PRAGMA synchronous = {SYNCHRONOUS_MODE}")
+    connection.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+
 def create_cursor(connection: sqlite3.Connection) -> sqlite3.Cursor:
     return connection.cursor()
 
+def is_busy_error(error: Exception) -> bool:
+    """True if the error is SQLITE_BUSY/SQLITE_LOCKED, i.e. worth retrying."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return (code & 0xff) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+class ConnectionPool:
+    """
+    Hands out one connection per worker for the duration of a request.
+    Connections are configured for WAL, so readers (kiosk polls, the admin
+    dashboard) never block the writers that create and return passes.
+    Writers go through transaction(), which takes the write lock up front
+    with BEGIN IMMEDIATE, retries with backoff on SQLITE_BUSY and records how
+    long it waited for the lock.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, max_idle: int = 8):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.active_passes = ActivePassCounter()
+        self.settings = SettingsCache(db_path)
+        self.students = StudentDirectory(db_path)
+        self.snapshot = ReadSnapshot(db_path)
+        self._stats = {
+            'connections_opened': 0,
+            'transactions': 0,
+            'busy_retries': 0,
+            'lock_wait_total_ms': 0.0,
+            'lock_wait_max_ms': 0.0,
+        }
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a connection, opening a new one if none are idle."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self._stats['connections_opened'] += 1
+
+        con = create_connection(self.db_path)
+        configure_connection(con)
+        return con
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        """Return a connection to the pool, discarding any unfinished transaction."""
+        if connection.in_transaction:
+            connection.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    @contextmanager
+    def connection(self):
+        con = self.acquire()
+        try:
+            yield con
+        finally:
+            self.release(con)
+
+    @contextmanager
+    def transaction(self, connection: sqlite3.Connection):
+        """
+        Runs the body in a BEGIN IMMEDIATE transaction and commits it.
+        Rolls back if the body raises, and then invalidates the active pass
+        count since the body may already have adjusted it.
+        """
+        cursor = create_cursor(connection)
+        waited = self._begin_immediate(cursor)
+        try:
+            yield cursor
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            self.active_passes.invalidate()
+            raise
+        finally:
+            self._record_lock_wait(waited)
+
+    def _begin_immediate(self, cursor: sqlite3.Cursor) -> float:
+        """Take the write lock, backing off on SQLITE_BUSY. Returns seconds waited."""
+        started = time.perf_counter()
+        delay = BUSY_RETRY_INITIAL_DELAY
+        while True:
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                return time.perf_counter() - started
+            except sqlite3.OperationalError as e:
+                waited = time.perf_counter() - started
+                if not is_busy_error(e) or waited >= BUSY_RETRY_MAX_WAIT:
+                    self._record_lock_wait(waited)
+                    raise
+                with self._lock:
+                    self._stats['busy_retries'] += 1
+                time.sleep(delay)
+                delay = min(delay * 2, BUSY_RETRY_MAX_DELAY)
+
+    def _record_lock_wait(self, seconds: float) -> None:
+        waited_ms = seconds * 1000
+        with self._lock:
+            self._stats['transactions'] += 1
+            self._stats['lock_wait_total_ms'] += waited_ms
+            self._stats['lock_wait_max_ms'] = max(self._stats['lock_wait_max_ms'], waited_ms)
+
+    def get_stats(self) -> dict:
+        """Snapshot of pool counters, including lock-wait time for writers."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle_connections'] = len(self._idle)
+        transactions = stats['transactions']
+        stats['lock_wait_avg_ms'] = stats['lock_wait_total_ms'] / transactions if transactions else 0.0
+        return stats
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            con.close()
+        self.settings.close()
+        self.students.close()
+        self.snapshot.close()
+
+class ReadSnapshot:
+    """
+    In-memory copy of the database for admin and reporting reads, made with
+    the SQLite backup API. Slow analytical queries run against the copy, so
+    they never hold a read transaction on the live file (which would stall
+    WAL checkpoints) or compete with the kiosk writers for its cache.
+    The copy is refreshed on use once it is older than max_age_seconds, and
+    only if something was committed since (PRAGMA data_version). Readers are
+    served one at a time; the admin dashboard is a single user.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, max_age_seconds: float = SNAPSHOT_MAX_AGE_SECONDS):
+        self.db_path = db_path
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._source = None
+        self._snapshot = None
+        self._data_version = None
+        self._taken_at = 0.0
+        self._stats = {'refreshes': 0, 'last_refresh_ms': 0.0}
+
+    def _refresh(self) -> None:
+        # Caller holds self._lock
+        if self._source is None:
+            self._source = create_connection(self.db_path)
+        data_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+        if self._snapshot is not None and data_version == self._data_version:
+            # Nothing committed since the copy, so it is still current
+            self._taken_at = time.time()
+            return
+
+        started = time.perf_counter()
+        snapshot = sqlite3.connect(":memory:", check_same_thread=False)
+        snapshot.row_factory = sqlite3.Row
+        self._source.backup(snapshot)
+        snapshot.execute("PRAGMA query_only = ON")
+        if self._snapshot is not None:
+            self._snapshot.close()
+        self._snapshot = snapshot
+        self._data_version = data_version
+        self._taken_at = time.time()
+        self._stats['refreshes'] += 1
+        self._stats['last_refresh_ms'] = (time.perf_counter() - started) * 1000
+
+    def acquire(self) -> sqlite3.Connection:
+        """Lock the snapshot for one reader, refreshing it first if it is too old."""
+        self._lock.acquire()
+        try:
+            if self._snapshot is None or time.time() - self._taken_at >= self.max_age_seconds:
+                self._refresh()
+        except BaseException:
+            self._lock.release()
+            raise
+        return self._snapshot
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        if connection.in_transaction:
+            connection.rollback()
+        self._lock.release()
+
+    @contextmanager
+    def connection(self):
+        con = self.acquire()
+        try:
+            yield con
+        finally:
+            self.release(con)
+
+    def age(self) -> float:
+        """Seconds since the snapshot was last known to match the database."""
+        return max(time.time() - self._taken_at, 0.0) if self._taken_at else 0.0
+
+    def invalidate(self) -> None:
+        """Make the next reader check for changes; call after an admin write."""
+        self._taken_at = 0.0
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats['age_seconds'] = round(self.age(), 3)
+        stats['max_age_seconds'] = self.max_age_seconds
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            for con in (self._snapshot, self._source):
+                if con is not None:
+                    con.close()
+            self._snapshot = self._source = None
+
 def insert_student(cursor: sqlite3.Cursor, student_id: str, first_name: str, last_name: str,
                    total_passes: int = 0, total_time_out: int = 0) -> None:
     # Ensure student_id is treated as text, but validate its content if needed
@@ -128,8 +642,14 @@ def delete_all_students(cursor: sqlite3.Cursor) -> None:
     Deletes all passes and all students from the database.
     This provides a clean slate for a new import.
     """
-    # We must delete from 'passes' first because it has a foreign key
-    # reference to the 'students' table.
+    # The tables derived from passes go first: active_passes (the open
+    # passes) and the pass_stats rollups, so none of them is left counting
+    # passes that no longer exist. Then passes, which has a foreign key
+    # reference to the 'students' table, and the students last.
+    cursor.execute("DELETE FROM active_passes")
+    cursor.execute("DELETE FROM pass_stats_student_day")
+    cursor.execute("DELETE FROM pass_stats_day")
+    cursor.execute("DELETE FROM pass_stats_hour")
     cursor.execute("DELETE FROM passes")
     cursor.execute("DELETE FROM students")
     print("All existing student and pass records have been deleted.")
@@ -149,6 +669,8 @@ def delete_student_by_id(cursor: sqlite3.Cursor, student_id: str) -> bool:
         return False
     
     # Delete passes first (foreign key constraint)
+    remove_student_pass_stats(cursor, student_id)
+    cursor.execute("DELETE FROM active_passes WHERE student_id = ?", (student_id,))
     cursor.execute("DELETE FROM passes WHERE student_id = ?", (student_id,))
     
     # Then delete the student
@@ -181,67 +703,105 @@ def get_all_students(cursor: sqlite3.Cursor) -> list[dict]:
     ).fetchall()
     return [dict(row) for row in rows]
 
-def create_pass_now(cursor: sqlite3.Cursor, student_id: str, intended_duration_minutes: int = None) -> tuple[int | None, str]:
+def start_pass_for_student(cursor: sqlite3.Cursor, student_id: str, counter: ActivePassCounter,
+                           settings: SettingsCache = None, intended_duration_minutes: int = None,
+                           students: StudentDirectory = None) -> tuple[dict | None, str]:
     """
-    Create a new pass if capacity allows.
-    Returns (pass_id, error_message)
+    Validates the student, checks capacity and creates the pass.
+    Must run inside a single write transaction (ConnectionPool.transaction), so
+    two kiosks scanning at once cannot both take the last free spot.
+    Settings and the student's name come from the caches when given,
+    otherwise from a query each.
+    Returns (pass_info, error_message); pass_info['version'] is the active
+    pass list version this pass produced.
     """
-    try:
-        # Check capacity first
-        can_create, reason = can_create_new_pass(cursor)
-        if not can_create:
-            return None, reason
-        
-        # Use default duration if not specified
-        if intended_duration_minutes is None:
-            intended_duration_minutes = int(get_setting(cursor, 'default_pass_duration', '10'))
-        
-        cursor.execute(
-            "INSERT INTO passes (student_id, pass_taken_at, duration_minutes, returned) "
-            "VALUES (?, ?, ?, 0)",
-            (student_id, datetime.now().isoformat(sep=' ', timespec='seconds'), intended_duration_minutes)
-        )
-        return cursor.lastrowid, ""
-    except Exception as e:
-        return None, f"Unable to create new pass: {e}"
+    if students is not None:
+        record = students.get(student_id)
+        full_name = record.name if record else None
+    else:
+        row = cursor.execute(
+            "SELECT first_name, last_name FROM students WHERE student_id = ?",
+            (student_id,)
+        ).fetchone()
+        full_name = f"{row['first_name']} {row['last_name']}" if row else None
+    if full_name is None:
+        return None, f"Student ID {student_id} not found in system"
 
-def return_pass_by_id(cursor: sqlite3.Cursor, pass_id: int) -> dict | None:
-    """Marks a pass as returned and returns the pass details."""
-    rt = datetime.now().isoformat(sep=' ', timespec='seconds')
-    
-    # First, get the pass details to calculate time out
+    if settings is not None:
+        pass_settings = settings.get_all()
+    else:
+        pass_settings = {
+            key: parse_setting(key, value) for key, value in
+            get_settings(cursor, ['enable_capacity_limit', 'max_students_out', 'default_pass_duration']).items()
+        }
+    max_allowed = None
+    if pass_settings.get('enable_capacity_limit', True):
+        max_allowed = pass_settings.get('max_students_out', 10)
+    if intended_duration_minutes is None:
+        intended_duration_minutes = pass_settings.get('default_pass_duration', 10)
+
+    reserved, active_count = counter.try_reserve(cursor, max_allowed)
+    if not reserved:
+        return None, f"Maximum capacity reached ({active_count}/{max_allowed} students currently out)"
+
+    now = now_epoch()
+    row = cursor.execute(
+        "INSERT INTO passes (student_id, pass_taken_at, duration_minutes, due_at, returned) "
+        "VALUES (?, ?, ?, ?, 0) RETURNING pass_id, pass_taken_at, duration_minutes, due_at",
+        (student_id, now, intended_duration_minutes, now + intended_duration_minutes * 60)
+    ).fetchone()
+    cursor.execute(
+        "INSERT INTO active_passes (pass_id, student_id, full_name, pass_taken_at, duration_minutes, due_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (row["pass_id"], student_id, full_name, row["pass_taken_at"], row["duration_minutes"], row["due_at"])
+    )
+
+    return {
+        "pass_id": row["pass_id"],
+        "student_id": student_id,
+        "Name": full_name,
+        "pass_taken_at": row["pass_taken_at"],
+        "duration_minutes": row["duration_minutes"],
+        "due_at": row["due_at"],
+        # Read inside the write, so it is this pass's own event, not a later one
+        "version": get_active_passes_version(cursor),
+    }, ""
+
+def return_pass_by_id(cursor: sqlite3.Cursor, pass_id: int, counter: ActivePassCounter = None) -> dict | None:
+    """Marks a pass as returned and returns the pass details, with the active pass list version it produced."""
+    # Mark the pass as returned; times are epoch seconds, so time out is a subtraction
     pass_row = cursor.execute(
-        "SELECT student_id, pass_taken_at, duration_minutes FROM passes WHERE pass_id = ? AND returned = 0",
-        (pass_id,)
+        "UPDATE passes SET returned = 1, return_time = ? WHERE pass_id = ? AND returned = 0 "
+        "RETURNING pass_id, student_id, pass_taken_at, duration_minutes, return_time - pass_taken_at AS time_out_seconds, "
+        "return_time > due_at AS overtime",
+        (now_epoch(), pass_id)
     ).fetchone()
 
     if not pass_row:
         return None # Pass already returned or does not exist
 
-    # Mark the pass as returned
-    cursor.execute(
-        "UPDATE passes SET returned = 1, return_time = ? WHERE pass_id = ?",
-        (rt, pass_id)
-    )
+    cursor.execute("DELETE FROM active_passes WHERE pass_id = ?", (pass_id,))
+    version = get_active_passes_version(cursor)
     
     # Update student aggregates
-    student_id = pass_row['student_id']
-    start_time = datetime.fromisoformat(pass_row['pass_taken_at'])
-    end_time = datetime.fromisoformat(rt)
-    time_out_seconds = int((end_time - start_time).total_seconds())
-
     cursor.execute(
         "UPDATE students SET total_time_out = total_time_out + ?, total_passes = total_passes + 1 WHERE student_id = ?",
-        (time_out_seconds, student_id)
+        (pass_row['time_out_seconds'], pass_row['student_id'])
     )
+    record_pass_stats(cursor, pass_row['student_id'], pass_row['pass_taken_at'],
+                      pass_row['time_out_seconds'], bool(pass_row['overtime']))
+
+    if counter is not None:
+        counter.release()
     
-    return dict(pass_row)
+    return dict(pass_row, version=version)
 
-def return_active_pass_for_student(cursor: sqlite3.Cursor, student_id: str) -> dict | None:
+def return_active_pass_for_student(cursor: sqlite3.Cursor, student_id: str,
+                                   counter: ActivePassCounter = None) -> dict | None:
     """Finds the single active pass for a student and marks it as returned."""
     # First, find the pass_id of the one pass that is not returned for this student
     active_pass_row = cursor.execute(
-        "SELECT pass_id FROM passes WHERE student_id = ? AND returned = 0 ORDER BY pass_taken_at DESC LIMIT 1",
+        "SELECT pass_id FROM active_passes WHERE student_id = ? ORDER BY pass_taken_at DESC LIMIT 1",
         (student_id,)
     ).fetchone()
 
@@ -250,21 +810,110 @@ def return_active_pass_for_student(cursor: sqlite3.Cursor, student_id: str) -> d
 
     # Now that we have the pass_id, we can reuse our existing return logic
     pass_id_to_return = active_pass_row['pass_id']
-    return return_pass_by_id(cursor, pass_id_to_return)
+    return return_pass_by_id(cursor, pass_id_to_return, counter)
+
+def toggle_pass_for_student(cursor: sqlite3.Cursor, student_id: str, counter: ActivePassCounter,
+                            settings: SettingsCache = None, students: StudentDirectory = None) -> tuple[str | None, dict | None, str]:
+    """
+    A kiosk scan: returns the student's active pass if they are out, otherwise starts one.
+    Must run inside a single write transaction, so the out/in decision and
+    the write cannot interleave with another kiosk scanning the same student.
+    Returns (action, pass_info, error_message); action is 'returned' or 'started'.
+    """
+    returned = return_active_pass_for_student(cursor, student_id, counter)
+    if returned is not None:
+        return 'returned', returned, ""
+    new_pass, error = start_pass_for_student(cursor, student_id, counter, settings, students=students)
+    if error:
+        return None, None, error
+    return 'started', new_pass, ""
 
 def get_active_passes(cursor: sqlite3.Cursor) -> list[dict]:
     """Gets all passes that have not been returned."""
     rows = cursor.execute(
         """
-        SELECT p.pass_id, p.student_id, p.pass_taken_at, p.duration_minutes, s.first_name, s.last_name
-        FROM passes p
-        JOIN students s ON p.student_id = s.student_id
-        WHERE p.returned = 0
-        ORDER BY p.pass_taken_at ASC
+        SELECT pass_id, student_id, full_name, pass_taken_at, duration_minutes, due_at
+        FROM active_passes
+        ORDER BY pass_taken_at ASC, pass_id ASC
         """
     ).fetchall()
     return [dict(r) for r in rows]
 
+def get_active_passes_version(cursor: sqlite3.Cursor) -> int:
+    """
+    Version of the active pass list: the newest active_pass_events entry.
+    Changes only when a pass starts, returns or is renamed, or a capacity setting changes.
+    """
+    return cursor.execute("SELECT COALESCE(MAX(version), 0) FROM active_pass_events").fetchone()[0]
+
+def get_active_pass_changes(cursor: sqlite3.Cursor, since: int) -> tuple[list[dict], list[int]] | None:
+    """
+    Open passes started or updated after version `since`, and the IDs of passes returned since.
+    Returns None if the event log no longer reaches back to `since` (or `since`
+    is newer than the log, e.g. after a restore); send the full list then.
+    """
+    oldest, newest = cursor.execute("SELECT MIN(version), MAX(version) FROM active_pass_events").fetchone()
+    if oldest is None or since < oldest - 1 or since > newest:
+        return None
+    rows = cursor.execute(
+        """
+        SELECT pass_id, student_id, full_name, pass_taken_at, duration_minutes, due_at
+        FROM active_passes
+        WHERE pass_id IN (SELECT pass_id FROM active_pass_events WHERE version > ?)
+        ORDER BY pass_taken_at ASC, pass_id ASC
+        """,
+        (since,)
+    ).fetchall()
+    removed = cursor.execute(
+        "SELECT DISTINCT pass_id FROM active_pass_events "
+        "WHERE version > ? AND pass_id IS NOT NULL AND pass_id NOT IN (SELECT pass_id FROM active_passes)",
+        (since,)
+    ).fetchall()
+    return [dict(r) for r in rows], [row[0] for row in removed]
+
+# Open passes as the passes table sees them; active_passes should match exactly
+ACTIVE_PASSES_SOURCE_SQL = """
+    SELECT p.pass_id, p.student_id, s.first_name || ' ' || s.last_name AS full_name,
+           p.pass_taken_at, p.duration_minutes, p.due_at
+    FROM passes p
+    JOIN students s ON p.student_id = s.student_id
+    WHERE p.returned = 0
+"""
+
+def check_active_passes(cursor: sqlite3.Cursor) -> dict:
+    """
+    Compares active_passes with the open passes in the passes table.
+    Returns the pass IDs that are missing from, extra in, or differ in active_passes.
+    """
+    columns = "pass_id, student_id, full_name, pass_taken_at, duration_minutes, due_at"
+    expected = {tuple(row) for row in cursor.execute(ACTIVE_PASSES_SOURCE_SQL)}
+    actual = {tuple(row) for row in cursor.execute(f"SELECT {columns} FROM active_passes")}
+    expected_ids = {row[0] for row in expected}
+    actual_ids = {row[0] for row in actual}
+    return {
+        'missing': sorted(expected_ids - actual_ids),
+        'extra': sorted(actual_ids - expected_ids),
+        'mismatched': sorted({row[0] for row in expected ^ actual} & expected_ids & actual_ids),
+    }
+
+def rebuild_active_passes(cursor: sqlite3.Cursor) -> int:
+    """Repopulates active_passes from the passes table. Returns the number of open passes."""
+    cursor.execute("DELETE FROM active_passes")
+    cursor.execute(
+        "INSERT INTO active_passes (pass_id, student_id, full_name, pass_taken_at, duration_minutes, due_at) "
+        + ACTIVE_PASSES_SOURCE_SQL
+    )
+    return get_active_pass_count(cursor)
+
+def ensure_active_passes_consistent(cursor: sqlite3.Cursor) -> bool:
+    """Rebuilds active_passes if it has drifted from passes. Returns True if it was rebuilt."""
+    problems = check_active_passes(cursor)
+    if not any(problems.values()):
+        return False
+    print(f"Warning: active_passes out of sync with passes ({problems}); rebuilding.")
+    rebuild_active_passes(cursor)
+    return True
+
 def get_recent_passes_with_details(cursor: sqlite3.Cursor, limit: int = 50) -> list[dict]:
     """
     Gets recent passes with additional details for admin dashboard.
@@ -277,40 +926,329 @@ def get_recent_passes_with_details(cursor: sqlite3.Cursor, limit: int = 50) -> l
             p.pass_taken_at, 
             p.return_time,
             p.duration_minutes, 
+            p.due_at,
             p.returned,
             s.first_name, 
-            s.last_name
+            s.last_name,
+            COALESCE(p.return_time, ?) - p.pass_taken_at AS seconds_out
         FROM passes p
         JOIN students s ON p.student_id = s.student_id
         ORDER BY p.pass_taken_at DESC
         LIMIT ?
         """,
-        (limit,)
+        (now_epoch(), limit)
     ).fetchall()
     
     passes = []
-    now = datetime.now()
     
     for row in rows:
         pass_dict = dict(row)
-        
-        # Calculate time out information
-        start_time = datetime.fromisoformat(row['pass_taken_at'])
+        seconds_out = pass_dict.pop('seconds_out')
+        time_out = f"{seconds_out // 60}m {seconds_out % 60}s"
         
         if row['returned']:
-            # Completed pass - calculate actual time out
-            end_time = datetime.fromisoformat(row['return_time'])
-            actual_seconds = int((end_time - start_time).total_seconds())
-            pass_dict['actual_time_out'] = f"{actual_seconds // 60}m {actual_seconds % 60}s"
+            # Completed pass - actual time out
+            pass_dict['actual_time_out'] = time_out
         else:
-            # Active pass - calculate current time out
-            current_seconds = int((now - start_time).total_seconds())
-            pass_dict['current_time_out'] = f"{current_seconds // 60}m {current_seconds % 60}s"
+            # Active pass - current time out
+            pass_dict['current_time_out'] = time_out
         
         passes.append(pass_dict)
     
     return passes
 
+# Rollup buckets: the pass start time in server local time
+STATS_DAY_SQL = "strftime('%Y-%m-%d', {0}, 'unixepoch', 'localtime')"
+STATS_WEEKDAY_SQL = "CAST(strftime('%w', {0}, 'unixepoch', 'localtime') AS INTEGER)"
+STATS_HOUR_SQL = "CAST(strftime('%H', {0}, 'unixepoch', 'localtime') AS INTEGER)"
+WEEKDAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+def record_pass_stats(cursor: sqlite3.Cursor, student_id: str, pass_taken_at: int,
+                      seconds_out: int, overtime: bool) -> None:
+    """Adds one returned pass to the student-day, day and weekday-hour rollups."""
+    day = STATS_DAY_SQL.format('?')
+    cursor.execute(
+        f"INSERT INTO pass_stats_student_day (student_id, day, passes, seconds_out, overtime_passes) "
+        f"VALUES (?, {day}, 1, ?, ?) "
+        "ON CONFLICT (student_id, day) DO UPDATE SET passes = passes + 1, "
+        "seconds_out = seconds_out + excluded.seconds_out, "
+        "overtime_passes = overtime_passes + excluded.overtime_passes",
+        (student_id, pass_taken_at, seconds_out, int(overtime))
+    )
+    cursor.execute(
+        f"INSERT INTO pass_stats_day (day, passes, seconds_out, overtime_passes) "
+        f"VALUES ({day}, 1, ?, ?) "
+        "ON CONFLICT (day) DO UPDATE SET passes = passes + 1, "
+        "seconds_out = seconds_out + excluded.seconds_out, "
+        "overtime_passes = overtime_passes + excluded.overtime_passes",
+        (pass_taken_at, seconds_out, int(overtime))
+    )
+    cursor.execute(
+        f"INSERT INTO pass_stats_hour (weekday, hour, passes, seconds_out) "
+        f"VALUES ({STATS_WEEKDAY_SQL.format('?')}, {STATS_HOUR_SQL.format('?')}, 1, ?) "
+        "ON CONFLICT (weekday, hour) DO UPDATE SET passes = passes + 1, "
+        "seconds_out = seconds_out + excluded.seconds_out",
+        (pass_taken_at, pass_taken_at, seconds_out)
+    )
+
+def subtract_pass_stats(cursor: sqlite3.Cursor, condition: str, params: tuple) -> None:
+    """
+    Takes the returned passes matching condition (SQL over the passes table)
+    back out of the rollups. Call before deleting or archiving those passes.
+    """
+    day = STATS_DAY_SQL.format('pass_taken_at')
+    weekday, hour = STATS_WEEKDAY_SQL.format('pass_taken_at'), STATS_HOUR_SQL.format('pass_taken_at')
+    cursor.execute(
+        f"""
+        WITH removed AS (
+            SELECT student_id, {day} AS day, COUNT(*) AS passes, SUM(return_time - pass_taken_at) AS seconds_out,
+                   SUM(return_time > due_at) AS overtime_passes
+            FROM passes WHERE returned = 1 AND ({condition}) GROUP BY 1, 2
+        )
+        UPDATE pass_stats_student_day SET passes = pass_stats_student_day.passes - removed.passes,
+            seconds_out = pass_stats_student_day.seconds_out - removed.seconds_out,
+            overtime_passes = pass_stats_student_day.overtime_passes - removed.overtime_passes
+        FROM removed
+        WHERE pass_stats_student_day.student_id = removed.student_id AND pass_stats_student_day.day = removed.day
+        """,
+        params
+    )
+    cursor.execute(
+        f"""
+        WITH removed AS (
+            SELECT {day} AS day, COUNT(*) AS passes, SUM(return_time - pass_taken_at) AS seconds_out,
+                   SUM(return_time > due_at) AS overtime_passes
+            FROM passes WHERE returned = 1 AND ({condition}) GROUP BY 1
+        )
+        UPDATE pass_stats_day SET passes = pass_stats_day.passes - removed.passes,
+            seconds_out = pass_stats_day.seconds_out - removed.seconds_out,
+            overtime_passes = pass_stats_day.overtime_passes - removed.overtime_passes
+        FROM removed WHERE pass_stats_day.day = removed.day
+        """,
+        params
+    )
+    cursor.execute(
+        f"""
+        WITH removed AS (
+            SELECT {weekday} AS weekday, {hour} AS hour, COUNT(*) AS passes,
+                   SUM(return_time - pass_taken_at) AS seconds_out
+            FROM passes WHERE returned = 1 AND ({condition}) GROUP BY 1, 2
+        )
+        UPDATE pass_stats_hour SET passes = pass_stats_hour.passes - removed.passes,
+            seconds_out = pass_stats_hour.seconds_out - removed.seconds_out
+        FROM removed WHERE pass_stats_hour.weekday = removed.weekday AND pass_stats_hour.hour = removed.hour
+        """,
+        params
+    )
+    cursor.execute("DELETE FROM pass_stats_student_day WHERE passes <= 0")
+    cursor.execute("DELETE FROM pass_stats_day WHERE passes <= 0")
+    cursor.execute("DELETE FROM pass_stats_hour WHERE passes <= 0")
+
+def remove_student_pass_stats(cursor: sqlite3.Cursor, student_id: str) -> None:
+    """Takes a student's returned passes back out of the rollups. Reads only that student's passes."""
+    subtract_pass_stats(cursor, "student_id = ?", (student_id,))
+
+def rebuild_pass_stats(cursor: sqlite3.Cursor) -> int:
+    """
+    Recomputes every rollup from the returned passes (a full scan).
+    Returns the number of passes counted.
+    """
+    day = STATS_DAY_SQL.format('pass_taken_at')
+    weekday, hour = STATS_WEEKDAY_SQL.format('pass_taken_at'), STATS_HOUR_SQL.format('pass_taken_at')
+    cursor.execute("DELETE FROM pass_stats_student_day")
+    cursor.execute("DELETE FROM pass_stats_day")
+    cursor.execute("DELETE FROM pass_stats_hour")
+    cursor.execute(
+        "INSERT INTO pass_stats_student_day (student_id, day, passes, seconds_out, overtime_passes) "
+        f"SELECT student_id, {day}, COUNT(*), SUM(return_time - pass_taken_at), SUM(return_time > due_at) "
+        "FROM passes WHERE returned = 1 GROUP BY 1, 2"
+    )
+    cursor.execute(
+        "INSERT INTO pass_stats_day (day, passes, seconds_out, overtime_passes) "
+        "SELECT day, SUM(passes), SUM(seconds_out), SUM(overtime_passes) "
+        "FROM pass_stats_student_day GROUP BY day"
+    )
+    cursor.execute(
+        "INSERT INTO pass_stats_hour (weekday, hour, passes, seconds_out) "
+        f"SELECT {weekday}, {hour}, COUNT(*), SUM(return_time - pass_taken_at) "
+        "FROM passes WHERE returned = 1 GROUP BY 1, 2"
+    )
+    return cursor.execute("SELECT COALESCE(SUM(passes), 0) FROM pass_stats_day").fetchone()[0]
+
+def get_daily_stats(cursor: sqlite3.Cursor, first_day: str, last_day: str) -> list[dict]:
+    """Per-day totals for first_day..last_day (YYYY-MM-DD, inclusive) from the rollup."""
+    rows = cursor.execute(
+        "SELECT day, passes, seconds_out, overtime_passes FROM pass_stats_day "
+        "WHERE day BETWEEN ? AND ? ORDER BY day",
+        (first_day, last_day)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def get_hourly_stats(cursor: sqlite3.Cursor) -> list[dict]:
+    """Pass counts by weekday and hour (at most 168 rows)."""
+    rows = cursor.execute(
+        "SELECT weekday, hour, passes, seconds_out FROM pass_stats_hour ORDER BY weekday, hour"
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def get_student_stats(cursor: sqlite3.Cursor, student_id: str, first_day: str, last_day: str) -> dict:
+    """A student's per-day rollup rows for the range plus their all-time totals."""
+    days = cursor.execute(
+        "SELECT day, passes, seconds_out, overtime_passes FROM pass_stats_student_day "
+        "WHERE student_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+        (student_id, first_day, last_day)
+    ).fetchall()
+    totals = cursor.execute(
+        "SELECT total_passes, total_time_out FROM students WHERE student_id = ?",
+        (student_id,)
+    ).fetchone()
+    return {
+        'student_id': student_id,
+        'days': [dict(row) for row in days],
+        'total_passes': totals['total_passes'] if totals else 0,
+        'total_time_out': totals['total_time_out'] if totals else 0,
+    }
+
+def get_student_overtime_count(cursor: sqlite3.Cursor, student_id: str) -> int:
+    """How many of a student's returned passes ran over, from the rollups."""
+    return cursor.execute(
+        "SELECT COALESCE(SUM(overtime_passes), 0) FROM pass_stats_student_day WHERE student_id = ?",
+        (student_id,)
+    ).fetchone()[0]
+
+def get_stats_summary(cursor: sqlite3.Cursor, today: str, week_start: str) -> dict:
+    """Dashboard numbers, read from the rollups rather than the pass history."""
+    day_rows = get_daily_stats(cursor, week_start, today)
+    week_passes = sum(row['passes'] for row in day_rows)
+    week_seconds = sum(row['seconds_out'] for row in day_rows)
+    today_row = next((row for row in day_rows if row['day'] == today), None)
+
+    busiest = cursor.execute(
+        "SELECT weekday, hour, passes FROM pass_stats_hour ORDER BY passes DESC LIMIT 1"
+    ).fetchone()
+
+    return {
+        'today_passes': today_row['passes'] if today_row else 0,
+        'week_passes': week_passes,
+        'week_overtime_passes': sum(row['overtime_passes'] for row in day_rows),
+        'week_average_seconds_out': week_seconds // week_passes if week_passes else 0,
+        'busiest_hour': {
+            'weekday': WEEKDAY_NAMES[busiest['weekday']],
+            'hour': busiest['hour'],
+            'passes': busiest['passes'],
+        } if busiest else None,
+    }
+
+def encode_page_cursor(values: tuple) -> str:
+    """Turn the sort key of the last row on a page into an opaque cursor string."""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode('utf-8')).decode('ascii')
+
+def decode_page_cursor(page_cursor: str, size: int) -> tuple:
+    """Inverse of encode_page_cursor. Raises ValueError for a malformed cursor."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(page_cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid page cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid page cursor")
+    return tuple(values)
+
+# Pass rows for search_passes: alias p, with first_name/last_name available
+PASS_SOURCE_LIVE = "passes p JOIN students s ON p.student_id = s.student_id"
+
+def search_passes(cursor: sqlite3.Cursor, limit: int = 50, after: tuple = None, status: str = 'all',
+                  student_id: str = None, taken_from: int = None, taken_before: int = None,
+                  search: str = None, source: str = PASS_SOURCE_LIVE) -> tuple[list[dict], tuple | None]:
+    """
+    One page of pass history, newest first, for the admin API.
+    Pages are keyset-paginated on (pass_taken_at, pass_id): pass the key
+    returned for the previous page as after.
+
+    Args:
+        status: 'all', 'active' or 'completed'
+        taken_from / taken_before: epoch bounds on pass_taken_at (before is exclusive)
+        search: matched against student ID and full name
+        source: FROM clause to read; archive.PASS_SOURCE_HISTORY includes archived terms
+
+    Returns:
+        (passes, next_key) where next_key is None on the last page
+    """
+    conditions = []
+    params = []
+    if status == 'active':
+        conditions.append("p.returned = 0")
+    elif status == 'completed':
+        conditions.append("p.returned = 1")
+    if student_id:
+        conditions.append("p.student_id = ?")
+        params.append(student_id)
+    if taken_from is not None:
+        conditions.append("p.pass_taken_at >= ?")
+        params.append(taken_from)
+    if taken_before is not None:
+        conditions.append("p.pass_taken_at < ?")
+        params.append(taken_before)
+    if search:
+        conditions.append("(p.student_id LIKE ? OR (first_name || ' ' || last_name) LIKE ?)")
+        params.extend([f"%{search}%", f"%{search}%"])
+    if after is not None:
+        conditions.append("(p.pass_taken_at, p.pass_id) < (?, ?)")
+        params.extend(after)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = cursor.execute(
+        f"""
+        SELECT p.pass_id, p.student_id, p.pass_taken_at, p.return_time, p.duration_minutes,
+               p.due_at, p.returned, first_name, last_name
+        FROM {source}
+        {where}
+        ORDER BY p.pass_taken_at DESC, p.pass_id DESC
+        LIMIT ?
+        """,
+        params + [limit + 1]
+    ).fetchall()
+
+    passes = [dict(row) for row in rows[:limit]]
+    next_key = None
+    if len(rows) > limit:
+        next_key = (passes[-1]['pass_taken_at'], passes[-1]['pass_id'])
+    return passes, next_key
+
+def search_students(cursor: sqlite3.Cursor, limit: int = 50, after: tuple = None,
+                    search: str = None) -> tuple[list[dict], tuple | None]:
+    """
+    One page of students ordered by name, for the admin API.
+    Keyset-paginated on (last_name, first_name, student_id).
+    Returns (students, next_key) where next_key is None on the last page.
+    """
+    conditions = []
+    params = []
+    if search:
+        conditions.append("(student_id LIKE ? OR (first_name || ' ' || last_name) LIKE ?)")
+        params.extend([f"%{search}%", f"%{search}%"])
+    if after is not None:
+        conditions.append("(last_name, first_name, student_id) > (?, ?, ?)")
+        params.extend(after)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = cursor.execute(
+        f"""
+        SELECT student_id, first_name, last_name, total_passes, total_time_out
+        FROM students
+        {where}
+        ORDER BY last_name, first_name, student_id
+        LIMIT ?
+        """,
+        params + [limit + 1]
+    ).fetchall()
+
+    students = [dict(row) for row in rows[:limit]]
+    next_key = None
+    if len(rows) > limit:
+        last = students[-1]
+        next_key = (last['last_name'], last['first_name'], last['student_id'])
+    return students, next_key
+
 def add_or_update_students_from_csv_data(cursor: sqlite3.Cursor, students_data: list, update_existing: bool = False) -> dict:
     """
     Adds new students and optionally updates existing ones from CSV data.
@@ -359,6 +1297,81 @@ def add_or_update_students_from_csv_data(cursor: sqlite3.Cursor, students_data:
     
     return summary
 
+def bulk_import_students(cursor: sqlite3.Cursor, students_data: list, update_existing: bool = False) -> dict:
+    """
+    Set-based version of add_or_update_students_from_csv_data.
+    Stages the rows into a temp table with executemany, splits new from
+    existing rows with one join, then applies them with a single
+    INSERT ... ON CONFLICT DO UPDATE (or DO NOTHING).
+    If a student ID repeats in students_data, the last row wins when updating
+    and the first row wins otherwise.
+
+    Returns:
+        dict: Same summary shape as add_or_update_students_from_csv_data
+    """
+    summary = {
+        'added': 0,
+        'updated': 0,
+        'skipped': 0,
+        'errors': [],
+        'skipped_students': [],
+        'updated_students': []
+    }
+
+    cursor.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS import_students ("
+        "student_id TEXT PRIMARY KEY, first_name TEXT NOT NULL, last_name TEXT NOT NULL)"
+    )
+    cursor.execute("DELETE FROM import_students")
+    conflict = "REPLACE" if update_existing else "IGNORE"
+    cursor.executemany(
+        f"INSERT OR {conflict} INTO import_students (student_id, first_name, last_name) VALUES (?, ?, ?)",
+        students_data
+    )
+
+    staged_count = cursor.execute("SELECT COUNT(*) FROM import_students").fetchone()[0]
+    existing = cursor.execute(
+        "SELECT i.student_id, i.first_name, i.last_name "
+        "FROM import_students i JOIN students s ON s.student_id = i.student_id"
+    ).fetchall()
+    nonstandard = cursor.execute(
+        "SELECT COUNT(*) FROM import_students "
+        "WHERE student_id NOT IN (SELECT student_id FROM students) "
+        "AND (student_id GLOB '*[^0-9]*' OR length(student_id) > 10)"
+    ).fetchone()[0]
+
+    if update_existing:
+        on_conflict = "DO UPDATE SET first_name = excluded.first_name, last_name = excluded.last_name"
+    else:
+        on_conflict = "DO NOTHING"
+    # WHERE true keeps SQLite from reading ON CONFLICT as a join constraint
+    cursor.execute(
+        "INSERT INTO students (student_id, first_name, last_name) "
+        "SELECT student_id, first_name, last_name FROM import_students WHERE true "
+        f"ON CONFLICT (student_id) {on_conflict}"
+    )
+    if update_existing:
+        # Keep the names shown on the kiosk in step with renamed students
+        cursor.execute(
+            "UPDATE active_passes SET full_name = i.first_name || ' ' || i.last_name "
+            "FROM import_students i WHERE active_passes.student_id = i.student_id"
+        )
+    cursor.execute("DROP TABLE import_students")
+
+    labels = [f"{student_id} ({first_name} {last_name})" for student_id, first_name, last_name in existing]
+    summary['added'] = staged_count - len(existing)
+    if update_existing:
+        summary['updated'] = len(labels)
+        summary['updated_students'] = labels
+    else:
+        summary['skipped'] = len(labels)
+        summary['skipped_students'] = labels
+
+    if nonstandard:
+        print(f"Warning: {nonstandard} imported Student ID(s) may not be in the standard format.")
+
+    return summary
+
 def update_existing_student(cursor: sqlite3.Cursor, student_id: str, first_name: str, last_name: str) -> bool:
     """
     Updates an existing student's name information.
@@ -375,11 +1388,52 @@ def update_existing_student(cursor: sqlite3.Cursor, student_id: str, first_name:
             "UPDATE students SET first_name = ?, last_name = ? WHERE student_id = ?",
             (first_name, last_name, student_id)
         )
+        cursor.execute(
+            "UPDATE active_passes SET full_name = ? WHERE student_id = ?",
+            (f"{first_name} {last_name}", student_id)
+        )
         return True
         
     except Exception as e:
         print(f"Error updating student {student_id}: {e}")
         return False
 
+def enable_incremental_vacuum(connection: sqlite3.Connection) -> bool:
+    """
+    Switches an existing database to auto_vacuum=INCREMENTAL. This needs one
+    full VACUUM, which holds the write lock while the whole file is
+    rewritten, so run it with the kiosks idle (manage.py
+    enable-incremental-vacuum). Returns False if it was already enabled.
+    """
+    if connection.in_transaction:
+        connection.commit()
+    if connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    connection.executescript("PRAGMA auto_vacuum = INCREMENTAL; VACUUM;")
+    return True
+
+def incremental_vacuum(connection: sqlite3.Connection, batch_pages: int = VACUUM_BATCH_PAGES) -> int:
+    """
+    Returns free pages to the file system after large deletes, batch_pages
+    at a time so kiosk writes can run between the steps. Does nothing until
+    the database uses auto_vacuum=INCREMENTAL (see enable_incremental_vacuum).
+    Returns the number of pages released.
+    """
+    if connection.in_transaction:
+        connection.commit()
+    if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    released = 0
+    free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+    while free_pages:
+        # executescript steps the pragma to completion; execute() would release one page
+        connection.executescript(f"PRAGMA incremental_vacuum({min(free_pages, batch_pages)})")
+        remaining = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free_pages:
+            break
+        released += free_pages - remaining
+        free_pages = remaining
+    return released
+
 def save_data(connection: sqlite3.Connection) -> None:
     connection.commit()
\ No newline at end of file
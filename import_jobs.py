@@ -0,0 +1,208 @@
+# import_jobs.py
+"""
+Background roster imports.
+An uploaded CSV is spooled to a temp file during the request, then a worker
+thread decodes it as a stream, validates rows in chunks and commits each
+chunk in its own short transaction so kiosk writes can interleave.
+"""
+import csv
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import database
+
+# --- Import Configuration ---
+CHUNK_SIZE = 500            # rows validated and committed per transaction
+MAX_REPORTED_ERRORS = 100   # errors kept in the job status (all are counted)
+MAX_REPORTED_STUDENTS = 100 # updated/skipped names kept in the job status
+MAX_FINISHED_JOBS = 20      # finished jobs remembered for the status endpoint
+REQUIRED_COLUMNS = ('student_id', 'first_name', 'last_name')
+# ----------------------------
+
+class ImportJob:
+    """Progress and result of one roster import."""
+
+    def __init__(self, filename: str, update_existing: bool):
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename
+        self.update_existing = update_existing
+        self.status = 'queued'
+        self.message = ''
+        self.rows_processed = 0
+        self.added = 0
+        self.updated = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.updated_students = []
+        self.skipped_students = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def add_error(self, error: str) -> None:
+        with self._lock:
+            self.error_count += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append(error)
+
+    def add_summary(self, rows: int, summary: dict) -> None:
+        with self._lock:
+            self.rows_processed += rows
+            self.added += summary['added']
+            self.updated += summary['updated']
+            self.skipped += summary['skipped']
+            for error in summary['errors']:
+                self.error_count += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append(error)
+            room = MAX_REPORTED_STUDENTS - len(self.updated_students)
+            self.updated_students.extend(summary['updated_students'][:max(room, 0)])
+            room = MAX_REPORTED_STUDENTS - len(self.skipped_students)
+            self.skipped_students.extend(summary['skipped_students'][:max(room, 0)])
+
+    def start(self) -> None:
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+
+    def finish(self, status: str, message: str) -> None:
+        with self._lock:
+            self.status = status
+            self.message = message
+            self.finished_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            return {
+                'job_id': self.job_id,
+                'filename': self.filename,
+                'status': self.status,
+                'message': self.message,
+                'rows_processed': self.rows_processed,
+                'added': self.added,
+                'updated': self.updated,
+                'skipped': self.skipped,
+                'error_count': self.error_count,
+                'errors': list(self.errors),
+                'updated_students': list(self.updated_students),
+                'skipped_students': list(self.skipped_students),
+                'elapsed_seconds': round(elapsed, 3),
+                'rows_per_second': round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0,
+            }
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def get_job(job_id: str) -> ImportJob | None:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def _register_job(job: ImportJob) -> None:
+    with _jobs_lock:
+        finished = sorted((j for j in _jobs.values() if j.finished), key=lambda j: j.created_at)
+        for old_job in finished[:max(len(finished) - MAX_FINISHED_JOBS + 1, 0)]:
+            del _jobs[old_job.job_id]
+        _jobs[job.job_id] = job
+
+def start_import(pool: database.ConnectionPool, upload_stream, filename: str,
+                 update_existing: bool = False, chunk_size: int = CHUNK_SIZE, on_finish=None) -> ImportJob:
+    """
+    Spool the upload to disk and import it on a background thread.
+    Returns the job immediately; poll job.to_dict() for progress.
+    on_finish, if given, is called with the job on that thread once it has finished.
+    """
+    spool = tempfile.NamedTemporaryFile(prefix="roster_import_", suffix=".csv", delete=False)
+    try:
+        shutil.copyfileobj(upload_stream, spool)
+    finally:
+        spool.close()
+
+    job = ImportJob(filename, update_existing)
+    _register_job(job)
+    worker = threading.Thread(
+        target=_run_import, args=(job, pool, spool.name, chunk_size, on_finish),
+        name=f"roster-import-{job.job_id[:8]}", daemon=True
+    )
+    worker.start()
+    return job
+
+def _run_import(job: ImportJob, pool: database.ConnectionPool, path: str, chunk_size: int,
+                on_finish=None) -> None:
+    try:
+        _import_file(job, pool, path, chunk_size)
+    finally:
+        if on_finish is not None:
+            try:
+                on_finish(job)
+            except Exception as e:
+                print(f"[WARN] Import {job.job_id} finished, but its callback failed: {e}")
+
+def _import_file(job: ImportJob, pool: database.ConnectionPool, path: str, chunk_size: int) -> None:
+    job.start()
+    try:
+        with open(path, 'rb') as raw:
+            text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+            import_rows(job, pool, csv.DictReader(text), chunk_size)
+    except UnicodeDecodeError:
+        job.finish('failed', 'File is not valid UTF-8 text')
+        return
+    except Exception as e:
+        job.finish('failed', f'Error processing file: {e}')
+        return
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    if job.rows_processed == 0:
+        job.finish('failed', 'No valid data found in CSV')
+        return
+
+    message = f"Added: {job.added}, Updated: {job.updated}, Skipped: {job.skipped}"
+    if job.error_count:
+        message += f", Errors: {job.error_count}"
+    job.finish('completed', message)
+
+def import_rows(job: ImportJob, pool: database.ConnectionPool, reader: csv.DictReader, chunk_size: int) -> None:
+    """Validate rows from the reader and import them chunk by chunk."""
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+
+    chunk = []
+    with pool.connection() as con:
+        for row_number, row in enumerate(reader, start=1):
+            student_id = (row.get('student_id') or '').strip()
+            first_name = (row.get('first_name') or '').strip()
+            last_name = (row.get('last_name') or '').strip()
+
+            if not (student_id and first_name and last_name):
+                job.add_error(f"Row {row_number}: student_id, first_name and last_name are required")
+                continue
+
+            chunk.append((student_id, first_name, last_name))
+            if len(chunk) >= chunk_size:
+                _import_chunk(job, pool, con, chunk)
+                chunk = []
+
+        if chunk:
+            _import_chunk(job, pool, con, chunk)
+
+def _import_chunk(job: ImportJob, pool: database.ConnectionPool, con, chunk: list) -> None:
+    with pool.transaction(con) as cur:
+        summary = database.bulk_import_students(cur, chunk, job.update_existing)
+    pool.students.invalidate()
+    job.add_summary(len(chunk), summary)
@@ -0,0 +1,107 @@
+# live_events.py
+"""
+Server-Sent Events for live pass updates.
+Events are published once their write has committed, in commit order
+(from the writer thread's after_commit callbacks); every open /api/stream
+response has its own bounded queue and forwards events to its browser.
+Event IDs are the active pass list versions the writes produced, so a
+reconnecting client's Last-Event-ID can be replayed from the
+active_pass_events log.
+"""
+import json
+import queue
+import threading
+
+# --- Stream Configuration ---
+KEEPALIVE_SECONDS = 15      # comment line sent on idle streams so dead clients are noticed
+RETRY_MS = 3000             # how long browsers wait before reconnecting
+SUBSCRIBER_QUEUE_SIZE = 100 # events buffered per client before it is dropped
+MAX_SUBSCRIBERS = 50        # streams served at once; further clients fall back to polling
+# ----------------------------
+
+def format_event(event: str, data: dict, event_id: int = None) -> str:
+    """One SSE message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+class Subscription:
+    """One connected stream."""
+
+    def __init__(self, broker: 'EventBroker'):
+        self.broker = broker
+        self.events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+class EventBroker:
+    """Fans published events out to every subscribed stream."""
+
+    def __init__(self, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._published = 0
+
+    def subscribe(self) -> Subscription | None:
+        """A new subscription, or None when the stream limit is reached."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event: str, data: dict, event_id: int) -> None:
+        """Queue an event for every stream; a client too slow to keep up is dropped."""
+        message = (event_id, format_event(event, data, event_id))
+        with self._lock:
+            self._published += 1
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.events.put_nowait(message)
+            except queue.Full:
+                # The client reconnects and catches up from its Last-Event-ID
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+    @property
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subscribers)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'published': self._published}
+
+def stream(subscription: Subscription, initial: list[str], after_id: int):
+    """
+    Generator for a text/event-stream response: the initial (replay)
+    messages, then published events newer than after_id.
+    """
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for message in initial:
+            yield message
+        while not subscription.overflowed:
+            try:
+                event_id, message = subscription.events.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            # Already covered by the replay
+            if event_id is not None and event_id <= after_id:
+                continue
+            yield message
+    finally:
+        subscription.close()
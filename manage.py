@@ -0,0 +1,109 @@
+# manage.py
+"""
+Maintenance commands for the hall pass database.
+Run with the Flask app stopped or running; every command uses its own
+connection and short transactions.
+
+    python manage.py rebuild-stats
+    python manage.py archive --term "2024-25" --before 2025-07-01
+    python manage.py enable-incremental-vacuum
+    python manage.py backup
+    python manage.py verify-backup [--file PATH]
+    python manage.py restore-backup [--file PATH | --at "YYYY-MM-DD HH:MM"]
+"""
+import argparse
+from datetime import datetime
+import archive
+import backup
+import database
+
+def rebuild_stats(args) -> None:
+    pool = database.ConnectionPool(args.db)
+    try:
+        with pool.connection() as con:
+            database.init_database(database.create_cursor(con))
+            database.save_data(con)
+            with pool.transaction(con) as cur:
+                counted = database.rebuild_pass_stats(cur)
+        print(f"Usage stats rebuilt from {counted} returned passes.")
+    finally:
+        pool.close_all()
+
+def archive_term(args) -> None:
+    before = int(datetime.strptime(args.before, '%Y-%m-%d').timestamp())
+    pool = database.ConnectionPool(args.db)
+    try:
+        with pool.connection() as con:
+            database.init_database(database.create_cursor(con))
+            database.save_data(con)
+        archive.archive_term(pool, args.term, before)
+    finally:
+        pool.close_all()
+
+def enable_incremental_vacuum(args) -> None:
+    # A one-time full VACUUM; archives then only release free pages step by step
+    con = database.create_connection(args.db)
+    try:
+        database.configure_connection(con)
+        if database.enable_incremental_vacuum(con):
+            print("Incremental vacuum enabled.")
+        else:
+            print("Incremental vacuum was already enabled.")
+    finally:
+        con.close()
+
+def backup_now(args) -> None:
+    backup.backup_database(args.db)
+
+def verify_backups(args) -> None:
+    paths = [args.file] if args.file else backup.list_backups(args.db)
+    if not paths:
+        print("No backups found.")
+    for path in paths:
+        ok, message = backup.verify_backup(path)
+        print(f"{'OK  ' if ok else 'FAIL'} {path}: {message}")
+
+def restore(args) -> None:
+    path = args.file
+    if path is None:
+        at = datetime.strptime(args.at, '%Y-%m-%d %H:%M') if args.at else None
+        path = backup.find_backup(args.db, at)
+        if path is None:
+            print("No backup found for that time.")
+            return
+    backup.restore_backup(path, args.db)
+
+def main():
+    parser = argparse.ArgumentParser(description="Hall pass database maintenance")
+    parser.add_argument("--db", default=database.DB_PATH, help="Path to the database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-stats", help="Recompute the usage rollups from pass history")
+    rebuild.set_defaults(handler=rebuild_stats)
+
+    archive_cmd = commands.add_parser("archive", help="Move returned passes from before a date into a term archive")
+    archive_cmd.add_argument("--term", required=True, help="Term name, used for the archive file name")
+    archive_cmd.add_argument("--before", required=True, help="Archive passes taken before this date (YYYY-MM-DD)")
+    archive_cmd.set_defaults(handler=archive_term)
+
+    vacuum_cmd = commands.add_parser("enable-incremental-vacuum",
+                                     help="Rewrite the database once so archives can release space (stop the kiosks first)")
+    vacuum_cmd.set_defaults(handler=enable_incremental_vacuum)
+
+    backup_cmd = commands.add_parser("backup", help="Take an online backup into backups/")
+    backup_cmd.set_defaults(handler=backup_now)
+
+    verify_cmd = commands.add_parser("verify-backup", help="Check backup checksums and integrity")
+    verify_cmd.add_argument("--file", help="Backup to check (default: all)")
+    verify_cmd.set_defaults(handler=verify_backups)
+
+    restore_cmd = commands.add_parser("restore-backup", help="Replace the database with a backup (stop the app first)")
+    restore_cmd.add_argument("--file", help="Backup to restore")
+    restore_cmd.add_argument("--at", help="Restore the newest backup taken at or before this time (YYYY-MM-DD HH:MM)")
+    restore_cmd.set_defaults(handler=restore)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
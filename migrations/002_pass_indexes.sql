@@ -0,0 +1,16 @@
+-- Indexes for the hot pass queries in database.py.
+
+-- return_active_pass_for_student: WHERE student_id = ? AND returned = 0
+-- ORDER BY pass_taken_at DESC. Covering, since pass_id is the rowid.
+CREATE INDEX IF NOT EXISTS idx_passes_student_returned
+    ON passes (student_id, returned, pass_taken_at);
+
+-- get_active_pass_count / get_active_passes: only the handful of open
+-- passes are indexed, so the kiosk poll never walks the history.
+CREATE INDEX IF NOT EXISTS idx_passes_active
+    ON passes (pass_taken_at, student_id, duration_minutes)
+    WHERE returned = 0;
+
+-- get_recent_passes_with_details: ORDER BY pass_taken_at DESC LIMIT ?
+CREATE INDEX IF NOT EXISTS idx_passes_taken_at
+    ON passes (pass_taken_at);
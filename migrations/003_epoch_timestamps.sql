@@ -0,0 +1,39 @@
+-- Store pass times as integer epoch seconds and keep the deadline in due_at.
+-- Existing ISO strings were written with datetime.now(), i.e. local time,
+-- hence the 'utc' modifier. The table is rebuilt so the columns get
+-- INTEGER affinity (a TEXT column would turn the numbers back into text).
+
+CREATE TABLE passes_new (
+    pass_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL,
+    pass_taken_at INTEGER NOT NULL,
+    return_time INTEGER,
+    duration_minutes INTEGER NOT NULL,
+    due_at INTEGER NOT NULL,
+    returned INTEGER DEFAULT 0,
+    FOREIGN KEY (student_id) REFERENCES students (student_id)
+);
+
+INSERT INTO passes_new (pass_id, student_id, pass_taken_at, return_time, duration_minutes, due_at, returned)
+SELECT
+    pass_id,
+    student_id,
+    CAST(strftime('%s', pass_taken_at, 'utc') AS INTEGER),
+    CAST(strftime('%s', return_time, 'utc') AS INTEGER),
+    duration_minutes,
+    CAST(strftime('%s', pass_taken_at, 'utc') AS INTEGER) + duration_minutes * 60,
+    returned
+FROM passes;
+
+DROP TABLE passes;
+ALTER TABLE passes_new RENAME TO passes;
+
+CREATE INDEX idx_passes_student_returned
+    ON passes (student_id, returned, pass_taken_at);
+
+CREATE INDEX idx_passes_active
+    ON passes (pass_taken_at, student_id, due_at)
+    WHERE returned = 0;
+
+CREATE INDEX idx_passes_taken_at
+    ON passes (pass_taken_at);
@@ -0,0 +1,3 @@
+-- Keyset pagination of the admin student list orders by name.
+CREATE INDEX IF NOT EXISTS idx_students_name
+    ON students (last_name, first_name, student_id);
@@ -0,0 +1,22 @@
+-- Open passes only, with the student's name denormalized, so the kiosk
+-- poll reads a handful of rows instead of joining the pass history.
+-- Maintained by database.py in the same transaction as passes; see
+-- check_active_passes / rebuild_active_passes.
+
+CREATE TABLE IF NOT EXISTS active_passes (
+    pass_id INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    pass_taken_at INTEGER NOT NULL,
+    duration_minutes INTEGER NOT NULL,
+    due_at INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_active_passes_student
+    ON active_passes (student_id, pass_taken_at);
+
+INSERT INTO active_passes (pass_id, student_id, full_name, pass_taken_at, duration_minutes, due_at)
+SELECT p.pass_id, p.student_id, s.first_name || ' ' || s.last_name, p.pass_taken_at, p.duration_minutes, p.due_at
+FROM passes p
+JOIN students s ON p.student_id = s.student_id
+WHERE p.returned = 0;
@@ -0,0 +1,46 @@
+-- Usage rollups, bumped by database.record_pass_stats when a pass is
+-- returned and rebuilt from history by database.rebuild_pass_stats.
+-- Buckets use the pass start time in server local time.
+
+CREATE TABLE IF NOT EXISTS pass_stats_student_day (
+    student_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    passes INTEGER NOT NULL DEFAULT 0,
+    seconds_out INTEGER NOT NULL DEFAULT 0,
+    overtime_passes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS pass_stats_day (
+    day TEXT PRIMARY KEY,
+    passes INTEGER NOT NULL DEFAULT 0,
+    seconds_out INTEGER NOT NULL DEFAULT 0,
+    overtime_passes INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- weekday: 0 = Sunday .. 6 = Saturday, hour: 0 .. 23
+CREATE TABLE IF NOT EXISTS pass_stats_hour (
+    weekday INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    passes INTEGER NOT NULL DEFAULT 0,
+    seconds_out INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (weekday, hour)
+) WITHOUT ROWID;
+
+INSERT INTO pass_stats_student_day (student_id, day, passes, seconds_out, overtime_passes)
+SELECT student_id, strftime('%Y-%m-%d', pass_taken_at, 'unixepoch', 'localtime'),
+       COUNT(*), SUM(return_time - pass_taken_at), SUM(return_time > due_at)
+FROM passes WHERE returned = 1
+GROUP BY 1, 2;
+
+INSERT INTO pass_stats_day (day, passes, seconds_out, overtime_passes)
+SELECT day, SUM(passes), SUM(seconds_out), SUM(overtime_passes)
+FROM pass_stats_student_day
+GROUP BY day;
+
+INSERT INTO pass_stats_hour (weekday, hour, passes, seconds_out)
+SELECT CAST(strftime('%w', pass_taken_at, 'unixepoch', 'localtime') AS INTEGER),
+       CAST(strftime('%H', pass_taken_at, 'unixepoch', 'localtime') AS INTEGER),
+       COUNT(*), SUM(return_time - pass_taken_at)
+FROM passes WHERE returned = 1
+GROUP BY 1, 2;
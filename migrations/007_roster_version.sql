@@ -0,0 +1,27 @@
+-- A counter bumped on every change to the roster, so the in-memory
+-- student directory (database.StudentDirectory) can tell whether it is
+-- stale with a one-row read. Triggers keep it right for every writer,
+-- including other processes and the CSV import. Pass counters on the
+-- students table (total_passes, total_time_out) do not bump it.
+
+CREATE TABLE IF NOT EXISTS roster_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO roster_version (id, version) VALUES (1, 1);
+
+CREATE TRIGGER IF NOT EXISTS roster_version_insert AFTER INSERT ON students
+BEGIN
+    UPDATE roster_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS roster_version_update AFTER UPDATE OF student_id, first_name, last_name ON students
+BEGIN
+    UPDATE roster_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS roster_version_delete AFTER DELETE ON students
+BEGIN
+    UPDATE roster_version SET version = version + 1 WHERE id = 1;
+END
@@ -0,0 +1,41 @@
+-- Change log for the kiosk's active pass list. Every start, return or
+-- rename of an open pass and every capacity setting change appends an
+-- event; the newest event's version is the list's version. /api/active_passes
+-- uses it as its ETag and to answer ?since=<version> with just the changes.
+-- Only the most recent events are kept (see the prune trigger).
+
+CREATE TABLE IF NOT EXISTS active_pass_events (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    pass_id INTEGER,        -- NULL for capacity setting changes
+    change TEXT NOT NULL    -- 'start', 'return', 'update' or 'capacity'
+);
+
+INSERT INTO active_pass_events (pass_id, change) VALUES (NULL, 'capacity');
+
+CREATE TRIGGER IF NOT EXISTS active_pass_events_start AFTER INSERT ON active_passes
+BEGIN
+    INSERT INTO active_pass_events (pass_id, change) VALUES (NEW.pass_id, 'start');
+END;
+
+CREATE TRIGGER IF NOT EXISTS active_pass_events_return AFTER DELETE ON active_passes
+BEGIN
+    INSERT INTO active_pass_events (pass_id, change) VALUES (OLD.pass_id, 'return');
+END;
+
+CREATE TRIGGER IF NOT EXISTS active_pass_events_update AFTER UPDATE ON active_passes
+BEGIN
+    INSERT INTO active_pass_events (pass_id, change) VALUES (NEW.pass_id, 'update');
+END;
+
+CREATE TRIGGER IF NOT EXISTS active_pass_events_capacity AFTER UPDATE OF setting_value ON settings
+WHEN NEW.setting_key IN ('max_students_out', 'enable_capacity_limit')
+BEGIN
+    INSERT INTO active_pass_events (pass_id, change) VALUES (NULL, 'capacity');
+END;
+
+-- Keep roughly the last 1000 events; older ?since versions get a full list
+CREATE TRIGGER IF NOT EXISTS active_pass_events_prune AFTER INSERT ON active_pass_events
+WHEN NEW.version % 1000 = 0
+BEGIN
+    DELETE FROM active_pass_events WHERE version <= NEW.version - 1000;
+END
@@ -0,0 +1,26 @@
+-- Slip print jobs for the background spooler (print_spooler.py). Jobs are
+-- written before they are printed, so a slow or missing printer never holds
+-- up a scan and queued slips survive a restart. Finished jobs are kept for
+-- a week so the admin can look them up or reprint them.
+
+CREATE TABLE IF NOT EXISTS print_jobs (
+    job_id INTEGER PRIMARY KEY,
+    job_type TEXT NOT NULL,             -- 'pass_slip'
+    payload TEXT NOT NULL,              -- JSON keyword arguments for the job's print function
+    status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'printing', 'printed' or 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at INTEGER NOT NULL,
+    next_attempt_at INTEGER NOT NULL,
+    printed_at INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_print_jobs_pending ON print_jobs(next_attempt_at)
+WHERE status IN ('queued', 'printing');
+
+CREATE TRIGGER IF NOT EXISTS print_jobs_prune AFTER INSERT ON print_jobs
+WHEN NEW.job_id % 100 = 0
+BEGIN
+    DELETE FROM print_jobs
+    WHERE status IN ('printed', 'failed') AND created_at < NEW.created_at - 7 * 86400;
+END
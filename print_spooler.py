@@ -0,0 +1,246 @@
+# print_spooler.py
+"""
+Background printing of pass slips.
+A scan records a print job in the print_jobs table and returns straight
+away; worker threads print the jobs in order, one worker per printer so
+every printer in the pool can be kept busy. A job whose print
+function fails is retried with exponential backoff and marked failed after
+PRINT_MAX_ATTEMPTS tries. Jobs live in the database, so slips still queued
+when the app stops are printed after it restarts, and any job can be
+reprinted as a new job.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+import database
+import write_queue
+
+# --- Spooler Configuration ---
+PRINT_QUEUE_SIZE = 100          # job IDs waiting in memory; overflow is picked up from the table
+PRINT_MAX_ATTEMPTS = 5          # tries before a job is marked failed
+PRINT_RETRY_BASE_SECONDS = 2    # wait before the first retry, doubled after each failure
+PRINT_RETRY_MAX_SECONDS = 60
+PRINT_POLL_SECONDS = 1.0        # how often the workers look for due retries and overflow
+PRINT_WORKERS = 1               # jobs printed at once; the app uses one per configured printer
+# -----------------------------
+
+# Matches the partial index on print_jobs
+PENDING_STATUSES = "('queued', 'printing')"
+
+def insert_print_job(cursor: sqlite3.Cursor, job_type: str, payload: dict) -> int:
+    """Records a queued job. Returns its job_id."""
+    now = database.now_epoch()
+    return cursor.execute(
+        "INSERT INTO print_jobs (job_type, payload, created_at, next_attempt_at) VALUES (?, ?, ?, ?) RETURNING job_id",
+        (job_type, json.dumps(payload), now, now)
+    ).fetchone()[0]
+
+def reprint_print_job(cursor: sqlite3.Cursor, job_id: int) -> int | None:
+    """Queues a copy of an existing job. Returns the new job_id, or None if there is no such job."""
+    now = database.now_epoch()
+    row = cursor.execute(
+        "INSERT INTO print_jobs (job_type, payload, created_at, next_attempt_at) "
+        "SELECT job_type, payload, ?, ? FROM print_jobs WHERE job_id = ? RETURNING job_id",
+        (now, now, job_id)
+    ).fetchone()
+    return row[0] if row else None
+
+def get_print_job(cursor: sqlite3.Cursor, job_id: int) -> dict | None:
+    row = cursor.execute(
+        "SELECT job_id, job_type, payload, status, attempts, last_error, created_at, next_attempt_at, printed_at "
+        "FROM print_jobs WHERE job_id = ?",
+        (job_id,)
+    ).fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    return job
+
+def get_due_print_jobs(cursor: sqlite3.Cursor, limit: int) -> list[int]:
+    """IDs of pending jobs whose next attempt is due, oldest first."""
+    rows = cursor.execute(
+        f"SELECT job_id FROM print_jobs WHERE status IN {PENDING_STATUSES} AND next_attempt_at <= ? "
+        "ORDER BY job_id LIMIT ?",
+        (database.now_epoch(), limit)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+def requeue_interrupted_print_jobs(cursor: sqlite3.Cursor) -> int:
+    """Jobs left 'printing' when the app stopped are queued again. Returns how many."""
+    return cursor.execute("UPDATE print_jobs SET status = 'queued' WHERE status = 'printing'").rowcount
+
+def claim_print_job(cursor: sqlite3.Cursor, job_id: int) -> dict | None:
+    """Marks a due job as printing and counts the attempt; None if it is not queued or not due."""
+    row = cursor.execute(
+        "UPDATE print_jobs SET status = 'printing', attempts = attempts + 1 "
+        "WHERE job_id = ? AND status = 'queued' AND next_attempt_at <= ? "
+        "RETURNING job_type, payload, attempts",
+        (job_id, database.now_epoch())
+    ).fetchone()
+    if not row:
+        return None
+    return {'job_type': row['job_type'], 'payload': json.loads(row['payload']), 'attempts': row['attempts']}
+
+def finish_print_job(cursor: sqlite3.Cursor, job_id: int, error: str | None, attempts: int,
+                     max_attempts: int = PRINT_MAX_ATTEMPTS, retry_base: float = PRINT_RETRY_BASE_SECONDS) -> str:
+    """Records the outcome of an attempt. Returns the job's new status."""
+    now = database.now_epoch()
+    if error is None:
+        cursor.execute(
+            "UPDATE print_jobs SET status = 'printed', printed_at = ?, last_error = NULL WHERE job_id = ?",
+            (now, job_id)
+        )
+        return 'printed'
+    if attempts >= max_attempts:
+        cursor.execute("UPDATE print_jobs SET status = 'failed', last_error = ? WHERE job_id = ?", (error, job_id))
+        return 'failed'
+    delay = min(retry_base * 2 ** (attempts - 1), PRINT_RETRY_MAX_SECONDS)
+    cursor.execute(
+        "UPDATE print_jobs SET status = 'queued', last_error = ?, next_attempt_at = ? WHERE job_id = ?",
+        (error, now + int(delay), job_id)
+    )
+    return 'queued'
+
+class PrintSpooler:
+    """
+    Prints queued jobs on worker threads. `handlers` maps a job type to its
+    print function, which is called with the job's payload as keyword
+    arguments and returns True once the slip is printed.
+    """
+
+    def __init__(self, pool: database.ConnectionPool, writer: write_queue.WriteQueue, handlers: dict,
+                 queue_size: int = PRINT_QUEUE_SIZE, max_attempts: int = PRINT_MAX_ATTEMPTS,
+                 retry_base: float = PRINT_RETRY_BASE_SECONDS, poll_seconds: float = PRINT_POLL_SECONDS,
+                 workers: int = PRINT_WORKERS):
+        self.pool = pool
+        self.writer = writer
+        self.handlers = handlers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_seconds = poll_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'printed': 0, 'retried': 0, 'failed': 0, 'overflowed': 0}
+        self._next_load = 0.0
+        # Before any worker starts, so a job another worker is printing is never reclaimed
+        writer.run(requeue_interrupted_print_jobs)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"print-spooler-{index}", daemon=True)
+            for index in range(max(workers, 1))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job_type: str, payload: dict) -> int:
+        """Queue a job; returns its job_id as soon as it is recorded."""
+        job_id = self.writer.run(insert_print_job, job_type, payload)
+        self._count('submitted')
+        self._wake(job_id)
+        return job_id
+
+    def reprint(self, job_id: int) -> int | None:
+        """Queue a copy of a job; returns the new job_id (None if the job does not exist)."""
+        new_job_id = self.writer.run(reprint_print_job, job_id)
+        if new_job_id is not None:
+            self._count('submitted')
+            self._wake(new_job_id)
+        return new_job_id
+
+    def get_job(self, job_id: int) -> dict | None:
+        with self.pool.connection() as con:
+            return get_print_job(database.create_cursor(con), job_id)
+
+    def _wake(self, job_id: int) -> None:
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            # Still recorded as queued; the worker finds it on its next poll
+            self._count('overflowed')
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Retries, overflow and jobs left over from before a restart are
+            # only in the table. Look for them on a timer rather than when the
+            # queue runs dry, so a steady stream of new slips cannot starve them
+            if self._load_is_due():
+                self._load_due()
+            try:
+                job_id = self._queue.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                continue
+            if job_id is None:
+                break
+            try:
+                self._print(job_id)
+            except Exception as e:
+                print(f"[WARN] Print job {job_id} could not be processed: {e}")
+
+    def _load_is_due(self) -> bool:
+        # One worker loads per interval; the first check after starting always does
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_load:
+                return False
+            self._next_load = now + self.poll_seconds
+            return True
+
+    def _load_due(self) -> None:
+        room = self._queue.maxsize - self._queue.qsize()
+        if room <= 0:
+            return
+        try:
+            with self.pool.connection() as con:
+                due = get_due_print_jobs(database.create_cursor(con), room)
+        except sqlite3.Error as e:
+            print(f"[WARN] Could not read print jobs: {e}")
+            return
+        for job_id in due:
+            self._wake(job_id)
+
+    def _print(self, job_id: int) -> None:
+        # A job can be queued twice (e.g. by submit and a poll, or by two
+        # workers' polls); only one claim succeeds
+        job = self.writer.run(claim_print_job, job_id)
+        if job is None:
+            return
+        handler = self.handlers.get(job['job_type'])
+        error = None
+        if handler is None:
+            error = f"No printer handler for job type '{job['job_type']}'"
+        else:
+            try:
+                if not handler(**job['payload']):
+                    error = "Printer unavailable or print failed"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+        status = self.writer.run(finish_print_job, job_id, error, job['attempts'],
+                                 self.max_attempts, self.retry_base)
+        self._count({'printed': 'printed', 'failed': 'failed', 'queued': 'retried'}[status])
+        if status == 'failed':
+            print(f"[ERROR] Print job {job_id} failed after {job['attempts']} attempts: {error}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['waiting'] = self._queue.qsize()
+        return stats
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the workers after their current jobs; unprinted jobs stay queued in the table."""
+        self._stop.set()
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout)
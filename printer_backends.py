@@ -0,0 +1,75 @@
+# printer_backends.py
+"""
+Stand-in printers for running the printing path without hardware.
+"capture" records the raw ESC/POS bytes of every write; "simulated" does
+the same but takes time like a real printer (a fixed cost per USB write
+plus the time to print the bytes) and can fail at random, for testing
+retries and measuring throughput. Select one with
+printer_handler.PRINTER_BACKEND.
+"""
+import random
+import threading
+import time
+from escpos.printer import Dummy
+import slip_templates
+
+# --- Simulated Printer Configuration ---
+SIMULATED_WRITE_SECONDS = 0.002         # fixed cost of one USB transfer
+SIMULATED_BYTES_PER_SECOND = 20000      # how fast the printer takes data (raster barcodes are the bulk)
+SIMULATED_FAILURE_RATE = 0.0            # chance that a write raises, like a jam or a pulled cable
+SIMULATED_CONNECT_FAILURE_RATE = 0.0    # chance that opening the printer fails
+# ---------------------------------------
+
+class CapturePrinter(Dummy):
+    """Records every write; `writes` holds each transfer, `output` all bytes so far."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('profile', slip_templates.PRINTER_PROFILE)
+        super().__init__(*args, **kwargs)
+        self.writes = []
+        self._lock = threading.Lock()
+
+    def _raw(self, msg):
+        with self._lock:
+            self.writes.append(bytes(msg))
+        super()._raw(msg)
+
+    def healthy(self) -> bool:
+        return True
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {'writes': len(self.writes), 'bytes': sum(len(write) for write in self.writes)}
+
+class SimulatedPrinter(CapturePrinter):
+    """A CapturePrinter that is as slow, and optionally as unreliable, as a real one."""
+
+    def __init__(self, write_seconds: float = SIMULATED_WRITE_SECONDS,
+                 bytes_per_second: float = SIMULATED_BYTES_PER_SECOND,
+                 failure_rate: float = SIMULATED_FAILURE_RATE,
+                 connect_failure_rate: float = SIMULATED_CONNECT_FAILURE_RATE, seed: int = None):
+        self.write_seconds = write_seconds
+        self.bytes_per_second = bytes_per_second
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        if self._random.random() < connect_failure_rate:
+            raise OSError("Simulated printer not found")
+        super().__init__()
+
+    def _raw(self, msg):
+        time.sleep(self.write_seconds + (len(msg) / self.bytes_per_second if self.bytes_per_second else 0))
+        if self._random.random() < self.failure_rate:
+            raise OSError("Simulated printer write failed")
+        super()._raw(msg)
+
+BACKENDS = {
+    'capture': CapturePrinter,
+    'simulated': SimulatedPrinter,
+}
+
+def open_backend(name: str):
+    """A new stand-in printer of the named backend."""
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown printer backend '{name}'") from None
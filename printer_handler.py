@@ -1,77 +1,329 @@
 # printer_handler.py
-import os
-from datetime import datetime
-from barcode import Code128
-from barcode.writer import ImageWriter
-from escpos.printer import Usb
+import errno
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from escpos.printer import File, Network, Usb
+import printer_backends
+import slip_templates
 
 # --- Hardware Configuration ---
 # Find these values by running usb_detect.py from the original project
 VENDOR_ID = 0x0fe6
 PRODUCT_ID = 0x811e
+
+# "usb" for the real printer; "capture" or "simulated" (see printer_backends.py)
+# to run the kiosk and benchmarks without one
+PRINTER_BACKEND = "usb"
+
+# Every printer slips can go to. Each needs a name and a backend:
+#   "usb"     vendor_id, product_id
+#   "network" host, port (default 9100), for printers on the LAN
+#   "file"    path, e.g. /dev/usb/lp0 or a file to capture slips in
+#   "capture" / "simulated" stand-ins from printer_backends.py
+PRINTERS = [
+    {'name': 'main', 'backend': PRINTER_BACKEND, 'vendor_id': VENDOR_ID, 'product_id': PRODUCT_ID},
+]
+# Preferred printers per kiosk (the kiosk page's ?kiosk=<name>), e.g.
+# {'library': ['library', 'main']}. Other printers are only used when all
+# of a kiosk's printers are unavailable; kiosks not listed use any printer.
+KIOSK_PRINTERS = {}
+
+# How the pass barcode is printed when the slip does not say (the app
+# passes the barcode_mode setting from the admin Settings tab):
+#   "native" - the printer draws CODE128 itself from a few bytes (needs ESC/POS barcode function B)
+#   "image"  - rendered to a raster image in memory and sent as pixels (works on any printer)
+BARCODE_MODE = "image"
 # -----------------------------
 
-# Create a directory for barcode images
-os.makedirs("barcodes", exist_ok=True)
+# --- Connection Configuration ---
+PRINTER_ABSENT_SECONDS = 5          # after a failed connect, skip the printer this long without probing it
+PRINTER_ABSENT_MAX_SECONDS = 60     # the wait doubles with each failed connect up to this
+PRINTER_HEALTH_CHECK_SECONDS = 30   # an idle handle is checked before reuse after this long
+# --------------------------------
+
+def open_printer(config: dict):
+    """Opens the printer described by a PRINTERS entry."""
+    backend = config.get('backend', 'usb')
+    if backend == "usb":
+        return Usb(config['vendor_id'], config['product_id'])
+    if backend == "network":
+        return Network(config['host'], config.get('port', 9100))
+    if backend == "file":
+        return File(config['path'])
+    return printer_backends.open_backend(backend)
+
+def describe_error(error: Exception) -> str:
+    # A USB printer can be claimed by one process at a time; pyusb reports
+    # the second claim as "Resource busy" when the first write is attempted
+    if getattr(error, 'errno', None) == errno.EBUSY:
+        return f"{error} - is another process using the printer?"
+    return str(error)
+
+def write_raw(dev, buffer: bytes) -> None:
+    # python-escpos has no public call for already-encoded ESC/POS bytes;
+    # every backend implements _raw, so this is the one place that uses it
+    dev._raw(buffer)
+
+def printer_healthy(dev) -> bool:
+    """
+    Whether an idle handle can still reach its printer, checked without printing.
+    Stand-in backends answer for themselves; a file is always writable.
+    """
+    if hasattr(dev, 'healthy'):
+        return dev.healthy()
+    device = getattr(dev, 'device', None)
+    if isinstance(device, socket.socket):
+        # A printer that has closed the connection leaves the socket readable
+        # at end of file; waiting status bytes are left in place by the peek
+        try:
+            readable, _, _ = select.select([device], [], [], 0)
+            return not readable or device.recv(1, socket.MSG_PEEK) != b""
+        except (OSError, ValueError):
+            return False
+    if hasattr(device, 'ctrl_transfer'):
+        # A standard USB GET_STATUS request: answered by the device itself in
+        # a few milliseconds, unlike the printer's own status query
+        try:
+            device.ctrl_transfer(0x80, 0x00, 0, 0, 2, timeout=200)
+            return True
+        except Exception:
+            return False
+    return True
+
+class PrinterConnection:
+    """
+    Keeps one open handle to a printer and reuses it for every slip.
+    A failed connect marks the printer absent for a cool-down that doubles
+    on each further failure, so print attempts in that window return
+    straight away instead of probing the device again. An error while
+    printing drops the handle; the next slip reconnects.
+    The handle is opened by the first printout, not when the connection is
+    created, so only the process that prints claims the device; close() it
+    at shutdown so the next process can.
+    `opener` returns a newly opened printer; by default PRINTER_BACKEND is opened.
+    """
+
+    def __init__(self, opener=None, name: str = "main",
+                 absent_seconds: float = PRINTER_ABSENT_SECONDS,
+                 absent_max_seconds: float = PRINTER_ABSENT_MAX_SECONDS,
+                 health_check_seconds: float = PRINTER_HEALTH_CHECK_SECONDS):
+        self.name = name
+        self.opener = opener or (lambda: open_printer(
+            {'backend': PRINTER_BACKEND, 'vendor_id': VENDOR_ID, 'product_id': PRODUCT_ID}))
+        self.absent_seconds = absent_seconds
+        self.absent_max_seconds = absent_max_seconds
+        self.health_check_seconds = health_check_seconds
+        self._dev = None
+        self._last_used = 0.0
+        self._absent_until = 0.0
+        self._failed_connects = 0
+        self._waiting = 0
+        # _lock is held for a whole printout; _state_lock only for counters
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._stats = {'printed': 0, 'errors': 0, 'connects': 0, 'reused': 0,
+                       'failed_connects': 0, 'skipped': 0, 'dropped': 0}
+
+    @contextmanager
+    def device(self):
+        """
+        The open printer for one printout, or None while it is known to be absent.
+        If the body raises, the handle is closed and the error re-raised.
+        """
+        with self._state_lock:
+            self._waiting += 1
+        try:
+            with self._lock:
+                dev = self._connect()
+                try:
+                    yield dev
+                except Exception:
+                    self._count('errors')
+                    self._drop()
+                    raise
+                if dev is not None:
+                    self._count('printed')
+                    self._last_used = time.monotonic()
+        finally:
+            with self._state_lock:
+                self._waiting -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        """Printouts printing on or waiting for this printer."""
+        return self._waiting
+
+    def available(self) -> bool:
+        """False while the printer is in its absent cool-down. Never touches the device."""
+        return self._dev is not None or time.monotonic() >= self._absent_until
+
+    def _count(self, key: str) -> None:
+        with self._state_lock:
+            self._stats[key] += 1
+
+    def _connect(self):
+        now = time.monotonic()
+        if self._dev is not None:
+            if now - self._last_used < self.health_check_seconds or printer_healthy(self._dev):
+                self._count('reused')
+                return self._dev
+            self._drop()
+        if now < self._absent_until:
+            self._count('skipped')
+            return None
+        try:
+            self._dev = self.opener()
+        except Exception as e:
+            self._failed_connects += 1
+            self._count('failed_connects')
+            wait = min(self.absent_seconds * 2 ** (self._failed_connects - 1), self.absent_max_seconds)
+            self._absent_until = now + wait
+            print(f"[ERROR] Could not connect to printer {self.name}: {describe_error(e)} (retrying in {wait:g}s)")
+            return None
+        self._failed_connects = 0
+        self._absent_until = 0.0
+        self._count('connects')
+        return self._dev
+
+    def _drop(self) -> None:
+        if self._dev is None:
+            return
+        try:
+            self._dev.close()
+        except Exception:
+            pass
+        self._dev = None
+        self._count('dropped')
+
+    def reset(self) -> None:
+        """Close the handle and forget a cached absence, e.g. after reconnecting the printer."""
+        with self._lock:
+            self._drop()
+            self._failed_connects = 0
+            self._absent_until = 0.0
 
-def print_pass_slip(student_name: str, student_id: str, pass_id: int, duration_minutes: int):
+    def close(self) -> None:
+        """Release the handle after the current printout, e.g. at shutdown."""
+        with self._lock:
+            self._drop()
+
+    def get_stats(self) -> dict:
+        with self._state_lock:
+            stats = dict(self._stats)
+            stats['queue_depth'] = self._waiting
+        attempts = stats['printed'] + stats['errors']
+        stats['error_rate'] = round(stats['errors'] / attempts, 3) if attempts else 0.0
+        stats['connected'] = self._dev is not None
+        stats['absent_for_seconds'] = round(max(self._absent_until - time.monotonic(), 0.0), 1)
+        return stats
+
+class PrinterPool:
     """
-    Connects to the ESC/POS printer and prints a hall pass slip.
+    The printers slips can go to. A printout goes to the least busy
+    available printer among the kiosk's preferred ones, then among the
+    rest; if that printer is absent or the write fails, the next one is
+    tried, so one jammed printer does not stop printing.
     """
-    try:
-        dev = Usb(VENDOR_ID, PRODUCT_ID)
-    except Exception as e:
-        print(f"[ERROR] Could not connect to printer: {e}")
-        print("[INFO] Printing skipped.")
-        return
-
-    # --- Generate Barcode ---
-    try:
-        barcode_path_base = os.path.join("barcodes", f"pass_{pass_id}")
-        code = Code128(str(pass_id), writer=ImageWriter())
-        barcode_path = code.save(barcode_path_base)
-    except Exception as e:
-        print(f"[WARN] Could not render barcode: {e}")
-        barcode_path = None
-
-    try:
-        # --- Print Header ---
-        dev.set(align='center', width=2, height=2)
-        dev.set(text_type='B')  # Bold text
-        dev.text("HALL PASS\n")
-        
-        # --- Reset to normal and print details ---
-        dev.set(align='left', width=1, height=1)
-        dev.set(text_type='normal')
-        dev.text("-" * 32 + "\n")
-        
-        dev.text(f"Student: {student_name}\n")
-        dev.text(f"ID: {student_id}\n")
-        dev.text(f"Pass ID: {pass_id}\n")
-        
-        now = datetime.now()
-        dev.text(f"Time: {now.strftime('%Y-%m-%d %H:%M:%S')}\n")
-        dev.text(f"Duration: {duration_minutes} minutes\n")
-        dev.text("-" * 32 + "\n\n")
-
-        # --- Print Barcode ---
-        if barcode_path:
-            dev.set(align='center')
+
+    def __init__(self, connections: dict, kiosk_printers: dict = None):
+        self.connections = connections
+        self.kiosk_printers = kiosk_printers or {}
+
+    def candidates(self, kiosk: str = None) -> list[PrinterConnection]:
+        """Printers to try for a kiosk, best first."""
+        preferred = [self.connections[name] for name in self.kiosk_printers.get(kiosk, ())
+                     if name in self.connections]
+        others = [connection for connection in self.connections.values() if connection not in preferred]
+
+        def load(connection):
+            return (not connection.available(), connection.queue_depth)
+        # sorted() is stable, so equally loaded printers keep the configured order
+        return sorted(preferred, key=load) + sorted(others, key=load)
+
+    def send(self, buffer: bytes, kiosk: str = None) -> str | None:
+        """Writes a printout in one transfer. Returns the printer's name, or None if none could print it."""
+        for connection in self.candidates(kiosk):
             try:
-                dev.image(barcode_path)
-                dev.text("Scan this code upon return\n")
+                with connection.device() as dev:
+                    if dev is None:
+                        continue
+                    write_raw(dev, buffer)
+                return connection.name
             except Exception as e:
-                print(f"[WARN] Could not print barcode: {e}")
-                dev.text(f"Pass ID: {pass_id}\n")
-
-        dev.text("\n")
-        dev.cut()
-        print(f"[SUCCESS] Printed pass slip for Pass ID: {pass_id}")
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to print pass: {e}")
-    finally:
-        try:
-            dev.close()
-        except:
-            pass
\ No newline at end of file
+                # The handle has been dropped; fail over to the next printer
+                print(f"[ERROR] Printer {connection.name} failed: {describe_error(e)}")
+        return None
+
+    def reset(self) -> None:
+        for connection in self.connections.values():
+            connection.reset()
+
+    def close(self) -> None:
+        for connection in self.connections.values():
+            connection.close()
+
+    def get_stats(self) -> dict:
+        return {name: connection.get_stats() for name, connection in self.connections.items()}
+
+def create_pool(printers: list[dict] = PRINTERS, kiosk_printers: dict = KIOSK_PRINTERS) -> PrinterPool:
+    connections = {}
+    for config in printers:
+        connections[config['name']] = PrinterConnection(
+            lambda config=config: open_printer(config), name=config['name'])
+    return PrinterPool(connections, kiosk_printers)
+
+# The printers shared by every slip
+printer = create_pool()
+
+def send(buffer: bytes, kiosk: str = None) -> bool:
+    """Prints a rendered printout on the kiosk's best available printer. Returns True if it was sent."""
+    if printer.send(buffer, kiosk) is None:
+        print("[INFO] No printer available; printing skipped.")
+        return False
+    return True
+
+def print_pass_slip(student_name: str, student_id: str, pass_id: int, duration_minutes: int,
+                    taken_at: int = None, barcode_mode: str = None, kiosk: str = None) -> bool:
+    """
+    Prints a hall pass slip on one of the kiosk's printers.
+    taken_at (epoch seconds) is the time printed on the slip; defaults to now.
+    barcode_mode ("image" or "native", normally the barcode_mode setting)
+    overrides BARCODE_MODE for this slip.
+    Returns True if the slip was printed.
+    """
+    buffer = slip_templates.PASS_SLIP.render({
+        'student_name': student_name,
+        'student_id': student_id,
+        'pass_id': pass_id,
+        'taken_at': taken_at or int(time.time()),
+        'duration_minutes': duration_minutes,
+    }, barcode_mode or BARCODE_MODE)
+    if not send(buffer, kiosk):
+        return False
+    print(f"[SUCCESS] Printed pass slip for Pass ID: {pass_id}")
+    return True
+
+def print_student_report(student_name: str, student_id: str, total_passes: int, total_time_out: int,
+                         overtime_passes: int, passes: list[dict], printed_at: int = None,
+                         kiosk: str = None) -> bool:
+    """
+    Prints a student's pass report: totals and one line per pass
+    (pass_taken_at, duration_minutes, returned), newest first.
+    Returns True if the report was printed.
+    """
+    buffer = slip_templates.STUDENT_REPORT.render({
+        'student_name': student_name,
+        'student_id': student_id,
+        'printed_at': printed_at or int(time.time()),
+        'total_passes': total_passes,
+        'total_time_out': total_time_out,
+        'overtime_passes': overtime_passes,
+        'passes': [dict(p, number=number) for number, p in enumerate(passes, 1)],
+    })
+    if not send(buffer, kiosk):
+        return False
+    print(f"[SUCCESS] Printed pass report for student {student_id}")
+    return True
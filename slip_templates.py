@@ -0,0 +1,181 @@
+# slip_templates.py
+"""
+Precompiled ESC/POS layouts for the pass slip and the student report.
+A layout is a list of steps (text, style, field, barcode, rows, cut).
+compile_template() runs once at import: consecutive fixed steps are joined
+into one bytes chunk, so rendering only formats the fields and joins the
+chunks. The result is the whole printout as a single bytes buffer, sized
+once by bytes.join, which the printer receives in one write instead of one
+USB transfer per set()/text() call.
+"""
+from datetime import datetime
+from barcode import Code128
+from barcode.writer import ImageWriter
+from escpos.printer import Dummy
+
+ESC = b"\x1b"
+GS = b"\x1d"
+
+# --- Slip Configuration ---
+LINE_WIDTH = 32         # characters per line on 58 mm paper
+ENCODING = "cp437"      # code page selected by INIT; fields are encoded to match
+PRINTER_PROFILE = "POS-5890"    # python-escpos profile for rasterizing: 58 mm, 384 dots wide
+BARCODE_HEIGHT_DOTS = 80    # native barcode height
+BARCODE_MODULE_WIDTH = 2    # native barcode bar width, 2-6
+# --------------------------
+
+INIT = ESC + b"@" + ESC + b"t\x00"  # reset the printer, select code page 437
+ALIGN = {'left': ESC + b"a\x00", 'center': ESC + b"a\x01", 'right': ESC + b"a\x02"}
+CUT = ESC + b"d\x06" + GS + b"V\x00"  # feed 6 lines, full cut
+
+def text(value: str) -> tuple:
+    return ('static', value.encode(ENCODING, errors='replace'))
+
+def rule() -> tuple:
+    return text("-" * LINE_WIDTH + "\n")
+
+def style(align: str = 'left', bold: bool = False, size: int = 1) -> tuple:
+    """Alignment, emphasis and character size (1-8 times) for the following text."""
+    return ('static', ALIGN[align] + ESC + (b"E\x01" if bold else b"E\x00") + GS + b"!" + bytes([(size - 1) * 0x11]))
+
+def field(name: str, formatter=str) -> tuple:
+    """A value filled in per printout, formatted to text by formatter."""
+    return ('field', name, formatter)
+
+def barcode(name: str) -> tuple:
+    """The value as a CODE128 barcode, in the barcode mode given to render()."""
+    return ('barcode', name)
+
+def rows(name: str, steps: list) -> tuple:
+    """The steps repeated for each dict in the list value `name`."""
+    return ('rows', name, compile_template(steps))
+
+def cut() -> tuple:
+    return ('static', CUT)
+
+def render_barcode_image(value) -> object:
+    """The barcode as a PIL image, rendered in memory (no file is written)."""
+    return Code128(str(value), writer=ImageWriter()).render()
+
+def barcode_bytes(value, mode: str, height: int = BARCODE_HEIGHT_DOTS,
+                  module_width: int = BARCODE_MODULE_WIDTH) -> bytes:
+    """
+    ESC/POS commands for a CODE128 barcode. "native" asks the printer to
+    draw it (GS k); anything else sends it as a raster image.
+    """
+    if mode == "native":
+        # "{B" selects CODE128 code set B, which covers digits and letters
+        data = b"{B" + str(value).encode('ascii')
+        return (ALIGN['center'] + GS + b"h" + bytes([height]) + GS + b"w" + bytes([module_width])
+                + GS + b"f\x00" + GS + b"H\x02" + GS + b"kI" + bytes([len(data)]) + data)
+    # python-escpos already knows how to rasterize an image; capture its bytes.
+    # A profile with a known paper width keeps it from warning on every image
+    dev = Dummy(profile=PRINTER_PROFILE)
+    dev.image(render_barcode_image(value))
+    return ALIGN['center'] + dev.output
+
+class SlipTemplate:
+    """A compiled layout: fixed byte chunks with the per-printout parts between them."""
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+
+    def render(self, values: dict, barcode_mode: str = "image") -> bytes:
+        return b"".join(
+            chunk if isinstance(chunk, bytes) else chunk(values, barcode_mode)
+            for chunk in self.chunks
+        )
+
+def compile_template(steps: list) -> SlipTemplate:
+    chunks = []
+    pending = []
+
+    def flush():
+        if pending:
+            chunks.append(b"".join(pending))
+            pending.clear()
+
+    for step in steps:
+        kind = step[0]
+        if kind == 'static':
+            pending.append(step[1])
+            continue
+        flush()
+        if kind == 'field':
+            _, name, formatter = step
+            chunks.append(lambda values, mode, name=name, formatter=formatter:
+                          formatter(values[name]).encode(ENCODING, errors='replace'))
+        elif kind == 'barcode':
+            chunks.append(lambda values, mode, name=step[1]: _barcode_chunk(values[name], mode))
+        elif kind == 'rows':
+            _, name, row_template = step
+            chunks.append(lambda values, mode, name=name, row_template=row_template:
+                          b"".join(row_template.render(row, mode) for row in values[name]))
+        else:
+            raise ValueError(f"Unknown template step '{kind}'")
+    flush()
+    return SlipTemplate(chunks)
+
+def _barcode_chunk(value, mode: str) -> bytes:
+    try:
+        return barcode_bytes(value, mode) + text("\nScan this code upon return\n")[1]
+    except Exception as e:
+        # The slip is still valid without a barcode; the pass ID is printed as text
+        print(f"[WARN] Could not render barcode: {e}")
+        return ALIGN['center'] + text(f"Pass ID: {value}\n")[1]
+
+def format_time(epoch_seconds: int) -> str:
+    return datetime.fromtimestamp(epoch_seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+def format_short_time(epoch_seconds: int) -> str:
+    return datetime.fromtimestamp(epoch_seconds).strftime('%m/%d %H:%M')
+
+PASS_SLIP = compile_template([
+    ('static', INIT),
+    style(align='center', bold=True, size=2),
+    text("HALL PASS\n"),
+    style(),
+    rule(),
+    text("Student: "), field('student_name'), text("\n"),
+    text("ID: "), field('student_id'), text("\n"),
+    text("Pass ID: "), field('pass_id'), text("\n"),
+    text("Time: "), field('taken_at', format_time), text("\n"),
+    text("Duration: "), field('duration_minutes'), text(" minutes\n"),
+    rule(),
+    text("\n"),
+    barcode('pass_id'),
+    text("\n"),
+    cut(),
+])
+
+# The report the old desktop kiosk printed for a student (print_student_info)
+STUDENT_REPORT = compile_template([
+    ('static', INIT),
+    style(align='center', bold=True, size=2),
+    text("PASS REPORT\n"),
+    style(),
+    rule(),
+    text("Name: "), field('student_name'), text("\n"),
+    text("Student ID: "), field('student_id'), text("\n"),
+    text("Date: "), field('printed_at', format_time), text("\n"),
+    text("Total passes: "), field('total_passes'), text("\n"),
+    text("Time out: "), field('total_time_out', lambda seconds: str(seconds // 60)), text(" min\n"),
+    text("Overtime passes: "), field('overtime_passes'), text("\n"),
+    rule(),
+    style(bold=True),
+    text(f"{'#':>3}  {'Taken':<11} {'Min':>4}  Back\n"),
+    style(),
+    rows('passes', [
+        field('number', lambda number: f"{number:>3}"),
+        text("  "),
+        field('pass_taken_at', format_short_time),
+        text(" "),
+        field('duration_minutes', lambda minutes: f"{minutes:>4}"),
+        text("  "),
+        field('returned', lambda returned: "Yes" if returned else "No"),
+        text("\n"),
+    ]),
+    rule(),
+    cut(),
+])
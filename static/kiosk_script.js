@@ -5,6 +5,19 @@ document.addEventListener("DOMContentLoaded", function() {
     const activePassesList = document.getElementById("active-passes-list");
     const passesHeader = document.getElementById("passes-header");
     const capacityIndicator = document.getElementById("capacity-indicator");
+    // Which printers this kiosk's slips go to (printer_handler.KIOSK_PRINTERS)
+    const kioskName = new URLSearchParams(window.location.search).get("kiosk") || "";
+
+    // Local copy of the active pass list, kept current with ?since=<version>
+    // deltas so most polls transfer only a version number
+    const activePasses = new Map();
+    let passesVersion = null;
+    let capacity = null;
+    let serverOffset = 0;  // server clock minus local clock, in seconds
+
+    // Live updates arrive over /api/stream; polling runs only while it is down
+    let streamConnected = false;
+    let pollTimer = null;
 
     passForm.addEventListener("submit", function(event) {
         event.preventDefault();
@@ -19,67 +32,28 @@ document.addEventListener("DOMContentLoaded", function() {
         submitBtn.disabled = true;
         submitBtn.style.opacity = '0.6';
 
-        checkStudentStatus(studentId, submitBtn);
+        scanStudent(studentId, submitBtn);
     });
 
-    function checkStudentStatus(studentId, submitBtn) {
-        fetch("/api/active_passes")
-            .then(response => response.json())
-            .then(data => {
-                const passes = Array.isArray(data) ? data : (data.passes || []);
-                const isOut = passes.some(pass => pass.student_id === studentId);
-
-                if (isOut) {
-                    returnPass(studentId, submitBtn);
-                } else {
-                    startPass(studentId, submitBtn);
-                }
-            })
-            .catch(error => {
-                console.error("Error:", error);
-                showMessage("Network error. Please try again.", "error");
-                submitBtn.disabled = false;
-                submitBtn.style.opacity = '1';
-            });
-    }
-
-    function startPass(studentId, submitBtn) {
-        fetch("/start_pass", {
-            method: "POST",
-            headers: {"Content-Type": "application/x-www-form-urlencoded"},
-            body: `student_id=${encodeURIComponent(studentId)}`
-        })
-        .then(response => response.json())
-        .then(data => {
-            showMessage(data.message, data.success ? "success" : "error");
-            if (data.success) {
-                studentIdInput.value = "";
-                fetchActivePasses();
-            }
-            submitBtn.disabled = false;
-            submitBtn.style.opacity = '1';
-            studentIdInput.focus();
-        })
-        .catch(error => {
-            console.error("Error:", error);
-            showMessage("Network error. Please try again.", "error");
-            submitBtn.disabled = false;
-            submitBtn.style.opacity = '1';
-        });
-    }
-
-    function returnPass(studentId, submitBtn) {
-        fetch("/return_by_student_id", {
+    function scanStudent(studentId, submitBtn) {
+        // The server decides sign-out or sign-in in the same transaction as the write
+        fetch("/api/scan", {
             method: "POST",
             headers: {"Content-Type": "application/x-www-form-urlencoded"},
-            body: `student_id=${encodeURIComponent(studentId)}`
+            body: `student_id=${encodeURIComponent(studentId)}&kiosk=${encodeURIComponent(kioskName)}`
         })
         .then(response => response.json())
         .then(data => {
             showMessage(data.message, data.success ? "success" : "error");
             if (data.success) {
                 studentIdInput.value = "";
-                fetchActivePasses();
+                if (data.capacity) {
+                    capacity = data.capacity;
+                    updateCapacityIndicator(capacity);
+                }
+                if (!streamConnected) {
+                    fetchActivePasses();
+                }
             }
             submitBtn.disabled = false;
             submitBtn.style.opacity = '1';
@@ -102,26 +76,123 @@ document.addEventListener("DOMContentLoaded", function() {
         }, 5000);
     }
 
-    function fetchActivePasses() {
-        fetch("/api/active_passes")
-            .then(response => response.json())
-            .then(data => {
-                if (Array.isArray(data)) {
-                    renderPasses(data);
-                    updateCapacityIndicator(null);
-                } else {
-                    renderPasses(data.passes || []);
-                    updateCapacityIndicator(data.capacity);
+    function refreshActivePasses() {
+        const url = passesVersion === null ? "/api/active_passes" : `/api/active_passes?since=${passesVersion}`;
+        return fetch(url)
+            .then(response => {
+                const serverTime = Number(response.headers.get("X-Server-Time"));
+                if (serverTime) {
+                    serverOffset = serverTime - Date.now() / 1000;
                 }
+                return response.json();
             })
+            .then(data => {
+                if (!data.delta) {
+                    activePasses.clear();
+                }
+                (data.removed || []).forEach(passId => activePasses.delete(passId));
+                (data.passes || []).forEach(pass => activePasses.set(pass.pass_id, pass));
+                if (data.capacity) {
+                    capacity = data.capacity;
+                }
+                passesVersion = data.version;
+            });
+    }
+
+    function fetchActivePasses() {
+        refreshActivePasses()
+            .then(renderActivePasses)
             .catch(error => {
                 console.error("Error fetching active passes:", error);
             });
     }
 
+    function renderActivePasses() {
+        const passes = Array.from(activePasses.values())
+            .sort((a, b) => a.pass_taken_at - b.pass_taken_at || a.pass_id - b.pass_id);
+        renderPasses(passes);
+        updateCapacityIndicator(capacity);
+    }
+
+    function startPolling() {
+        if (pollTimer === null) {
+            fetchActivePasses();
+            pollTimer = setInterval(fetchActivePasses, 2000);
+        }
+    }
+
+    function stopPolling() {
+        if (pollTimer !== null) {
+            clearInterval(pollTimer);
+            pollTimer = null;
+        }
+    }
+
+    function applyStreamEvent(event, handler) {
+        const data = JSON.parse(event.data);
+        handler(data);
+        if (data.capacity) {
+            capacity = data.capacity;
+        }
+        if (data.server_time) {
+            serverOffset = data.server_time - Date.now() / 1000;
+        }
+        if (event.lastEventId) {
+            passesVersion = Number(event.lastEventId);
+        }
+        renderActivePasses();
+    }
+
+    function connectStream() {
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+        const source = new EventSource("/api/stream");
+
+        source.addEventListener("open", () => {
+            streamConnected = true;
+            stopPolling();
+        });
+        source.addEventListener("error", () => {
+            // EventSource reconnects by itself (sending Last-Event-ID); poll meanwhile
+            streamConnected = false;
+            startPolling();
+            if (source.readyState === EventSource.CLOSED) {
+                setTimeout(connectStream, 10000);
+            }
+        });
+        source.addEventListener("snapshot", event => applyStreamEvent(event, data => {
+            activePasses.clear();
+            data.passes.forEach(pass => activePasses.set(pass.pass_id, pass));
+        }));
+        source.addEventListener("pass_started", event => applyStreamEvent(event, data => {
+            activePasses.set(data.pass.pass_id, data.pass);
+        }));
+        source.addEventListener("pass_returned", event => applyStreamEvent(event, data => {
+            activePasses.delete(data.pass_id);
+        }));
+        source.addEventListener("capacity_changed", event => applyStreamEvent(event, () => {}));
+    }
+
+    function secondsRemaining(pass) {
+        return Math.round(pass.due_at - (Date.now() / 1000 + serverOffset));
+    }
+
+    // Capacity bar, built once and then only patched
+    let capacityView = null;
+    let capacityKey = null;
+
     function updateCapacityIndicator(capacity) {
+        const key = capacity && capacity.enabled ? `${capacity.current}/${capacity.max}` : "off";
+        if (key === capacityKey) {
+            return;
+        }
+        capacityKey = key;
+
         if (!capacity || !capacity.enabled) {
             capacityIndicator.innerHTML = "";
+            capacityView = null;
             passesHeader.textContent = "Students Currently Out";
             return;
         }
@@ -134,41 +205,98 @@ document.addEventListener("DOMContentLoaded", function() {
 
         passesHeader.textContent = `Students Currently Out (${current}/${max})`;
 
-        capacityIndicator.innerHTML = `
-            <div style="background: #1a1a1a; padding: 25px; border-radius: 20px; border: 2px solid #333;">
-                <div style="width: 100%; height: 16px; background: #333; border-radius: 8px; overflow: hidden; margin-bottom: 12px;">
-                    <div style="height: 100%; background: ${statusColor}; width: ${percentage}%; transition: all 0.5s ease;"></div>
+        if (capacityView === null) {
+            capacityIndicator.innerHTML = `
+                <div style="background: #1a1a1a; padding: 25px; border-radius: 20px; border: 2px solid #333;">
+                    <div style="width: 100%; height: 16px; background: #333; border-radius: 8px; overflow: hidden; margin-bottom: 12px;">
+                        <div class="capacity-fill" style="height: 100%; transition: all 0.5s ease;"></div>
+                    </div>
+                    <div style="display: flex; justify-content: space-between; font-size: 1.1rem; color: #a3a3a3; font-weight: 600;">
+                        <span>0</span>
+                        <span class="capacity-count" style="font-weight: 800; font-size: 1.3rem;"></span>
+                    </div>
                 </div>
-                <div style="display: flex; justify-content: space-between; font-size: 1.1rem; color: #a3a3a3; font-weight: 600;">
-                    <span>0</span>
-                    <span style="color: ${statusColor}; font-weight: 800; font-size: 1.3rem;">${current} / ${max}</span>
-                </div>
-            </div>
-        `;
+            `;
+            capacityView = {
+                fill: capacityIndicator.querySelector(".capacity-fill"),
+                count: capacityIndicator.querySelector(".capacity-count")
+            };
+        }
+        capacityView.fill.style.background = statusColor;
+        capacityView.fill.style.width = `${percentage}%`;
+        capacityView.count.style.color = statusColor;
+        capacityView.count.textContent = `${current} / ${max}`;
+    }
+
+    // One card per pass_id; each render only touches what changed, so the
+    // per-second countdown rewrites timer text and nothing else
+    const passCards = new Map();
+    let allClearEl = null;
+
+    function createPassCard(pass) {
+        const card = document.createElement("div");
+        card.className = "pass-card";
+
+        const nameEl = document.createElement("h3");
+        nameEl.textContent = pass.full_name;
+
+        const timerEl = document.createElement("div");
+        timerEl.className = "timer";
+
+        card.appendChild(nameEl);
+        card.appendChild(timerEl);
+        return {card, nameEl, timerEl, name: pass.full_name, time: null, overtime: false};
     }
 
     function renderPasses(passes) {
-        activePassesList.innerHTML = "";
+        const current = new Set(passes.map(pass => pass.pass_id));
+        passCards.forEach((entry, passId) => {
+            if (!current.has(passId)) {
+                entry.card.remove();
+                passCards.delete(passId);
+            }
+        });
+
         if (passes.length === 0) {
-            activePassesList.innerHTML = "<p>✓ All Clear</p>";
+            if (allClearEl === null) {
+                allClearEl = document.createElement("p");
+                allClearEl.textContent = "✓ All Clear";
+                activePassesList.appendChild(allClearEl);
+            }
             return;
         }
+        if (allClearEl !== null) {
+            allClearEl.remove();
+            allClearEl = null;
+        }
 
-        passes.forEach(pass => {
-            const isOvertime = pass.time_remaining < 0;
-            const card = document.createElement("div");
-            card.className = `pass-card ${isOvertime ? 'overtime' : ''}`;
-
-            const nameEl = document.createElement("h3");
-            nameEl.textContent = pass.full_name;
+        passes.forEach((pass, index) => {
+            let entry = passCards.get(pass.pass_id);
+            if (!entry) {
+                entry = createPassCard(pass);
+                passCards.set(pass.pass_id, entry);
+            }
+            if (entry.name !== pass.full_name) {
+                entry.name = pass.full_name;
+                entry.nameEl.textContent = pass.full_name;
+            }
 
-            const timerEl = document.createElement("div");
-            timerEl.className = "timer";
-            timerEl.textContent = formatTime(pass.time_remaining);
+            const remaining = secondsRemaining(pass);
+            const time = formatTime(remaining);
+            if (entry.time !== time) {
+                entry.time = time;
+                entry.timerEl.textContent = time;
+            }
+            const overtime = remaining < 0;
+            if (entry.overtime !== overtime) {
+                entry.overtime = overtime;
+                entry.card.classList.toggle("overtime", overtime);
+            }
 
-            card.appendChild(nameEl);
-            card.appendChild(timerEl);
-            activePassesList.appendChild(card);
+            const slot = activePassesList.children[index];
+            if (slot !== entry.card) {
+                activePassesList.insertBefore(entry.card, slot || null);
+            }
         });
     }
 
@@ -194,6 +322,7 @@ document.addEventListener("DOMContentLoaded", function() {
         }
     });
 
-    fetchActivePasses();
-    setInterval(fetchActivePasses, 2000);
+    connectStream();
+    // Countdowns tick locally from due_at; no request needed
+    setInterval(renderActivePasses, 1000);
 });
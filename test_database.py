@@ -0,0 +1,808 @@
+# test_database.py
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+import archive
+import backup
+import database
+import import_jobs
+import live_events
+import write_queue
+
+def make_test_db() -> tuple:
+    """Create a migrated database in a temporary directory."""
+    temp_dir = tempfile.mkdtemp(prefix="track_pass_test_")
+    con = database.create_connection(os.path.join(temp_dir, "test_passes.db"))
+    cur = database.create_cursor(con)
+    database.init_database(cur)
+    database.save_data(con)
+    return con, cur, temp_dir
+
+def close_test_db(con, temp_dir: str) -> None:
+    con.close()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+def start_pass(cur, student_id: str) -> dict | None:
+    """Opens a pass the way the kiosk does, with a fresh capacity counter."""
+    new_pass, _ = database.start_pass_for_student(cur, student_id, database.ActivePassCounter())
+    return new_pass
+
+def seed_passes(cur, students: int = 50, passes_per_student: int = 20) -> None:
+    """Fill the database with returned history plus a few open passes."""
+    for i in range(students):
+        database.insert_student(cur, f"{100000 + i}", f"First{i}", f"Last{i}")
+    base = database.now_epoch() - 90 * 86400
+    for i in range(students):
+        for day in range(passes_per_student):
+            taken = base + day * 86400 + i * 60
+            cur.execute(
+                "INSERT INTO passes (student_id, pass_taken_at, return_time, duration_minutes, due_at, returned) "
+                "VALUES (?, ?, ?, 10, ?, 1)",
+                (f"{100000 + i}", taken, taken + 30, taken + 600)
+            )
+    database.update_setting(cur, 'enable_capacity_limit', '0')
+    for i in range(5):
+        start_pass(cur, f"{100000 + i}")
+    cur.execute("ANALYZE")
+
+def query_plans(con, func, *args) -> list[tuple[str, str]]:
+    """
+    Runs func(cursor, *args) and returns (sql, plan) for every SELECT it issued.
+    The plan is the EXPLAIN QUERY PLAN detail lines joined together.
+    """
+    statements = []
+    con.set_trace_callback(statements.append)
+    try:
+        func(database.create_cursor(con), *args)
+    finally:
+        con.set_trace_callback(None)
+
+    plans = []
+    for sql in statements:
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        rows = con.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        plans.append((sql, "\n".join(row["detail"] for row in rows)))
+    return plans
+
+def assert_uses_index(con, index_name: str, func, *args) -> None:
+    plans = query_plans(con, func, *args)
+    assert plans, f"{func.__name__} issued no SELECT statements"
+    for sql, plan in plans:
+        if "passes" not in sql:
+            continue
+        assert "SCAN p\n" not in plan + "\n" and "SCAN passes\n" not in plan + "\n", \
+            f"{func.__name__} scans the passes table:\n{sql}\n{plan}"
+        assert index_name in plan, f"{func.__name__} does not use {index_name}:\n{sql}\n{plan}"
+
+def test_migrations_set_schema_version():
+    con, cur, temp_dir = make_test_db()
+    try:
+        latest = database.list_migrations()[-1][0]
+        assert database.get_schema_version(cur) == latest
+        # Running again must be a no-op
+        assert database.run_migrations(cur) == latest
+        assert database.get_setting(cur, 'max_students_out') == '10'
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_migrations_upgrade_unversioned_database():
+    """A database created by the old create_empty.sql script is upgraded in place."""
+    temp_dir = tempfile.mkdtemp(prefix="track_pass_test_")
+    con = database.create_connection(os.path.join(temp_dir, "legacy.db"))
+    try:
+        first_version, first_path = database.list_migrations()[0]
+        with open(first_path, 'r') as f:
+            con.executescript(f.read())
+        con.execute("INSERT INTO students (student_id, first_name, last_name) VALUES ('1', 'A', 'B')")
+        con.commit()
+
+        cur = database.create_cursor(con)
+        database.init_database(cur)
+        assert database.get_schema_version(cur) == database.list_migrations()[-1][0]
+        assert database.get_student_by_id(cur, '1')['Name'] == 'A B'
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_epoch_migration_converts_iso_timestamps():
+    """Passes stored as local-time ISO strings become epoch seconds with due_at."""
+    temp_dir = tempfile.mkdtemp(prefix="track_pass_test_")
+    con = database.create_connection(os.path.join(temp_dir, "legacy.db"))
+    try:
+        cur = database.create_cursor(con)
+        for version, path in database.list_migrations():
+            if version > 2:
+                break
+            with open(path, 'r') as f:
+                con.executescript(f.read())
+        con.execute("PRAGMA user_version = 2")
+        database.init_default_settings(cur)
+        database.insert_student(cur, "1", "A", "B")
+        cur.execute(
+            "INSERT INTO passes (student_id, pass_taken_at, return_time, duration_minutes, returned) "
+            "VALUES ('1', '2025-09-10 11:09:25', '2025-09-10 11:14:40', 10, 1)"
+        )
+        cur.execute(
+            "INSERT INTO passes (student_id, pass_taken_at, duration_minutes, returned) "
+            "VALUES ('1', '2025-09-10 12:00:00', 5, 0)"
+        )
+        database.save_data(con)
+
+        database.init_database(cur)
+        rows = cur.execute("SELECT * FROM passes ORDER BY pass_id").fetchall()
+        expected = int(datetime(2025, 9, 10, 11, 9, 25).timestamp())
+        assert rows[0]['pass_taken_at'] == expected
+        assert rows[0]['return_time'] - rows[0]['pass_taken_at'] == 315
+        assert rows[0]['due_at'] == expected + 600
+        assert rows[1]['return_time'] is None
+        assert rows[1]['due_at'] - rows[1]['pass_taken_at'] == 300
+
+        # AUTOINCREMENT keeps counting from the migrated rows
+        new_pass, error = database.start_pass_for_student(cur, "1", database.ActivePassCounter())
+        assert error == "" and new_pass['pass_id'] == 3
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_active_pass_queries_skip_history():
+    con, cur, temp_dir = make_test_db()
+    try:
+        seed_passes(cur)
+        for func in (database.get_active_pass_count, database.get_active_passes):
+            for sql, plan in query_plans(con, func):
+                assert "active_passes" in plan and "passes p" not in sql, f"{func.__name__}:\n{sql}\n{plan}"
+        # The consistency check reads open passes through the partial index
+        plans = query_plans(con, database.check_active_passes)
+        source_plan = next(plan for sql, plan in plans if "FROM passes p" in sql)
+        assert "idx_passes_active" in source_plan, source_plan
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_active_passes_table_follows_creates_and_returns():
+    con, cur, temp_dir = make_test_db()
+    try:
+        seed_passes(cur, students=10, passes_per_student=2)
+        assert database.check_active_passes(cur) == {'missing': [], 'extra': [], 'mismatched': []}
+        assert [p['full_name'] for p in database.get_active_passes(cur)][0] == "First0 Last0"
+
+        database.return_active_pass_for_student(cur, "100000")
+        database.update_existing_student(cur, "100001", "Renamed", "Student")
+        database.delete_student_by_id(cur, "100002")
+        database.bulk_import_students(cur, [("100003", "Bulk", "Renamed")], update_existing=True)
+        assert database.check_active_passes(cur) == {'missing': [], 'extra': [], 'mismatched': []}
+        names = sorted(p['full_name'] for p in database.get_active_passes(cur))
+        assert names == ["Bulk Renamed", "First4 Last4", "Renamed Student"]
+
+        # Drift (e.g. a manual edit of passes) is detected and repaired
+        cur.execute("UPDATE passes SET returned = 1 WHERE student_id = '100004'")
+        assert database.check_active_passes(cur)['extra'] != []
+        assert database.ensure_active_passes_consistent(cur) is True
+        assert database.get_active_pass_count(cur) == 2
+        assert database.ensure_active_passes_consistent(cur) is False
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_active_pass_version_and_changes():
+    con, cur, temp_dir = make_test_db()
+    try:
+        for i in range(3):
+            database.insert_student(cur, f"{700000 + i}", f"First{i}", f"Last{i}")
+        start = database.get_active_passes_version(cur)
+        assert database.get_active_pass_changes(cur, start) == ([], [])
+
+        first = start_pass(cur, "700000")['pass_id']
+        start_pass(cur, "700001")
+        after_starts = database.get_active_passes_version(cur)
+        assert after_starts > start
+        changed, removed = database.get_active_pass_changes(cur, start)
+        assert {p['student_id'] for p in changed} == {"700000", "700001"} and removed == []
+
+        # Pass history and unrelated settings leave the version alone
+        database.update_setting(cur, 'default_pass_duration', '12')
+        assert database.get_active_passes_version(cur) == after_starts
+
+        database.return_active_pass_for_student(cur, "700000")
+        database.update_setting(cur, 'max_students_out', '4')
+        changed, removed = database.get_active_pass_changes(cur, after_starts)
+        assert changed == [] and removed == [first]
+
+        # A version the log no longer covers asks for the full list
+        cur.execute("DELETE FROM active_pass_events WHERE version <= ?", (after_starts,))
+        assert database.get_active_pass_changes(cur, start) is None
+        assert database.get_active_pass_changes(cur, database.get_active_passes_version(cur) + 5) is None
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_live_events_replay_filter_and_slow_clients():
+    broker = live_events.EventBroker(max_subscribers=2)
+    subscription = broker.subscribe()
+    assert broker.subscribe() is not None and broker.subscribe() is None
+
+    initial = [live_events.format_event('snapshot', {'passes': []}, 5)]
+    messages = live_events.stream(subscription, initial, after_id=5)
+    assert next(messages).startswith("retry:")
+    assert next(messages) == 'id: 5\nevent: snapshot\ndata: {"passes":[]}\n\n'
+    broker.publish('pass_started', {'pass_id': 1}, 5)   # already in the snapshot
+    broker.publish('pass_returned', {'pass_id': 1}, 6)
+    assert next(messages).startswith("id: 6\nevent: pass_returned")
+    messages.close()
+    assert broker.get_stats()['subscribers'] == 1
+
+    slow = broker.subscribe()
+    for version in range(live_events.SUBSCRIBER_QUEUE_SIZE + 1):
+        broker.publish('capacity_changed', {}, version)
+    # Neither idle subscription was read, so both are dropped
+    assert slow.overflowed and broker.get_stats()['subscribers'] == 0
+
+def test_live_events_carry_the_version_their_write_produced():
+    con, cur, temp_dir = make_test_db()
+    pool = database.ConnectionPool(os.path.join(temp_dir, "test_passes.db"))
+    # A long window puts both scans in one group commit
+    writer = write_queue.WriteQueue(pool, window_ms=100)
+    broker = live_events.EventBroker()
+    try:
+        for student_id in ("500001", "500002"):
+            database.insert_student(cur, student_id, "First", "Last")
+        database.save_data(con)
+        start_version = database.get_active_passes_version(cur)
+        subscription = broker.subscribe()
+
+        def publish(outcome):
+            new_pass, _ = outcome
+            broker.publish('pass_started', {'pass_id': new_pass['pass_id']}, new_pass['version'])
+
+        futures = [writer.submit(database.start_pass_for_student, student_id, pool.active_passes,
+                                 after_commit=publish) for student_id in ("500001", "500002")]
+        first, second = [future.result(5)[0] for future in futures]
+        assert writer.get_stats()['max_batch_size'] == 2
+        assert start_version < first['version'] < second['version']
+
+        # Events arrive in commit order, each with its own version
+        messages = live_events.stream(subscription, [], after_id=start_version)
+        assert next(messages).startswith("retry:")
+        assert next(messages).startswith(f"id: {first['version']}\n")
+        # The kiosk drops here; reconnecting from the first id still replays the second pass
+        messages.close()
+        changed, removed = database.get_active_pass_changes(cur, first['version'])
+        assert [p['pass_id'] for p in changed] == [second['pass_id']] and removed == []
+
+        returned = writer.run(database.return_pass_by_id, first['pass_id'], pool.active_passes,
+                              after_commit=lambda result: 1 / 0)
+        assert returned['version'] == database.get_active_passes_version(cur) > second['version']
+    finally:
+        writer.close()
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def test_student_return_uses_student_index():
+    con, cur, temp_dir = make_test_db()
+    try:
+        seed_passes(cur)
+        plans = query_plans(con, database.return_active_pass_for_student, "100001")
+        sql, plan = plans[0]
+        assert "idx_active_passes_student" in plan, plan
+        assert "USE TEMP B-TREE" not in plan, plan
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_recent_passes_use_time_index():
+    con, cur, temp_dir = make_test_db()
+    try:
+        seed_passes(cur)
+        assert_uses_index(con, "idx_passes_taken_at", database.get_recent_passes_with_details, 100)
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_pool_readers_not_blocked_by_writer():
+    con, cur, temp_dir = make_test_db()
+    pool = database.ConnectionPool(os.path.join(temp_dir, "test_passes.db"))
+    try:
+        seed_passes(cur)
+        database.save_data(con)
+        writer = pool.acquire()
+        reader = pool.acquire()
+        with pool.transaction(writer) as write_cur:
+            database.start_pass_for_student(write_cur, "100010", pool.active_passes)
+            # WAL: the reader sees the last committed state without waiting
+            assert database.get_active_pass_count(database.create_cursor(reader)) == 5
+        assert database.get_active_pass_count(database.create_cursor(reader)) == 6
+        pool.release(writer)
+        pool.release(reader)
+        assert pool.get_stats()['transactions'] == 1
+    finally:
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def test_pool_retries_busy_writer():
+    con, cur, temp_dir = make_test_db()
+    pool = database.ConnectionPool(os.path.join(temp_dir, "test_passes.db"))
+    try:
+        blocker = pool.acquire()
+        blocker.execute("BEGIN IMMEDIATE")
+        releaser = threading.Timer(0.3, blocker.commit)
+        releaser.start()
+
+        with pool.connection() as writer:
+            with pool.transaction(writer) as write_cur:
+                database.update_setting(write_cur, 'max_students_out', '7')
+        releaser.join()
+
+        stats = pool.get_stats()
+        assert stats['busy_retries'] > 0
+        assert stats['lock_wait_max_ms'] >= 200
+        assert database.get_setting(cur, 'max_students_out') == '7'
+        pool.release(blocker)
+    finally:
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def test_concurrent_starts_respect_capacity():
+    con, cur, temp_dir = make_test_db()
+    pool = database.ConnectionPool(os.path.join(temp_dir, "test_passes.db"))
+    try:
+        for i in range(20):
+            database.insert_student(cur, f"{200000 + i}", f"First{i}", f"Last{i}")
+        database.update_setting(cur, 'max_students_out', '3')
+        database.save_data(con)
+
+        results = []
+        start = threading.Barrier(20)
+
+        def scan(student_id):
+            with pool.connection() as worker:
+                start.wait()
+                with pool.transaction(worker) as worker_cur:
+                    results.append(database.start_pass_for_student(worker_cur, student_id, pool.active_passes))
+
+        threads = [threading.Thread(target=scan, args=(f"{200000 + i}",)) for i in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        created = [p for p, error in results if p]
+        assert len(results) == 20
+        assert len(created) == 3
+        assert database.get_active_pass_count(cur) == 3
+        assert pool.active_passes.peek(cur) == 3
+    finally:
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def test_write_queue_group_commits_and_isolates_failures():
+    con, cur, temp_dir = make_test_db()
+    pool = database.ConnectionPool(os.path.join(temp_dir, "test_passes.db"))
+    writer = write_queue.WriteQueue(pool, window_ms=50)
+    try:
+        for i in range(30):
+            database.insert_student(cur, f"{300000 + i}", f"First{i}", f"Last{i}")
+        database.update_setting(cur, 'enable_capacity_limit', '0')
+        database.save_data(con)
+
+        def broken(cursor):
+            cursor.execute("INSERT INTO students (student_id, first_name, last_name) VALUES ('bad', 'B', 'B')")
+            raise ValueError("scan failed")
+
+        futures = [writer.submit(database.start_pass_for_student, f"{300000 + i}", pool.active_passes)
+                   for i in range(30)]
+        failing = writer.submit(broken)
+        created = [future.result(5) for future in futures]
+        try:
+            failing.result(5)
+            assert False, "expected the operation's exception"
+        except ValueError:
+            pass
+
+        assert all(new_pass and not error for new_pass, error in created)
+        assert database.get_active_pass_count(cur) == 30
+        assert database.get_student_by_id(cur, "bad") is None
+        stats = writer.get_stats()
+        assert stats['operations'] == 31 and stats['failed_operations'] == 1
+        assert stats['batches'] < 31
+
+        returned = writer.run(database.return_active_pass_for_student, "300000", pool.active_passes)
+        assert returned is not None
+        assert writer.run(database.return_active_pass_for_student, "300000", pool.active_passes) is None
+    finally:
+        writer.close()
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def test_toggle_scan_decides_inside_the_write():
+    con, cur, temp_dir = make_test_db()
+    pool = database.ConnectionPool(os.path.join(temp_dir, "test_passes.db"))
+    writer = write_queue.WriteQueue(pool, window_ms=50)
+    try:
+        database.insert_student(cur, "300000", "Ada", "Lovelace")
+        database.save_data(con)
+
+        # Two kiosks scanning the same student at once: one signs out, the next signs back in
+        futures = [writer.submit(database.toggle_pass_for_student, "300000", pool.active_passes, pool.settings,
+                                 students=pool.students) for _ in range(2)]
+        actions = [future.result(5)[0] for future in futures]
+        assert actions == ['started', 'returned']
+        assert database.get_active_pass_count(cur) == 0
+
+        action, new_pass, error = writer.run(database.toggle_pass_for_student, "300000", pool.active_passes)
+        assert action == 'started' and new_pass['Name'] == "Ada Lovelace" and not error
+        assert database.get_active_pass_count(cur) == 1
+        action, _, error = writer.run(database.toggle_pass_for_student, "999999", pool.active_passes)
+        assert action is None and "not found" in error
+    finally:
+        writer.close()
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def test_active_pass_counter_tracks_returns_and_rollbacks():
+    con, cur, temp_dir = make_test_db()
+    pool = database.ConnectionPool(os.path.join(temp_dir, "test_passes.db"))
+    try:
+        database.insert_student(cur, "300000", "Ada", "Lovelace")
+        database.save_data(con)
+        counter = pool.active_passes
+        with pool.connection() as worker:
+            with pool.transaction(worker) as worker_cur:
+                new_pass, error = database.start_pass_for_student(worker_cur, "300000", counter)
+            assert error == "" and new_pass["Name"] == "Ada Lovelace"
+            assert counter.peek(cur) == 1
+
+            try:
+                with pool.transaction(worker) as worker_cur:
+                    database.start_pass_for_student(worker_cur, "300000", counter)
+                    raise RuntimeError("simulated failure before commit")
+            except RuntimeError:
+                pass
+            assert counter.peek(cur) == 1
+
+            with pool.transaction(worker) as worker_cur:
+                assert database.return_active_pass_for_student(worker_cur, "300000", counter)
+            assert counter.peek(cur) == 0
+
+            with pool.transaction(worker) as worker_cur:
+                missing, error = database.start_pass_for_student(worker_cur, "999", counter)
+            assert missing is None and "not found" in error
+    finally:
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def test_settings_cache_typed_and_invalidated():
+    con, cur, temp_dir = make_test_db()
+    cache = database.SettingsCache(os.path.join(temp_dir, "test_passes.db"), check_seconds=3600)
+    try:
+        assert cache.get('max_students_out') == 10
+        assert cache.get('enable_capacity_limit') is True
+        assert cache.get('barcode_mode') == "image"
+        try:
+            database.parse_setting('barcode_mode', "laser")
+            assert False, "barcode_mode only takes image or native"
+        except ValueError:
+            pass
+
+        statements = []
+        cache._con.set_trace_callback(statements.append)
+        for _ in range(100):
+            cache.get('max_students_out')
+        assert statements == []
+
+        database.update_setting(cur, 'max_students_out', '4')
+        database.save_data(con)
+        cache.invalidate()
+        assert cache.get('max_students_out') == 4
+    finally:
+        cache.close()
+        close_test_db(con, temp_dir)
+
+def test_settings_cache_detects_outside_edits():
+    con, cur, temp_dir = make_test_db()
+    cache = database.SettingsCache(os.path.join(temp_dir, "test_passes.db"), check_seconds=0)
+    try:
+        assert cache.get('enable_capacity_limit') is True
+        # Another connection edits the table without telling the cache
+        database.update_setting(cur, 'enable_capacity_limit', '0')
+        database.save_data(con)
+        assert cache.get('enable_capacity_limit') is False
+    finally:
+        cache.close()
+        close_test_db(con, temp_dir)
+
+def test_student_directory_follows_roster_version():
+    con, cur, temp_dir = make_test_db()
+    directory = database.StudentDirectory(os.path.join(temp_dir, "test_passes.db"), check_seconds=0)
+    try:
+        database.insert_student(cur, "400000", "Ada", "Lovelace")
+        database.save_data(con)
+        assert directory.get("400000").name == "Ada Lovelace"
+        assert directory.get("400001") is None
+        version = directory.version
+
+        # Pass writes and student totals do not bump the roster version
+        start_pass(cur, "400000")
+        database.return_active_pass_for_student(cur, "400000")
+        database.save_data(con)
+        assert database.get_roster_version(cur) == version
+        assert directory.get("400000") is not None and directory.version == version
+
+        # Roster edits from another connection are picked up without invalidate()
+        database.bulk_import_students(cur, [("400000", "Ada", "King"), ("400001", "Alan", "Turing")], True)
+        database.save_data(con)
+        assert database.get_roster_version(cur) > version
+        assert directory.get("400000").name == "Ada King"
+        assert directory.get("400001").name == "Alan Turing"
+
+        database.delete_student_by_id(cur, "400001")
+        database.save_data(con)
+        assert directory.get("400001") is None
+        assert len(directory) == 1
+    finally:
+        directory.close()
+        close_test_db(con, temp_dir)
+
+def test_read_snapshot_is_isolated_and_bounded():
+    con, cur, temp_dir = make_test_db()
+    snapshot = database.ReadSnapshot(os.path.join(temp_dir, "test_passes.db"), max_age_seconds=60)
+    try:
+        database.insert_student(cur, "500000", "Grace", "Hopper")
+        database.save_data(con)
+        with snapshot.connection() as snap:
+            assert database.get_student_by_id(snap.cursor(), "500000") is not None
+            try:
+                snap.execute("DELETE FROM students")
+                assert False, "snapshot must be read-only"
+            except database.sqlite3.OperationalError:
+                pass
+
+        # A write during a long-lived snapshot read is not blocked by it
+        with snapshot.connection() as snap:
+            database.insert_student(cur, "500001", "Alan", "Kay")
+            database.save_data(con)
+            assert database.get_student_by_id(snap.cursor(), "500001") is None
+        assert snapshot.get_stats()['refreshes'] == 1
+
+        # Within max_age the copy may lag; invalidate() forces the change check
+        with snapshot.connection() as snap:
+            assert database.get_student_by_id(snap.cursor(), "500001") is None
+        snapshot.invalidate()
+        with snapshot.connection() as snap:
+            assert database.get_student_by_id(snap.cursor(), "500001") is not None
+        snapshot.invalidate()
+        with snapshot.connection():
+            pass
+        assert snapshot.get_stats()['refreshes'] == 2
+        assert snapshot.age() < 60
+    finally:
+        snapshot.close()
+        close_test_db(con, temp_dir)
+
+def test_backup_verify_restore_and_rotate():
+    con, cur, temp_dir = make_test_db()
+    db_path = os.path.join(temp_dir, "test_passes.db")
+    try:
+        database.configure_connection(con)
+        seed_passes(cur, students=20, passes_per_student=30)
+        database.save_data(con)
+
+        taken = backup.backup_database(db_path, pages=4, pause=0)
+        ok, message = backup.verify_backup(taken['path'])
+        assert ok, message
+        assert backup.find_backup(db_path) == taken['path']
+        # A second backup straight away gets its own file without waiting
+        steps = []
+        again = backup.backup_database(db_path, pages=4, pause=0,
+                                       on_step=lambda started, ended: steps.append(ended - started))
+        assert again['path'] != taken['path'] and again['seconds'] < 1
+        assert backup.find_backup(db_path) == again['path']
+        assert len(steps) > 1 and min(steps) >= 0
+
+        database.delete_all_students(cur)
+        database.save_data(con)
+        result = backup.restore_backup(taken['path'], db_path)
+        assert os.path.exists(result['previous_backup'])
+        assert len(database.get_all_students(cur)) == 20
+        assert database.get_active_pass_count(cur) == 5
+
+        with open(taken['path'], 'r+b') as f:
+            f.seek(200)
+            f.write(b'\x00garbage')
+        assert backup.verify_backup(taken['path']) == (False, "Checksum does not match")
+        try:
+            backup.restore_backup(taken['path'], db_path)
+            assert False, "a corrupt backup must not be restored"
+        except ValueError:
+            pass
+
+        assert backup.rotate_backups(db_path, keep=1) == 2
+        assert backup.list_backups(db_path) == [result['previous_backup']]
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_bulk_import_matches_per_row_import():
+    roster = [(f"{400000 + i}", f"First{i}", f"Last{i}") for i in range(30)]
+    renamed = [(student_id, first + "x", last) for student_id, first, last in roster[:10]]
+    incoming = renamed + [(f"{500000 + i}", "New", f"Student{i}") for i in range(5)]
+
+    for update_existing in (False, True):
+        results = []
+        for import_func in (database.add_or_update_students_from_csv_data, database.bulk_import_students):
+            con, cur, temp_dir = make_test_db()
+            try:
+                database.bulk_import_students(cur, roster)
+                summary = import_func(cur, incoming, update_existing)
+                students = database.get_all_students(cur)
+                results.append((summary, students))
+            finally:
+                close_test_db(con, temp_dir)
+
+        (row_summary, row_students), (bulk_summary, bulk_students) = results
+        for key in ('added', 'updated', 'skipped', 'errors'):
+            assert row_summary[key] == bulk_summary[key], key
+        assert sorted(row_summary['updated_students']) == sorted(bulk_summary['updated_students'])
+        assert sorted(row_summary['skipped_students']) == sorted(bulk_summary['skipped_students'])
+        assert row_students == bulk_students
+        assert bulk_summary['added'] == 5
+
+def test_background_import_commits_in_chunks():
+    con, cur, temp_dir = make_test_db()
+    pool = database.ConnectionPool(os.path.join(temp_dir, "test_passes.db"))
+    try:
+        lines = ["student_id,first_name,last_name"]
+        lines += [f"{600000 + i},First{i},Last{i}" for i in range(250)]
+        lines += ["600999,,Missing"]
+        upload = io.BytesIO("\n".join(lines).encode('utf-8'))
+
+        job = import_jobs.start_import(pool, upload, "roster.csv", chunk_size=100)
+        deadline = time.time() + 10
+        while not job.finished and time.time() < deadline:
+            time.sleep(0.01)
+
+        status = job.to_dict()
+        assert status['status'] == 'completed', status['message']
+        assert status['rows_processed'] == 250
+        assert status['added'] == 250
+        assert status['error_count'] == 1
+        assert import_jobs.get_job(job.job_id) is job
+        assert pool.get_stats()['transactions'] == 3
+        assert len(database.get_all_students(cur)) == 250
+    finally:
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def test_keyset_pagination_walks_every_pass_once():
+    con, cur, temp_dir = make_test_db()
+    try:
+        seed_passes(cur, students=10, passes_per_student=7)
+        seen = []
+        after = None
+        while True:
+            page, after = database.search_passes(cur, limit=9, after=after)
+            seen.extend(p['pass_id'] for p in page)
+            if after is None:
+                break
+            after = database.decode_page_cursor(database.encode_page_cursor(after), 2)
+
+        expected = [row['pass_id'] for row in cur.execute(
+            "SELECT pass_id FROM passes ORDER BY pass_taken_at DESC, pass_id DESC")]
+        assert seen == expected
+
+        active, _ = database.search_passes(cur, limit=100, status='active')
+        assert len(active) == 5 and all(not p['returned'] for p in active)
+        one_student, _ = database.search_passes(cur, limit=100, student_id="100002")
+        assert {p['student_id'] for p in one_student} == {"100002"}
+
+        students, after = database.search_students(cur, limit=4, search="Last1")
+        assert [s['student_id'] for s in students] == ["100001"]
+        assert after is None
+        assert_uses_index(con, "idx_passes_taken_at", database.search_passes, 10, (database.now_epoch(), 0))
+    finally:
+        close_test_db(con, temp_dir)
+
+def rollup_snapshot(cur) -> dict:
+    return {
+        table: sorted(tuple(row) for row in cur.execute(f"SELECT * FROM {table}"))
+        for table in ('pass_stats_student_day', 'pass_stats_day', 'pass_stats_hour')
+    }
+
+def test_incremental_rollups_match_rebuild():
+    con, cur, temp_dir = make_test_db()
+    try:
+        seed_passes(cur, students=8, passes_per_student=5)
+        database.rebuild_pass_stats(cur)
+
+        for student_id in ("100000", "100001", "100002"):
+            assert database.return_active_pass_for_student(cur, student_id)
+        database.delete_student_by_id(cur, "100003")
+        incremental = rollup_snapshot(cur)
+
+        counted = database.rebuild_pass_stats(cur)
+        assert incremental == rollup_snapshot(cur)
+        assert counted == cur.execute("SELECT COUNT(*) FROM passes WHERE returned = 1").fetchone()[0]
+
+        today = datetime.now().date().isoformat()
+        summary = database.get_stats_summary(cur, today, "2000-01-01")
+        assert summary['today_passes'] == 3
+        assert summary['week_passes'] == counted
+        assert summary['busiest_hour'] is not None
+        student = database.get_student_stats(cur, "100000", "2000-01-01", today)
+        assert sum(day['passes'] for day in student['days']) == 6
+    finally:
+        close_test_db(con, temp_dir)
+
+def test_archive_term_moves_returned_passes():
+    con, cur, temp_dir = make_test_db()
+    db_path = os.path.join(temp_dir, "test_passes.db")
+    pool = database.ConnectionPool(db_path)
+    try:
+        seed_passes(cur, students=6, passes_per_student=10)
+        database.rebuild_pass_stats(cur)
+        database.save_data(con)
+        before = database.now_epoch() - 85 * 86400
+        old_ids = {row[0] for row in cur.execute(
+            "SELECT pass_id FROM passes WHERE returned = 1 AND pass_taken_at < ?", (before,))}
+
+        result = archive.archive_term(pool, "2025 Fall", before)
+        assert result['moved'] == len(old_ids) > 0
+        assert os.path.basename(result['archive_path']) == "passes_2025_Fall.db"
+        assert archive.archive_term(pool, "2025 Fall", before)['moved'] == 0
+
+        con.rollback()
+        assert cur.execute("SELECT COUNT(*) FROM passes WHERE pass_id IN (%s)" %
+                           ",".join(map(str, old_ids))).fetchone()[0] == 0
+        assert cur.execute("SELECT COUNT(*) FROM active_passes").fetchone()[0] == 5
+        live = rollup_snapshot(cur)
+        database.rebuild_pass_stats(cur)
+        assert live == rollup_snapshot(cur)
+        con.rollback()
+
+        with archive.history_connection(db_path) as history:
+            archived, _ = database.search_passes(history, limit=1000, taken_before=before,
+                                                 source=archive.PASS_SOURCE_HISTORY)
+            assert {p['pass_id'] for p in archived} == old_ids
+            completed, _ = database.search_passes(history, limit=1000, search="First1", status='completed',
+                                                   source=archive.PASS_SOURCE_HISTORY)
+            assert len([p for p in completed if p['student_id'] == "100001"]) == 10
+            archived_days = history.execute("SELECT SUM(passes) FROM archive0.pass_stats_day").fetchone()[0]
+            assert archived_days == len(old_ids)
+
+        # A new database frees the deleted pages without a full VACUUM
+        assert cur.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert cur.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+        # The admin page archives on a background job; archives are ordered
+        # by the term they hold, not by name
+        try:
+            archive.start_archive(pool, "???", before)
+            assert False, "an unusable term name should be refused"
+        except ValueError:
+            pass
+        job = archive.start_archive(pool, "2025 Autumn", before + 3 * 86400)
+        deadline = time.time() + 10
+        while not job.finished and time.time() < deadline:
+            time.sleep(0.01)
+        status = job.to_dict()
+        assert status['status'] == 'completed', status['message']
+        assert status['moved'] > 0 and archive.get_job(job.job_id) is job
+        assert archive.list_archives(db_path) == [result['archive_path'], job.result['archive_path']]
+    finally:
+        pool.close_all()
+        close_test_db(con, temp_dir)
+
+def main():
+    """Run every test in this file without pytest."""
+    print("DATABASE TEST SUITE")
+    print("=" * 50)
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_") and callable(value)]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {e}")
+    print("=" * 50)
+    print(f"{len(tests) - failures}/{len(tests)} tests passed")
+
+if __name__ == "__main__":
+    main()
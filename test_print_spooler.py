@@ -0,0 +1,263 @@
+# test_print_spooler.py
+"""
+Tests for slip printing without a printer: the spooler, printer
+connections and pool, slip templates and the stand-in backends.
+Run with pytest; test_printer.py is for the real hardware.
+"""
+import os
+import socket
+import time
+import pytest
+from escpos.printer import Dummy, File
+import database
+import print_spooler
+import printer_backends
+import printer_handler
+import slip_templates
+import write_queue
+
+@pytest.fixture
+def spool_db(tmp_path):
+    """A migrated database with its pool and writer, closed after the test."""
+    db_path = str(tmp_path / "test_passes.db")
+    con = database.create_connection(db_path)
+    database.init_database(database.create_cursor(con))
+    database.save_data(con)
+    pool = database.ConnectionPool(db_path)
+    writer = write_queue.WriteQueue(pool)
+    yield con, pool, writer
+    writer.close()
+    pool.close_all()
+    con.close()
+
+@pytest.fixture
+def printed_to(monkeypatch):
+    """Returns a function that points printer_handler's shared pool at one printer, for this test only."""
+    def use(opener):
+        connection = printer_handler.PrinterConnection(opener)
+        monkeypatch.setattr(printer_handler, 'printer', printer_handler.PrinterPool({'main': connection}))
+        return connection
+    return use
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_print_spooler_retries_persists_and_reprints(spool_db):
+    con, pool, writer = spool_db
+    printed = []
+    failures = {'left': 2}
+
+    def flaky_printer(pass_id):
+        if failures['left']:
+            failures['left'] -= 1
+            raise OSError("paper jam")
+        printed.append(pass_id)
+        return True
+
+    # A job queued before the spooler starts (e.g. before a restart) still prints
+    leftover = print_spooler.insert_print_job(database.create_cursor(con), 'pass_slip', {'pass_id': 1})
+    database.save_data(con)
+    spooler = print_spooler.PrintSpooler(pool, writer, {'pass_slip': flaky_printer},
+                                         retry_base=0, poll_seconds=0.02)
+    # A job's outcome is committed before the spooler counts it, so wait on
+    # the counts: once they match, the rows are final too
+    def counted(printed_jobs, failed_jobs=0):
+        return wait_for(lambda: (spooler.get_stats()['printed'], spooler.get_stats()['failed'])
+                        == (printed_jobs, failed_jobs))
+
+    try:
+        job_id = spooler.submit('pass_slip', {'pass_id': 2})
+        assert counted(2)
+        assert sorted(printed) == [1, 2]
+        jobs = [spooler.get_job(leftover), spooler.get_job(job_id)]
+        assert all(job['status'] == 'printed' for job in jobs)
+        assert sum(job['attempts'] for job in jobs) == 4
+
+        reprint_id = spooler.reprint(job_id)
+        assert reprint_id != job_id and spooler.reprint(999999) is None
+        assert counted(3)
+        assert printed.count(2) == 2
+
+        spooler.handlers['pass_slip'] = lambda pass_id: False
+        doomed = spooler.submit('pass_slip', {'pass_id': 3})
+        assert counted(3, 1)
+        job = spooler.get_job(doomed)
+        assert job['status'] == 'failed'
+        assert job['attempts'] == print_spooler.PRINT_MAX_ATTEMPTS and job['last_error']
+    finally:
+        spooler.close()
+
+def test_print_spooler_retries_during_a_steady_stream(spool_db):
+    con, pool, writer = spool_db
+    printed = []
+    failures = {'left': 1}
+
+    def jamming_printer(pass_id):
+        if pass_id == 0 and failures['left']:
+            failures['left'] -= 1
+            return False
+        printed.append(pass_id)
+        return True
+
+    spooler = print_spooler.PrintSpooler(pool, writer, {'pass_slip': jamming_printer},
+                                         retry_base=0, poll_seconds=0.1)
+    try:
+        spooler.submit('pass_slip', {'pass_id': 0})
+        # New slips arrive faster than the poll interval, so the queue never sits idle
+        pass_id = 0
+        deadline = time.monotonic() + 5
+        while 0 not in printed and time.monotonic() < deadline:
+            pass_id += 1
+            spooler.submit('pass_slip', {'pass_id': pass_id})
+            time.sleep(0.01)
+        assert 0 in printed and spooler.get_stats()['retried'] == 1
+    finally:
+        spooler.close()
+
+def test_printer_connection_reuses_handle_and_caches_absence(monkeypatch):
+    opened = []
+    plugged_in = {'value': False}
+
+    def fake_usb(vendor_id, product_id):
+        if not plugged_in['value']:
+            raise OSError("Device not found")
+        opened.append(Dummy())
+        return opened[-1]
+
+    monkeypatch.setattr(printer_handler, 'Usb', fake_usb)
+    connection = printer_handler.PrinterConnection(absent_seconds=0.2)
+    with connection.device() as dev:
+        assert dev is None
+    # Still within the cool-down: no new probe
+    with connection.device() as dev:
+        assert dev is None
+    stats = connection.get_stats()
+    assert stats['failed_connects'] == 1 and stats['skipped'] == 1
+
+    plugged_in['value'] = True
+    connection.reset()
+    for _ in range(3):
+        with connection.device() as dev:
+            dev.text("slip\n")
+    assert len(opened) == 1 and b"slip\n" * 3 in opened[0].output
+
+    with pytest.raises(OSError):
+        with connection.device() as dev:
+            raise OSError("write failed")
+    with connection.device() as dev:
+        assert dev is not None
+    assert len(opened) == 2 and connection.get_stats()['dropped'] == 1
+
+    connection.close()
+    assert not connection.get_stats()['connected']
+
+def test_barcode_modes_write_no_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    native = slip_templates.barcode_bytes(1234, "native")
+    image = slip_templates.barcode_bytes(1234, "image")
+    # GS k: the printer draws CODE128 from the digits themselves
+    assert b"\x1dkI\x06{B1234" in native
+    assert len(native) < 64 < len(image)
+    assert os.listdir(tmp_path) == []
+
+def test_slip_templates_render_one_buffer(printed_to):
+    writes = []
+
+    class CountingDummy(Dummy):
+        def _raw(self, msg):
+            writes.append(len(msg))
+            super()._raw(msg)
+
+    printed_to(CountingDummy)
+    assert printer_handler.print_pass_slip("Zoë Smith", "227199", 42, 10, taken_at=1792193065)
+    assert len(writes) == 1
+    assert printer_handler.print_student_report("Zoë Smith", "227199", 2, 900, 1, [
+        {'pass_taken_at': 1792193065, 'duration_minutes': 10, 'returned': 1},
+        {'pass_taken_at': 1792193065, 'duration_minutes': 5, 'returned': 0},
+    ], printed_at=1792193065)
+    assert len(writes) == 2
+
+    slip = slip_templates.PASS_SLIP.render({
+        'student_name': "Zoë Smith", 'student_id': "227199", 'pass_id': 42,
+        'taken_at': 1792193065, 'duration_minutes': 10,
+    }, "native")
+    assert slip.startswith(slip_templates.INIT) and slip.endswith(slip_templates.CUT)
+    assert "Student: Zoë Smith\n".encode(slip_templates.ENCODING) in slip
+    assert b"\x1dkI\x04{B42" in slip
+    report = slip_templates.STUDENT_REPORT.render({
+        'student_name': "A", 'student_id': "1", 'printed_at': 1792193065, 'total_passes': 1,
+        'total_time_out': 600, 'overtime_passes': 0,
+        'passes': [{'number': 1, 'pass_taken_at': 1792193065, 'duration_minutes': 10, 'returned': 1}],
+    })
+    assert b"Time out: 10 min\n" in report and b"  10  Yes\n" in report
+
+def test_printer_backends_capture_and_fail(printed_to):
+    capture = printer_backends.CapturePrinter()
+    flaky = printer_backends.SimulatedPrinter(write_seconds=0, bytes_per_second=0, failure_rate=1.0)
+    devices = iter([capture, flaky])
+    connection = printed_to(lambda: next(devices))
+
+    assert printer_handler.print_pass_slip("Ada Lovelace", "300000", 7, 10, barcode_mode="native")
+    assert capture.get_stats()['writes'] == 1 and b"Ada Lovelace" in capture.output
+    # A failed write drops the handle; the next slip opens the next device
+    connection.health_check_seconds = 0
+    capture.healthy = lambda: False
+    assert not printer_handler.print_pass_slip("Ada Lovelace", "300000", 8, 10)
+    assert flaky.get_stats()['writes'] == 0
+    stats = connection.get_stats()
+    assert stats['dropped'] == 2 and stats['error_rate'] == 0.5
+
+    with pytest.raises(ValueError):
+        printer_backends.open_backend("fax")
+
+def test_printer_health_check_per_backend(tmp_path):
+    # A file has nothing to check: an idle handle is reused, not reopened
+    connection = printer_handler.PrinterConnection(
+        lambda: File(str(tmp_path / "slips.bin")), health_check_seconds=0)
+    for _ in range(2):
+        with connection.device() as dev:
+            printer_handler.write_raw(dev, b"slip")
+    assert connection.get_stats()['connects'] == 1
+    assert (tmp_path / "slips.bin").read_bytes() == b"slipslip"
+    assert printer_handler.printer_healthy(Dummy())
+
+    # A network printer is healthy until it hangs up; status bytes don't count
+    class SocketPrinter:
+        pass
+    dev = SocketPrinter()
+    dev.device, printer_end = socket.socketpair()
+    try:
+        assert printer_handler.printer_healthy(dev)
+        printer_end.sendall(b"\x12")
+        assert printer_handler.printer_healthy(dev) and dev.device.recv(1) == b"\x12"
+        printer_end.close()
+        assert not printer_handler.printer_healthy(dev)
+    finally:
+        dev.device.close()
+    assert not printer_handler.printer_healthy(dev)
+
+def test_printer_pool_routes_by_kiosk_and_fails_over():
+    printers = {name: printer_backends.CapturePrinter() for name in ("library", "office")}
+    jammed = printer_backends.SimulatedPrinter(write_seconds=0, bytes_per_second=0, failure_rate=1.0)
+    printers['gym'] = jammed
+    pool = printer_handler.PrinterPool(
+        {name: printer_handler.PrinterConnection(lambda dev=dev: dev, name=name) for name, dev in printers.items()},
+        kiosk_printers={'library': ['library'], 'gym': ['gym', 'office']}
+    )
+    assert pool.send(b"slip", kiosk='library') == 'library'
+    # A jammed printer fails over to the kiosk's next printer
+    assert pool.send(b"slip", kiosk='gym') == 'office'
+    assert jammed.get_stats()['writes'] == 0 and pool.get_stats()['gym']['errors'] == 1
+
+    # Kiosks without a preference go to the least busy printer
+    busy = pool.connections['library']
+    with busy.device():
+        assert busy.queue_depth == 1
+        assert pool.candidates()[0] is not busy
+        assert pool.send(b"slip") == 'office'
+    assert pool.get_stats()['office']['printed'] == 2
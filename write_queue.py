@@ -0,0 +1,159 @@
+# write_queue.py
+"""
+Write-behind queue for the kiosk's pass writes.
+One writer thread owns a write connection. Request handlers submit
+operations (functions taking a cursor) and wait on a future; the writer
+collects whatever arrives within a short window and runs it as one
+transaction, so a burst of scans costs one commit instead of one per scan.
+Each operation runs in its own savepoint, so a failing scan is rolled back
+and reported without affecting the others in its batch. Futures are only
+resolved after the batch has committed; an operation's after_commit
+callback runs just before, on the writer thread, so callbacks run in the
+order the writes were committed.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+import database
+
+# --- Write Queue Configuration ---
+# How long after the first operation was queued the writer waits for more
+# to join its batch. Scans that arrive during a commit always share the
+# next one; 0 commits as soon as the queue is drained.
+GROUP_COMMIT_WINDOW_MS = 1
+MAX_BATCH_SIZE = 64            # operations committed together at most
+WRITE_TIMEOUT_SECONDS = 10.0   # how long a request waits for its operation
+# Durability of each group commit: "NORMAL" (WAL default, a power cut may
+# lose the last commits) or "FULL" (fsync on every group commit)
+WRITER_SYNCHRONOUS = database.SYNCHRONOUS_MODE
+# ---------------------------------
+
+class WriteQueue:
+    """Runs submitted write operations on a single writer thread with group commit."""
+
+    def __init__(self, pool: database.ConnectionPool, window_ms: float = GROUP_COMMIT_WINDOW_MS,
+                 max_batch: int = MAX_BATCH_SIZE, synchronous: str = WRITER_SYNCHRONOUS):
+        self.pool = pool
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {
+            'operations': 0,
+            'failed_operations': 0,
+            'batches': 0,
+            'max_batch_size': 0,
+            'commit_total_ms': 0.0,
+        }
+        # Opened here so a connection error reaches the caller, not the thread
+        self._con = pool.acquire()
+        self._con.execute(f"PRAGMA synchronous = {synchronous}")
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args, after_commit=None, **kwargs) -> Future:
+        """
+        Queue operation(cursor, *args, **kwargs); the future resolves to its return value once committed.
+        after_commit, if given, is called with that value on the writer thread once it has committed.
+        """
+        future = Future()
+        self._queue.put((future, operation, args, kwargs, time.monotonic(), after_commit))
+        return future
+
+    def run(self, operation, *args, timeout: float = WRITE_TIMEOUT_SECONDS, after_commit=None, **kwargs):
+        """Submit an operation and wait for its committed result (re-raises its exception)."""
+        return self.submit(operation, *args, after_commit=after_commit, **kwargs).result(timeout)
+
+    def _collect(self, first) -> list:
+        # The window runs from when the first operation was queued, so work
+        # that piled up during the previous commit is committed right away
+        batch = [first]
+        deadline = first[4] + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown: finish this batch first, then let _run see the sentinel
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    break
+                self._commit_batch(self._con, self._collect(first))
+        finally:
+            self._con.execute(f"PRAGMA synchronous = {database.SYNCHRONOUS_MODE}")
+            self.pool.release(self._con)
+
+    def _commit_batch(self, con: sqlite3.Connection, batch: list) -> None:
+        batch = [item[:4] + item[5:] for item in batch if item[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        started = time.perf_counter()
+        try:
+            with self.pool.transaction(con) as cur:
+                for future, operation, args, kwargs, after_commit in batch:
+                    cur.execute("SAVEPOINT scan")
+                    try:
+                        outcomes.append((future, operation(cur, *args, **kwargs), None, after_commit))
+                        cur.execute("RELEASE scan")
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO scan")
+                        cur.execute("RELEASE scan")
+                        # The operation may have counted a pass it never inserted
+                        self.pool.active_passes.invalidate()
+                        outcomes.append((future, None, e, None))
+        except Exception as e:
+            # The commit itself failed, so nothing in the batch was written
+            for future, _, _, _, _ in batch:
+                future.set_exception(e)
+            self._record_batch(len(batch), len(batch), time.perf_counter() - started)
+            return
+
+        for future, result, error, after_commit in outcomes:
+            if error is None and after_commit is not None:
+                try:
+                    after_commit(result)
+                except Exception as e:
+                    print(f"[WARN] A write committed, but its after-commit callback failed: {e}")
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        failed = sum(1 for _, _, error, _ in outcomes if error is not None)
+        self._record_batch(len(batch), failed, time.perf_counter() - started)
+
+    def _record_batch(self, size: int, failed: int, seconds: float) -> None:
+        with self._lock:
+            self._stats['operations'] += size
+            self._stats['failed_operations'] += failed
+            self._stats['batches'] += 1
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], size)
+            self._stats['commit_total_ms'] += seconds * 1000
+
+    def get_stats(self) -> dict:
+        """Batch counters: how many operations each commit carried on average."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        batches = stats['batches']
+        stats['avg_batch_size'] = stats['operations'] / batches if batches else 0.0
+        stats['commit_avg_ms'] = stats['commit_total_ms'] / batches if batches else 0.0
+        return stats
+
+    def close(self, timeout: float = WRITE_TIMEOUT_SECONDS) -> None:
+        """Finish the queued operations and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)